@@ -1,24 +1,28 @@
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response
 from flask_cors import CORS
 from datetime import datetime, timedelta
+import csv
+import io
 import pickle
 import json
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import threading
 import time
-import cv2
-import numpy as np
-import cvzone
 import hashlib
+import os
 
+from detection_engine import get_engine, STREAM_TIERS, DEFAULT_TIER
+from spot_cache import get_spot_view
+from mailer import send_email, start_mailer, mailer_stats
+from booking_scheduler import start_booking_scheduler, get_booking_scheduler
+from waitlist import start_waitlist_matcher, get_waitlist_matcher
+from availability import start_calendar, get_calendar
 from database import (
     init_db, initialize_spots, get_all_spots, get_spot_by_label,
-    create_booking, get_active_bookings, cancel_booking, update_spot_status,
-    add_to_waitlist, add_feedback, get_all_feedback, get_parking_logs,
+    create_booking, get_active_bookings, get_user_bookings, cancel_booking, update_spot_status, SpotUnavailableError,
+    GRACE_PERIOD, parse_timestamp,
+    add_to_waitlist, add_feedback, get_feedback, get_parking_logs, format_cursor, parse_cursor,
     record_occupancy_stats, get_occupancy_trends, get_available_spots_count,
-    get_db, create_user, get_user_by_email, get_user_by_id
+    db_connection, pool_stats, start_storage_maintenance, create_user, get_user_by_email, get_user_by_id
 )
 
 app = Flask(__name__)
@@ -29,6 +33,15 @@ CORS(app)
 ADMIN_USERNAME = 'admin@parkease.com'
 ADMIN_PASSWORD = 'admin123'
 
+DASHBOARD_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+EXPORT_PAGE_SIZE = 1000
+
+# Every live stream (SSE or MJPEG) holds a worker thread while connected; keep
+# this below the gunicorn thread count (64, see Procfile) so bookings still get one
+MAX_STREAM_CLIENTS = int(os.environ.get('MAX_STREAM_CLIENTS', 48))
+stream_slots = threading.BoundedSemaphore(MAX_STREAM_CLIENTS)
+
 # Simple password hashing (for demo - use bcrypt in production)
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -36,33 +49,6 @@ def hash_password(password):
 def verify_password(password, password_hash):
     return hash_password(password) == password_hash
 
-# Email configuration (using Gmail SMTP)
-EMAIL_HOST = 'smtp.gmail.com'
-EMAIL_PORT = 587
-EMAIL_USER = 'your_email@gmail.com'  # Replace with your email
-EMAIL_PASSWORD = 'your_app_password'  # Replace with app password
-
-def send_email(to_email, subject, body):
-    """Send email notification"""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_USER
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(body, 'html'))
-        
-        server = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(EMAIL_USER, to_email, text)
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Email error: {e}")
-        return False
-
 @app.route('/')
 def index():
     """Homepage - location selection"""
@@ -72,19 +58,22 @@ def index():
 def health_check():
     """Health check endpoint for debugging"""
     try:
-        from database import get_db
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM spots")
-        spot_count = cursor.fetchone()[0]
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM users")
+            user_count = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM spots")
+            spot_count = cursor.fetchone()[0]
         return jsonify({
             'status': 'healthy',
             'database': 'connected',
             'users': user_count,
-            'spots': spot_count
+            'spots': spot_count,
+            'db_pool': pool_stats(),
+            'mail': mailer_stats(),
+            'booking_scheduler': get_booking_scheduler().stats() if get_booking_scheduler() else None,
+            'waitlist': get_waitlist_matcher().stats() if get_waitlist_matcher() else None,
+            'calendar': get_calendar().stats() if get_calendar() else None
         }), 200
     except Exception as e:
         return jsonify({
@@ -215,21 +204,94 @@ def parking(location):
 
 @app.route('/api/spots')
 def api_spots():
-    """API endpoint to get all spots status"""
-    spots = get_all_spots()
-    available_count = sum(1 for spot in spots if spot['status'] == 'available')
-    occupied_count = sum(1 for spot in spots if spot['status'] == 'occupied')
-    reserved_count = sum(1 for spot in spots if spot['status'] == 'reserved')
+    """API endpoint to get all spots status (?since=<cursor> for only the spots changed since)"""
+    view = get_spot_view()
+    since = request.args.get('since')
+    payload = view.snapshot(since)
     
-    return jsonify({
-        'spots': spots,
-        'stats': {
-            'total': len(spots),
-            'available': available_count,
-            'occupied': occupied_count,
-            'reserved': reserved_count
-        }
-    })
+    # Served from memory; unchanged versions revalidate with 304
+    etag = f"{view.token}-{payload['version']}"
+    if 'since' in payload:
+        etag += f"-since-{since}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/spots/layout')
+def api_spots_layout():
+    """Spot geometry in label order; ?v=<layout_version> URLs are cached for a year"""
+    layout = get_spot_view().layout()
+    etag = layout['layout_version']
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(layout)
+    response.set_etag(etag)
+    if request.args.get('v') == layout['layout_version']:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/spots/status')
+def api_spots_status():
+    """Compact spot status: 2-bit codes in layout order, base64 (0 available, 1 occupied, 2 reserved)"""
+    view = get_spot_view()
+    payload = view.status()
+    etag = f"{view.token}-{payload['version']}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def spot_events():
+    """Server-Sent Events: one snapshot of every spot, then batches of status changes"""
+    view = get_spot_view()
+    subscription = view.subscribe()
+    try:
+        # Clients reconnect after 3 s if the connection drops
+        yield 'retry: 3000\n\n'
+        changes = None
+        while not subscription.closed:
+            if changes is None:
+                yield f"event: snapshot\ndata: {json.dumps(view.snapshot(), default=str)}\n\n"
+            elif changes:
+                yield f"event: spots\ndata: {json.dumps(changes)}\n\n"
+            else:
+                # Keep proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+            changes = subscription.get()
+    finally:
+        subscription.close()
+
+def stream_response(events, mimetype):
+    """Long-lived response holding one of the stream slots until the client disconnects"""
+    if not stream_slots.acquire(blocking=False):
+        events.close()
+        response = jsonify({'success': False, 'message': 'Too many live connections, try again later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    response = Response(events, mimetype=mimetype)
+    response.call_on_close(stream_slots.release)
+    return response
+
+@app.route('/api/spots/stream')
+def api_spots_stream():
+    """Live spot status changes for the parking page and dashboards (503 when all stream slots are taken)"""
+    response = stream_response(spot_events(), 'text/event-stream')
+    if response.status_code != 200:
+        return response
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/book', methods=['POST'])
 def api_book():
@@ -244,19 +306,25 @@ def api_book():
     arrival_time = data.get('arrival_time')
     duration = int(data.get('duration'))
     
-    # Validate spot is available
-    spot = get_spot_by_label(spot_label)
-    if not spot:
-        return jsonify({'success': False, 'message': 'Spot not found'}), 404
-    
-    if spot['status'] != 'available':
-        return jsonify({'success': False, 'message': 'Spot is not available'}), 400
+    # Bookings can be made for any future window; one that already started only within the grace period.
+    # The page sends the arrival in UTC (toISOString()); parse_timestamp() converts it to server time
+    arrival = parse_timestamp(arrival_time)
+    if arrival is None:
+        return jsonify({'success': False, 'message': 'Invalid arrival time'}), 400
+    if arrival < datetime.now() - GRACE_PERIOD:
+        return jsonify({'success': False, 'message': 'Arrival time is in the past'}), 400
+    if duration < 1:
+        return jsonify({'success': False, 'message': 'Duration must be at least one hour'}), 400
     
     try:
+        # Fails if another booking holds the spot during the window, so concurrent requests cannot both win
         booking_id = create_booking(
             spot_label, user_name, user_phone, user_email,
-            car_type, arrival_time, duration
+            car_type, arrival, duration
         )
+        scheduler = get_booking_scheduler()
+        if scheduler is not None:
+            scheduler.schedule(booking_id, arrival, duration)
         
         # Send confirmation email
         if user_email:
@@ -266,7 +334,7 @@ def api_book():
             <p>Your parking spot has been successfully reserved!</p>
             <ul>
                 <li><strong>Spot:</strong> {spot_label}</li>
-                <li><strong>Arrival Time:</strong> {arrival_time}</li>
+                <li><strong>Arrival Time:</strong> {arrival.astimezone():%Y-%m-%d %H:%M %Z}</li>
                 <li><strong>Duration:</strong> {duration} hours</li>
                 <li><strong>Car Type:</strong> {car_type}</li>
             </ul>
@@ -274,6 +342,7 @@ def api_book():
             <p style="margin-top: 20px; font-style: italic;">Park at your own <s>risk</s> choice!</p>
             <p>- PARKEASE Team</p>
             """
+            # Queued; the mailer thread delivers it after the response is sent
             send_email(user_email, 'Parking Reservation Confirmed', email_body)
         
         return jsonify({
@@ -281,14 +350,67 @@ def api_book():
             'message': 'Booking successful!',
             'booking_id': booking_id
         })
+    except SpotUnavailableError:
+        if not get_spot_by_label(spot_label):
+            return jsonify({'success': False, 'message': 'Spot not found'}), 404
+        return jsonify({'success': False, 'message': 'Spot is not available for that time'}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _availability_window():
+    """(start, hours) from the query string; start defaults to now
+
+    start should carry a UTC offset (the page sends toISOString()); the
+    response echoes times with the server's offset so browsers can convert.
+    """
+    start = parse_timestamp(request.args.get('start')) if request.args.get('start') else datetime.now()
+    hours = request.args.get('hours', 1, type=int)
+    if start is None or hours is None or not 1 <= hours <= 24:
+        return None
+    return start, hours
+
+@app.route('/api/availability')
+def api_availability():
+    """Spots free for the whole window start .. start + hours"""
+    window = _availability_window()
+    if window is None:
+        return jsonify({'success': False, 'message': 'Invalid start or hours'}), 400
+    start, hours = window
+    end = start + timedelta(hours=hours)
+    free = get_calendar().free_spots(start, end)
+    return jsonify({
+        'start': start.astimezone().isoformat(timespec='minutes'),
+        'end': end.astimezone().isoformat(timespec='minutes'),
+        'available': free,
+        'count': len(free),
+    })
+
+@app.route('/api/availability/earliest')
+def api_availability_earliest():
+    """Earliest window of hours free on some spot, starting at start or later"""
+    window = _availability_window()
+    if window is None:
+        return jsonify({'success': False, 'message': 'Invalid start or hours'}), 400
+    start, hours = window
+    slot = get_calendar().earliest_slot(hours, start)
+    if slot is None:
+        return jsonify({'success': False, 'message': 'No spots found'}), 404
+    slot_start, spots = slot
+    return jsonify({
+        'start': slot_start.astimezone().isoformat(timespec='minutes'),
+        'end': (slot_start + timedelta(hours=hours)).astimezone().isoformat(timespec='minutes'),
+        'available': spots,
+    })
+
 @app.route('/api/cancel/<int:booking_id>', methods=['POST'])
 def api_cancel_booking(booking_id):
     """API endpoint to cancel a booking"""
     try:
-        cancel_booking(booking_id)
+        if not cancel_booking(booking_id):
+            return jsonify({'success': False, 'message': 'Booking not found or no longer active'}), 400
+        scheduler = get_booking_scheduler()
+        if scheduler is not None:
+            scheduler.forget(booking_id)
         return jsonify({'success': True, 'message': 'Booking cancelled successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -298,12 +420,20 @@ def api_waitlist():
     """API endpoint to join waitlist"""
     data = request.json
     try:
-        add_to_waitlist(
+        requested_time = datetime.now()
+        waitlist_id = add_to_waitlist(
             data.get('user_name'),
             data.get('user_phone'),
             data.get('user_email', ''),
-            data.get('car_type')
+            data.get('car_type'),
+            requested_time
         )
+        matcher = get_waitlist_matcher()
+        if matcher is not None:
+            matcher.add(waitlist_id, data.get('car_type'), requested_time)
+            # A spot may have freed up while the user was filling in the form
+            if get_spot_view().snapshot()['stats']['available']:
+                matcher.match_available()
         return jsonify({'success': True, 'message': 'Added to waitlist'})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -349,16 +479,124 @@ def admin_dashboard():
     if not session.get('admin'):
         return redirect(url_for('admin_login'))
     
-    spots = get_all_spots()
-    bookings = get_active_bookings()
-    logs = get_parking_logs(50)
-    feedback = get_all_feedback()
-    
+    # Bookings, logs and feedback are paged in by admin.js from the endpoints below
+    # Counts come from the in-memory spot view, so loading the page costs no query
+    stats = get_spot_view().snapshot()['stats']
     return render_template('admin_dashboard.html',
-                         spots=spots,
-                         bookings=bookings,
-                         logs=logs,
-                         feedback=feedback)
+                         stats=stats,
+                         bookings_total=stats['total'] - stats['available'],
+                         page_size=DASHBOARD_PAGE_SIZE)
+
+def _page_limit():
+    """Rows per page from ?limit=, within 1..MAX_PAGE_SIZE"""
+    return min(max(request.args.get('limit', DASHBOARD_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
+def _page_before():
+    """(timestamp, id) position from ?cursor=, None for the first page; raises ValueError"""
+    cursor = request.args.get('cursor')
+    return parse_cursor(cursor) if cursor else None
+
+def _newest_first_page(key, fetch):
+    """JSON page of rows from fetch(limit, before) with the cursor of the next page"""
+    try:
+        rows, next_before = fetch(_page_limit(), _page_before())
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+    for row in rows:
+        row['timestamp'] = str(row['timestamp'])
+    return jsonify({
+        'success': True,
+        key: rows,
+        'next_cursor': format_cursor(*next_before) if next_before else None,
+    })
+
+@app.route('/admin/api/logs')
+def admin_api_logs():
+    """Parking logs, newest first, one page per request"""
+    if not session.get('admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return _newest_first_page('logs', get_parking_logs)
+
+@app.route('/admin/api/feedback')
+def admin_api_feedback():
+    """User feedback, newest first, one page per request"""
+    if not session.get('admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return _newest_first_page('feedback', get_feedback)
+
+def _booking_rows(bookings):
+    for booking in bookings:
+        if booking['arrival_time'] is not None:
+            booking['arrival_time'] = booking['arrival_time'].isoformat(sep=' ', timespec='minutes')
+    return bookings
+
+@app.route('/admin/api/bookings')
+def admin_api_bookings():
+    """Taken spots with their current booking in lot order, one page per request"""
+    if not session.get('admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    bookings, next_after = get_active_bookings(
+        _page_limit(), request.args.get('after', type=int),
+        spot_status=request.args.get('status') or None,
+        search=request.args.get('q', '').strip() or None)
+    return jsonify({
+        'success': True,
+        'bookings': _booking_rows(bookings),
+        'next_after': next_after,
+    })
+
+def csv_rows(header, pages):
+    """CSV text, one chunk per page, from an iterator of row lists"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for rows in pages:
+        for row in rows:
+            writer.writerow([row[column] for column in header])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def csv_response(filename, rows):
+    response = Response(rows, mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@app.route('/admin/export/logs.csv')
+def admin_export_logs():
+    """Every parking log as CSV, streamed a page at a time"""
+    if not session.get('admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    def pages():
+        before = None
+        while True:
+            logs, before = get_parking_logs(EXPORT_PAGE_SIZE, before)
+            yield logs
+            if before is None:
+                return
+    
+    return csv_response('parking_logs.csv',
+                        csv_rows(['timestamp', 'spot_label', 'action', 'user_name', 'details'], pages()))
+
+@app.route('/admin/export/bookings.csv')
+def admin_export_bookings():
+    """Every taken spot and its current booking as CSV, streamed a page at a time"""
+    if not session.get('admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    def pages():
+        after = None
+        while True:
+            bookings, after = get_active_bookings(EXPORT_PAGE_SIZE, after)
+            yield _booking_rows(bookings)
+            if after is None:
+                return
+    
+    return csv_response('active_bookings.csv',
+                        csv_rows(['spot_label', 'spot_status', 'booking_id', 'user_name', 'user_phone',
+                                  'car_type', 'arrival_time', 'duration', 'status'], pages()))
 
 @app.route('/admin/api/analytics')
 def admin_analytics():
@@ -381,93 +619,68 @@ def admin_video_feed():
     
     return render_template('admin_video.html')
 
-def generate_frames():
-    """Generate video frames with detection overlay"""
+def generate_frames(tier=DEFAULT_TIER):
+    """Generate video frames with detection overlay from the shared engine"""
+    engine = get_engine('carPark.mp4')
+    subscription = engine.subscribe(tier)
     try:
-        cap = cv2.VideoCapture('carPark.mp4')
-        width, height = 103, 43
-        
-        # Load parking positions
-        with open('CarParkPos', 'rb') as f:
-            posList = pickle.load(f)
-        
-        # Create spot mapping
-        spots = get_all_spots()
-        spots.sort(key=lambda s: s['spot_label'])
-        spot_mapping = {}
-        for i, spot in enumerate(spots):
-            if i < len(posList):
-                spot_mapping[i] = spot['spot_label']
-        
-        while True:
-            success, img = cap.read()
-            if not success:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Loop video
+        while not subscription.closed:
+            # Slow viewers skip straight to the newest frame instead of queueing old ones
+            frame = subscription.get()
+            if frame is None:
                 continue
-            
-            # Process frame
-            imgGray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            imgBlur = cv2.GaussianBlur(imgGray, (3, 3), 1)
-            imgThres = cv2.adaptiveThreshold(imgBlur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                            cv2.THRESH_BINARY_INV, 25, 16)
-            imgThres = cv2.medianBlur(imgThres, 5)
-            kernel = np.ones((3, 3), np.uint8)
-            imgThres = cv2.dilate(imgThres, kernel, iterations=1)
-            
-            # Check spaces and draw rectangles
-            spaces = 0
-            for i, pos in enumerate(posList):
-                x, y = pos
-                w, h = width, height
-                imgCrop = imgThres[y:y + h, x:x + w]
-                count = cv2.countNonZero(imgCrop)
-                
-                spot_label = spot_mapping.get(i, f"SPOT{i}")
-                spot = get_spot_by_label(spot_label)
-                
-                if spot:
-                    if spot['status'] == 'reserved':
-                        color = (0, 165, 255)  # Orange
-                        thic = 5
-                    elif count < 900:
-                        color = (0, 200, 0)  # Green
-                        thic = 5
-                        spaces += 1
-                    else:
-                        color = (0, 0, 200)  # Red
-                        thic = 2
-                    
-                    cv2.rectangle(img, (x, y), (x + w, y + h), color, thic)
-                    cv2.putText(img, spot_label, (x + 5, y + 25), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-            
-            # Add counter
-            cvzone.putTextRect(img, f'Free: {spaces}/{len(posList)}', (50, 60), 
-                             thickness=3, offset=20, colorR=(0, 200, 0))
-            
-            # Encode frame
-            ret, buffer = cv2.imencode('.jpg', img)
-            frame = buffer.tobytes()
-            
+
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            
-            time.sleep(0.03)  # ~30 FPS
-    
-    except Exception as e:
-        print(f"Error in video stream: {e}")
     finally:
-        if 'cap' in locals():
-            cap.release()
+        subscription.close()
 
 @app.route('/video_stream')
 def video_stream():
-    """Video streaming route"""
+    """Video streaming route (?quality=high|medium|low)"""
     if not session.get('admin'):
         return redirect(url_for('admin_login'))
     
-    return Response(generate_frames(),
-                   mimetype='multipart/x-mixed-replace; boundary=frame')
+    tier = request.args.get('quality', DEFAULT_TIER)
+    if tier not in STREAM_TIERS:
+        return jsonify({'success': False, 'message': f"Unknown quality '{tier}'"}), 400
+    
+    return stream_response(generate_frames(tier), 'multipart/x-mixed-replace; boundary=frame')
+
+def snapshot_response(label=None):
+    """JPEG still from the shared engine with ETag revalidation"""
+    engine = get_engine('carPark.mp4')
+    seq, jpeg = engine.snapshot(label)
+    if jpeg is None:
+        if label is not None and engine.spot_regions and label not in engine.spot_regions:
+            return jsonify({'success': False, 'message': 'Spot not found'}), 404
+        return jsonify({'success': False, 'message': 'No frame available yet'}), 503
+    
+    # The ETag changes with every new frame, so polling clients get 304 until then
+    etag = f"{engine.token}-{seq}" if label is None else f"{engine.token}-{seq}-{label}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(jpeg, mimetype='image/jpeg')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/frame.jpg')
+def api_frame():
+    """Latest annotated camera frame"""
+    if not session.get('admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return snapshot_response()
+
+@app.route('/api/spots/<label>/crop.jpg')
+def api_spot_crop(label):
+    """One spot's region of the latest annotated camera frame"""
+    if not session.get('admin'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return snapshot_response(label)
 
 @app.route('/my-bookings')
 def my_bookings():
@@ -482,52 +695,53 @@ def api_my_bookings():
         return jsonify({'success': False, 'message': 'Phone number required'}), 400
     
     try:
-        bookings_list = []
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, spot_label, user_name, user_phone, user_email,
-                   car_type, arrival_time, duration, booking_time, status
-            FROM bookings
-            WHERE user_phone = ?
-            ORDER BY booking_time DESC
-        ''', (phone,))
-        
-        rows = cursor.fetchall()
-        for row in rows:
-            bookings_list.append({
-                'id': row[0],
-                'spot_label': row[1],
-                'user_name': row[2],
-                'user_phone': row[3],
-                'car_type': row[5],
-                'arrival_time': row[6],
-                'duration': row[7],
-                'booking_time': row[8],
-                'status': row[9] if row[9] else 'active'
-            })
-        
-        conn.close()
-        return jsonify({'success': True, 'bookings': bookings_list})
+        return jsonify({'success': True, 'bookings': get_user_bookings(phone)})
     except Exception as e:
         print(f"Error in my-bookings API: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
 def background_tasks():
-    """Background tasks for auto-release and stats recording"""
+    """Background tasks for stats recording"""
     while True:
         try:
             # Record occupancy stats every 5 minutes
             record_occupancy_stats()
             
-            # Check for expired grace periods
-            # TODO: Implement grace period check and auto-release
+            # Grace periods and booking ends are released by the booking scheduler as they
+            # come due; resync it with bookings made by other processes
+            scheduler = get_booking_scheduler()
+            if scheduler is not None:
+                scheduler.rebuild()
+            calendar = get_calendar()
+            if calendar is not None:
+                calendar.load()
             
             time.sleep(300)  # 5 minutes
         except Exception as e:
             print(f"Background task error: {e}")
             time.sleep(60)
 
+def on_waitlist_assigned(booking):
+    """Schedule a booking made from the waitlist and tell the user"""
+    scheduler = get_booking_scheduler()
+    if scheduler is not None:
+        scheduler.schedule(booking['id'], booking['arrival_time'], booking['duration'])
+    
+    if booking['user_email']:
+        email_body = f"""
+        <h2>A Spot Is Waiting For You - PARKEASE</h2>
+        <p>Dear {booking['user_name']},</p>
+        <p>A parking spot has opened up and we have reserved it for you.</p>
+        <ul>
+            <li><strong>Spot:</strong> {booking['spot_label']}</li>
+            <li><strong>Duration:</strong> {booking['duration']} hours</li>
+            <li><strong>Car Type:</strong> {booking['car_type']}</li>
+        </ul>
+        <p><strong>Important:</strong> Please arrive within 10 minutes or the spot will be released.</p>
+        <p>- PARKEASE Team</p>
+        """
+        send_email(booking['user_email'], 'Your Waitlist Spot Is Reserved', email_body)
+
 # Initialize database on startup
 def initialize_app():
     """Initialize the application"""
@@ -559,6 +773,11 @@ def initialize_app():
         # Start background tasks
         bg_thread = threading.Thread(target=background_tasks, daemon=True)
         bg_thread.start()
+        start_storage_maintenance()
+        start_mailer()
+        start_booking_scheduler()
+        start_calendar()
+        start_waitlist_matcher(on_waitlist_assigned)
         
         print("✓ Application initialized successfully")
     except Exception as e:
@@ -0,0 +1,222 @@
+"""
+PARKEASE reservation calendar
+Every booking holds its spot for [arrival_time, end_time). The calendar keeps
+those intervals in memory, sorted by start, both per spot (bookings of one
+spot never overlap, so their ends are sorted too) and across the whole lot,
+which answers "which spots are free from T1 to T2" and "earliest free slot
+for N hours" with a few bisects instead of a query.
+
+Bookings made in this process arrive through the booking listeners; the
+calendar is reloaded periodically for bookings made elsewhere. It is only an
+index for the parking page: create_booking() still checks for overlaps in
+the database.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from itertools import compress, repeat
+from operator import gt
+
+from database import (
+    RESERVE_AHEAD, HOLDING_STATUSES, add_booking_listener, remove_booking_listener,
+    get_booking_intervals
+)
+from spot_cache import get_spot_view
+
+
+class SpotCalendar:
+    """Booked intervals per spot and for the whole lot, kept sorted by start"""
+
+    def __init__(self, view=None):
+        self.view = view
+        self._lock = threading.Lock()
+        self._labels = []       # every spot in lot order
+        self._known = set()
+        self._bookings = {}     # booking_id -> (spot_label, start, end)
+        self._spots = {}        # spot_label -> ([starts], [ends], [booking_ids])
+        self._all = ([], [], [], [])    # [starts], [ends], [booking_ids], [spot_labels] for every booking
+        self._longest = timedelta(0)
+        self.loaded_at = None
+        add_booking_listener(self._on_booking)
+
+    def load(self, intervals=None, labels=None):
+        """Replace the contents with (booking_id, spot_label, start, end) intervals"""
+        if intervals is None:
+            intervals = get_booking_intervals()
+        if labels is None and self.view is not None:
+            labels = [spot['spot_label'] for spot in self.view.snapshot()['spots']]
+        with self._lock:
+            if labels is not None:
+                self._labels = list(labels)
+                self._known = set(labels)
+            self._bookings = {}
+            self._spots = {}
+            self._all = ([], [], [], [])
+            self._longest = timedelta(0)
+            for booking_id, spot_label, start, end in sorted(intervals, key=lambda interval: interval[2]):
+                self._insert(booking_id, spot_label, start, end)
+            self.loaded_at = datetime.now()
+        return len(intervals)
+
+    def add(self, booking_id, spot_label, start, end):
+        with self._lock:
+            if booking_id not in self._bookings:
+                self._insert(booking_id, spot_label, start, end)
+
+    def remove(self, booking_id):
+        with self._lock:
+            interval = self._bookings.pop(booking_id, None)
+            if interval is None:
+                return
+            spot_label, start, end = interval
+            starts, ends, ids = self._spots[spot_label]
+            i = bisect_left(starts, start)
+            while ids[i] != booking_id:
+                i += 1
+            del starts[i], ends[i], ids[i]
+            starts, ends, ids, labels = self._all
+            i = bisect_left(starts, start)
+            while ids[i] != booking_id:
+                i += 1
+            del starts[i], ends[i], ids[i], labels[i]
+
+    def close(self):
+        remove_booking_listener(self._on_booking)
+
+    def __len__(self):
+        return len(self._bookings)
+
+    def is_free(self, spot_label, start, end):
+        """True if no booking holds the spot at any point in [start, end)"""
+        with self._lock:
+            return self._is_free(spot_label, start, end) and self._ready(spot_label, start)
+
+    def free_spots(self, start, end):
+        """Labels of every spot with no booking in [start, end), in lot order"""
+        with self._lock:
+            busy = self._busy(start, end)
+            free = [spot_label for spot_label in self._labels if spot_label not in busy]
+            if start < datetime.now() + RESERVE_AHEAD:
+                free = [spot_label for spot_label in free if self._ready(spot_label, start)]
+            return free
+
+    def earliest_slot(self, hours, after=None):
+        """(start, [spot labels]) of the earliest window of hours free on some spot, or None"""
+        length = timedelta(hours=hours)
+        after = after or datetime.now()
+        free = self.free_spots(after, after + length)
+        if free:
+            return after, free
+
+        with self._lock:
+            best = None
+            spots = []
+            for spot_label in self._labels:
+                start = self._first_gap(spot_label, after, length)
+                if not self._ready(spot_label, start):
+                    # Taken right now without a booking: look again once it is no longer near-term
+                    start = self._first_gap(spot_label, datetime.now() + RESERVE_AHEAD, length)
+                if best is None or start < best:
+                    best, spots = start, [spot_label]
+                elif start == best:
+                    spots.append(spot_label)
+            if best is None:
+                return None
+            return best, spots
+
+    def stats(self):
+        with self._lock:
+            return {
+                'spots': len(self._labels),
+                'bookings': len(self._bookings),
+                'loaded_at': self.loaded_at.isoformat(sep=' ') if self.loaded_at else None,
+            }
+
+    def _insert(self, booking_id, spot_label, start, end):
+        self._bookings[booking_id] = (spot_label, start, end)
+        if spot_label not in self._spots:
+            self._spots[spot_label] = ([], [], [])
+            if spot_label not in self._known:
+                self._known.add(spot_label)
+                self._labels.append(spot_label)
+        starts, ends, ids = self._spots[spot_label]
+        i = bisect_right(starts, start)
+        starts.insert(i, start)
+        ends.insert(i, end)
+        ids.insert(i, booking_id)
+        starts, ends, ids, labels = self._all
+        i = bisect_right(starts, start)
+        starts.insert(i, start)
+        ends.insert(i, end)
+        ids.insert(i, booking_id)
+        labels.insert(i, spot_label)
+        self._longest = max(self._longest, end - start)
+
+    def _is_free(self, spot_label, start, end):
+        intervals = self._spots.get(spot_label)
+        if not intervals:
+            return True
+        starts, ends, _ = intervals
+        # First booking still running at start; free if it begins at or after end
+        i = bisect_right(ends, start)
+        return i == len(starts) or starts[i] >= end
+
+    def _busy(self, start, end):
+        """Set of spots with a booking overlapping [start, end)
+
+        Every booking starting inside the window overlaps it; of those starting
+        before, only the ones within one longest-booking length of start can
+        still be running, so only those need their end checked.
+        """
+        starts, ends, _, labels = self._all
+        lo = bisect_left(starts, start - self._longest)
+        mid = bisect_left(starts, start, lo)
+        hi = bisect_left(starts, end, mid)
+        busy = set(labels[mid:hi])
+        busy.update(compress(labels[lo:mid], map(gt, ends[lo:mid], repeat(start))))
+        return busy
+
+    def _ready(self, spot_label, start):
+        """A window starting soon also needs the spot to be empty right now"""
+        if self.view is None or start >= datetime.now() + RESERVE_AHEAD:
+            return True
+        return self.view.get(spot_label) == 'available'
+
+    def _first_gap(self, spot_label, after, length):
+        """Earliest start at or after after with length free on the spot"""
+        intervals = self._spots.get(spot_label)
+        if not intervals:
+            return after
+        starts, ends, _ = intervals
+        candidate = after
+        for i in range(bisect_right(ends, after), len(starts)):
+            if starts[i] - candidate >= length:
+                break
+            candidate = max(candidate, ends[i])
+        return candidate
+
+    def _on_booking(self, booking_id, spot_label, start, end, status):
+        if status in HOLDING_STATUSES:
+            if start is not None and end is not None:
+                self.add(booking_id, spot_label, start, end)
+        else:
+            self.remove(booking_id)
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def start_calendar():
+    """Load the process-wide calendar from the database"""
+    global _calendar
+    with _calendar_lock:
+        if _calendar is None:
+            _calendar = SpotCalendar(view=get_spot_view())
+            _calendar.load()
+        return _calendar
+
+
+def get_calendar():
+    """The loaded calendar, or None before start_calendar()"""
+    return _calendar
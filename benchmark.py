@@ -0,0 +1,789 @@
+"""
+PARKEASE benchmarks
+Run from the project directory:
+
+    python benchmark.py pipeline --video carPark.mp4 --frames 300
+    python benchmark.py overlay --video carPark.mp4 --frames 300
+    python benchmark.py db-pool --queries 2000 --threads 8
+    python benchmark.py sqlite-stress --writers 2 --readers 8 --seconds 5
+    python benchmark.py booking-stress --threads 16 --rounds 5
+    python benchmark.py mail --messages 50 --latency 0.02
+    python benchmark.py waitlist --entries 100000 --events 2000
+    python benchmark.py availability --spots 5000 --bookings 20 --queries 2000
+    python benchmark.py dashboard --spots 5000 --history 200000
+    python benchmark.py admin-pages --rows 100000
+"""
+import argparse
+import os
+import pickle
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def load_frames(path, count):
+    """Decode up to count frames into memory so decoding is not measured"""
+    from frame_source import open_source
+
+    frames = []
+    with open_source(path) as source:
+        for img in source:
+            frames.append(img)
+            if len(frames) >= count:
+                break
+    return frames
+
+
+def measure_per_frame(step, frames):
+    """Run step(img) on every frame, returning per-frame allocated bytes and latency"""
+    allocated = []
+    latency = []
+    tracemalloc.start()
+    try:
+        for img in frames:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            started = time.perf_counter()
+            step(img)
+            latency.append(time.perf_counter() - started)
+            _, peak = tracemalloc.get_traced_memory()
+            allocated.append(peak - before)
+    finally:
+        tracemalloc.stop()
+    return np.array(allocated), np.array(latency) * 1000
+
+
+def bench_pipeline(args):
+    """Per-frame allocations: threshold_frame() versus a preallocated DetectionPipeline"""
+    from detection import DetectionPipeline, SpotScorer, threshold_frame
+
+    frames = load_frames(args.video, args.frames)
+    if not frames:
+        print(f"✗ No frames read from {args.video}")
+        return 1
+    with open('CarParkPos', 'rb') as f:
+        positions = pickle.load(f)
+
+    scorer = SpotScorer(positions)
+    pipeline = DetectionPipeline()
+    pipeline.threshold(frames[0])  # size the buffers before measuring
+    scorer.score(pipeline.threshold(frames[0]))
+
+    cases = [
+        ('allocating', lambda img: SpotScorer(positions).score(threshold_frame(img))),
+        ('preallocated', lambda img: scorer.score(pipeline.threshold(img))),
+    ]
+
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+    print(f"{'pipeline':<14} {'KiB/frame':>10} {'max KiB':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, step in cases:
+        allocated, latency = measure_per_frame(step, frames)
+        print(f"{name:<14} {allocated.mean() / 1024:>10.1f} {allocated.max() / 1024:>9.1f} "
+              f"{np.percentile(latency, 50):>8.2f} {np.percentile(latency, 99):>8.2f}")
+    return 0
+
+
+def bench_overlay(args):
+    """Per-frame annotation cost: drawing every spot versus the cached SpotOverlay"""
+    import cv2
+    import cvzone
+    from overlay import LABEL_FONT, LABEL_SCALE, LABEL_THICKNESS, STATE_STYLES, SpotOverlay
+
+    frames = load_frames(args.video, args.frames)
+    if not frames:
+        print(f"✗ No frames read from {args.video}")
+        return 1
+    with open('CarParkPos', 'rb') as f:
+        positions = pickle.load(f)
+    labels = [f"SPOT{i}" for i in range(len(positions))]
+
+    # A handful of spots change state every few frames, like a busy lot
+    rng = np.random.default_rng(0)
+    states = list(rng.choice(list(STATE_STYLES), len(positions)))
+    timeline = []
+    for n in range(len(frames)):
+        if n % 10 == 0:
+            for i in rng.choice(len(positions), 3, replace=False):
+                states[i] = rng.choice(list(STATE_STYLES))
+        timeline.append(list(states))
+
+    def draw_all(img, states):
+        spaces = 0
+        for (x, y), label, state in zip(positions, labels, states):
+            color, thic = STATE_STYLES[state]
+            spaces += state == 'available'
+            cv2.rectangle(img, (x, y), (x + 103, y + 43), color, thic)
+            cv2.putText(img, label, (x + 5, y + 25), LABEL_FONT, LABEL_SCALE, (255, 255, 255), LABEL_THICKNESS)
+        cvzone.putTextRect(img, f'Free: {spaces}/{len(positions)}', (50, 60), thickness=3, offset=20,
+                           colorR=(0, 200, 0))
+
+    overlay = SpotOverlay(positions, labels)
+    overlay.render(frames[0].copy(), timeline[0])  # render the initial sprites before measuring
+
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, {len(positions)} spots")
+    print(f"{'annotation':<10} {'mean ms':>8} {'p99 ms':>8} {'max diff':>9}")
+    outputs = {}
+    for name, draw in (('direct', draw_all), ('overlay', overlay.render)):
+        latency = []
+        outputs[name] = []
+        for img, states in zip(frames, timeline):
+            img = img.copy()
+            started = time.perf_counter()
+            draw(img, states)
+            latency.append((time.perf_counter() - started) * 1000)
+            outputs[name].append(img)
+        diff = max(int(np.abs(a.astype(np.int16) - b).max()) for a, b in zip(outputs['direct'], outputs[name]))
+        print(f"{name:<10} {np.mean(latency):>8.3f} {np.percentile(latency, 99):>8.3f} {diff:>9}")
+    return 0
+
+
+def use_temporary_database():
+    """Point database.py at a fresh SQLite file (unless DATABASE_URL selects Postgres)"""
+    import database
+
+    if database.USE_POSTGRES:
+        return None
+    directory = tempfile.mkdtemp(prefix='parkease-bench-')
+    database.DATABASE = os.path.join(directory, 'bench.db')
+    database._pool = None
+    database.init_db()
+    with open('CarParkPos', 'rb') as f:
+        database.initialize_spots(pickle.load(f))
+    return database.DATABASE
+
+
+def run_threads(threads, work):
+    """Run work(thread_index) on several threads, returning the elapsed seconds"""
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def bench_db_pool(args):
+    """Connection overhead: a new connection per query versus the pooled db_connection()"""
+    import database
+
+    path = use_temporary_database()
+    print(f"Database: {path or 'Postgres (DATABASE_URL)'}")
+    query = f'SELECT status FROM spots WHERE spot_label = {database.PARAM_PLACEHOLDER}'
+
+    def unpooled():
+        conn = database.get_db()
+        cursor = conn.cursor()
+        cursor.execute(query, ('A1',))
+        cursor.fetchone()
+        conn.close()
+
+    def pooled():
+        with database.db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, ('A1',))
+            cursor.fetchone()
+
+    per_thread = max(1, args.queries // args.threads)
+    print(f"{'connections':<12} {'threads':>7} {'queries':>8} {'us/query':>9} {'queries/s':>10}")
+    for name, step in (('per query', unpooled), ('pooled', pooled)):
+        for threads in sorted({1, args.threads}):
+            count = args.queries if threads == 1 else per_thread
+
+            def work(_):
+                for _ in range(count):
+                    step()
+
+            elapsed = run_threads(threads, work)
+            total = count * threads
+            print(f"{name:<12} {threads:>7} {total:>8} {elapsed / total * 1e6:>9.1f} {total / elapsed:>10.0f}")
+    print(f"Pool: {database.pool_stats()}")
+    return 0
+
+
+def _stress_worker(role, path, profile, labels, seconds, results):
+    """One writer or reader process for sqlite-stress; puts (role, latencies, locked) on results"""
+    import random
+    import sqlite3
+
+    import database
+    import sqlite_profile
+
+    sqlite_profile.SQLITE_PROFILE = profile
+    database.DATABASE = path
+    rng = random.Random()
+    latencies = []
+    locked = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if role == 'writer':
+                # Like the detector: small batches of confirmed status changes
+                changes = []
+                for _ in range(5):
+                    status = rng.choice(('available', 'occupied'))
+                    seen = 'occupied' if status == 'available' else 'available'
+                    changes.append((rng.choice(labels), status, seen))
+                database.update_spot_statuses(changes)
+            else:
+                database.get_all_spots()
+        except sqlite3.OperationalError:
+            locked += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+        if role == 'writer':
+            time.sleep(0.005)
+    results.put((role, latencies, locked))
+
+
+def bench_sqlite_stress(args):
+    """Detector writers and API readers in separate processes, rollback journal versus the WAL profile"""
+    import multiprocessing
+
+    import database
+    import sqlite_profile
+
+    if database.USE_POSTGRES:
+        print("✗ sqlite-stress needs the local SQLite database (unset DATABASE_URL)")
+        return 1
+
+    print(f"{args.writers} writer(s), {args.readers} reader(s), {args.seconds}s per profile")
+    print(f"{'profile':<9} {'writes/s':>9} {'reads/s':>8} {'read p99 ms':>12} {'write p99 ms':>13} {'locked':>7}")
+    for profile in ('rollback', 'wal'):
+        sqlite_profile.SQLITE_PROFILE = profile
+        path = use_temporary_database()
+        labels = [spot['spot_label'] for spot in database.get_all_spots()]
+
+        results = multiprocessing.Queue()
+        roles = ['writer'] * args.writers + ['reader'] * args.readers
+        workers = [multiprocessing.Process(target=_stress_worker,
+                                           args=(role, path, profile, labels, args.seconds, results))
+                   for role in roles]
+        for worker in workers:
+            worker.start()
+        latencies = {'writer': [], 'reader': []}
+        locked = 0
+        for _ in workers:
+            role, times, errors = results.get()
+            latencies[role].extend(times)
+            locked += errors
+        for worker in workers:
+            worker.join()
+
+        writes = np.array(latencies['writer'] or [0.0]) * 1000
+        reads = np.array(latencies['reader'] or [0.0]) * 1000
+        print(f"{profile:<9} {len(latencies['writer']) / args.seconds:>9.0f} "
+              f"{len(latencies['reader']) / args.seconds:>8.0f} "
+              f"{np.percentile(reads, 99):>12.2f} {np.percentile(writes, 99):>13.2f} {locked:>7}")
+    return 0
+
+
+def bench_booking_stress(args):
+    """Concurrent bookings racing for the same spots: checks for double-bookings and measures bookings/s"""
+    import random
+    from collections import Counter
+    from datetime import datetime
+
+    import database
+
+    path = use_temporary_database()
+    print(f"Database: {path or 'Postgres (DATABASE_URL)'}")
+    labels = [spot['spot_label'] for spot in database.get_all_spots()]
+    with database.db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE spots SET status = 'available'")
+        conn.commit()
+
+    print(f"{args.threads} threads racing for {len(labels)} spots, {args.rounds} round(s)")
+    print(f"{'round':>5} {'attempts':>9} {'booked':>7} {'rejected':>9} {'errors':>7} {'bookings/s':>11} {'attempts/s':>11}")
+    double_booked = lost = 0
+    for round_number in range(1, args.rounds + 1):
+        lock = threading.Lock()
+        winners = Counter()
+        booking_ids = []
+        counts = Counter()
+        arrival = datetime.now()
+
+        def work(index):
+            # Every thread tries every spot, in its own order
+            order = labels[:]
+            random.Random(round_number * 1000 + index).shuffle(order)
+            for label in order:
+                try:
+                    booking_id = database.create_booking(
+                        label, f'Stress {index}', f'0300{index:07d}', '', 'Sedan', arrival, 1)
+                except database.SpotUnavailableError:
+                    outcome = 'rejected'
+                except Exception:
+                    outcome = 'errors'
+                else:
+                    outcome = 'booked'
+                    with lock:
+                        winners[label] += 1
+                        booking_ids.append(booking_id)
+                with lock:
+                    counts[outcome] += 1
+
+        elapsed = run_threads(args.threads, work)
+        attempts = sum(counts.values())
+        print(f"{round_number:>5} {attempts:>9} {counts['booked']:>7} {counts['rejected']:>9} "
+              f"{counts['errors']:>7} {counts['booked'] / elapsed:>11.0f} {attempts / elapsed:>11.0f}")
+        double_booked += sum(1 for label in labels if winners[label] > 1)
+        lost += sum(1 for label in labels if winners[label] == 0)
+
+        # Release the round's bookings, racing two cancels per booking
+        cancelled = Counter()
+
+        def release(index):
+            for booking_id in booking_ids[index // 2::max(1, args.threads // 2)]:
+                if database.cancel_booking(booking_id):
+                    with lock:
+                        cancelled[booking_id] += 1
+
+        run_threads(max(2, args.threads // 2 * 2), release)
+        double_booked += sum(1 for count in cancelled.values() if count > 1)
+
+    # Spots and bookings tables must agree: one reservation per spot at most
+    with database.db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT spot_label, COUNT(*) FROM bookings
+            WHERE status = 'active' GROUP BY spot_label HAVING COUNT(*) > 1
+        """)
+        overlapping = cursor.fetchall()
+    status = '✓' if not (double_booked or lost or overlapping) else '✗'
+    print(f"{status} double-booked or double-cancelled: {double_booked}, spots nobody won: {lost}, "
+          f"spots with several active bookings: {len(overlapping)}")
+    return 0 if status == '✓' else 1
+
+
+class _SMTPSink(socketserver.StreamRequestHandler):
+    """Minimal local SMTP server for the mail benchmark: waits server.latency before every reply"""
+
+    def reply(self, line):
+        time.sleep(self.server.latency)
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        self.reply('220 localhost ESMTP benchmark')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with server.lock:
+                    server.messages += 1
+                    refuse = server.fail_every and server.messages % server.fail_every == 0
+                    server.delivered += not refuse
+                self.reply('451 Try again later' if refuse else '250 OK')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                # EHLO, MAIL, RCPT, RSET, NOOP
+                self.reply('250 OK')
+
+
+def start_smtp_sink(latency, fail_every=0):
+    """Run _SMTPSink on a free local port; returns the server"""
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _SMTPSink)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_every = fail_every
+    server.lock = threading.Lock()
+    server.messages = 0
+    server.delivered = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_mail(args):
+    """Booking-side email latency: one SMTP connection per email versus the queued outbox sender"""
+    import smtplib
+
+    import database
+    import mailer
+
+    sink = start_smtp_sink(args.latency, args.fail_every)
+    host, port = sink.server_address
+    print(f"SMTP stand-in on {host}:{port}, {args.latency * 1000:.0f} ms per reply, "
+          f"{'every %dth DATA command refused' % args.fail_every if args.fail_every else 'no refusals'}")
+    print(f"{'sending':<10} {'delivered':>9} {'caller p50 ms':>14} {'caller p99 ms':>14} {'delivered in s':>15} {'connections':>12}")
+
+    # Before: the request opened its own SMTP session for every email
+    # (a refused email was only logged, never retried)
+    latency = []
+    delivered = 0
+    started = time.perf_counter()
+    for i in range(args.messages):
+        sent = time.perf_counter()
+        server = smtplib.SMTP(host, port)
+        try:
+            server.sendmail(mailer.EMAIL_USER, f'user{i}@example.com',
+                            mailer.build_message(mailer.EMAIL_USER, f'user{i}@example.com', 'Benchmark', '<p>Hi</p>'))
+            delivered += 1
+        except smtplib.SMTPException:
+            pass
+        server.quit()
+        latency.append((time.perf_counter() - sent) * 1000)
+    elapsed = time.perf_counter() - started
+    print(f"{'direct':<10} {delivered:>9} {np.percentile(latency, 50):>14.2f} "
+          f"{np.percentile(latency, 99):>14.2f} {elapsed:>15.2f} {args.messages:>12}")
+
+    # After: the request only queues; the sender delivers over one session
+    use_temporary_database()
+    mailer.MAIL_BACKOFF_BASE = 0.2
+    sender = mailer.start_mailer(host=host, port=port, password='', starttls=False, poll_interval=0.5)
+    latency = []
+    started = time.perf_counter()
+    for i in range(args.messages):
+        sent = time.perf_counter()
+        mailer.send_email(f'user{i}@example.com', 'Benchmark', '<p>Hi</p>')
+        latency.append((time.perf_counter() - sent) * 1000)
+    deadline = time.perf_counter() + 60
+    while time.perf_counter() < deadline:
+        depth = database.get_outbox_stats()
+        if depth['pending'] == 0 and depth['sending'] == 0:
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    stats = sender.stats()
+    print(f"{'outbox':<10} {stats['sent']:>9} {np.percentile(latency, 50):>14.2f} "
+          f"{np.percentile(latency, 99):>14.2f} {elapsed:>15.2f} {stats['smtp_connections']:>12}")
+    print(f"Outbox: {database.get_outbox_stats()}")
+    print(f"Sender: {stats}")
+    sender.stop()
+    return 0 if database.get_outbox_stats()['sent'] == args.messages else 1
+
+
+def bench_waitlist(args):
+    """Waitlist matching cost per freed spot as the queue grows"""
+    import random
+    from datetime import datetime, timedelta
+
+    import database
+    from waitlist import WaitlistMatcher
+
+    car_types = ['Sedan', 'SUV', 'Hatchback', 'Pickup', 'Coupe']
+    sizes = sorted({min(1000, args.entries), min(10000, args.entries), args.entries})
+    print(f"{'waiting':>8} {'rebuild s':>10} {'events':>7} {'match p50 ms':>13} {'match p99 ms':>13} {'events/s':>9}")
+    for size in sizes:
+        path = use_temporary_database()
+        labels = [spot['spot_label'] for spot in database.get_all_spots()]
+        rng = random.Random(size)
+        joined = datetime.now() - timedelta(days=1)
+        with database.db_connection() as conn:
+            cursor = conn.cursor()
+            # A full lot, so nothing is matched before the timed events
+            cursor.execute("UPDATE spots SET status = 'occupied'")
+            query = f'''
+                INSERT INTO waitlist (user_name, user_phone, user_email, car_type, requested_time)
+                VALUES ({database.PARAM_PLACEHOLDER}, {database.PARAM_PLACEHOLDER}, '',
+                        {database.PARAM_PLACEHOLDER}, {database.PARAM_PLACEHOLDER})
+            '''
+            cursor.executemany(query, [(f'Waiting {i}', f'0300{i:07d}', rng.choice(car_types),
+                                        joined + timedelta(milliseconds=i)) for i in range(size)])
+            conn.commit()
+
+        matcher = WaitlistMatcher()
+        started = time.perf_counter()
+        matcher.rebuild()
+        rebuild = time.perf_counter() - started
+
+        # Each event: the detector sees a car leave, then the matcher books the spot
+        events = min(args.events, size)
+        latency = []
+        holding = {}
+        started = time.perf_counter()
+        for i in range(events):
+            label = labels[i % len(labels)]
+            if label in holding:
+                # The previous waitlist booking of this spot has ended
+                database.release_expired_bookings([(holding[label], 'end')])
+            database.update_spot_statuses([(label, 'available', None)])
+            matched = time.perf_counter()
+            booking = matcher.match(label)
+            if booking is None:
+                print(f"✗ {label} was not assigned")
+                return 1
+            latency.append((time.perf_counter() - matched) * 1000)
+            holding[label] = booking['id']
+        elapsed = time.perf_counter() - started
+        print(f"{size:>8} {rebuild:>10.2f} {events:>7} {np.percentile(latency, 50):>13.3f} "
+              f"{np.percentile(latency, 99):>13.3f} {events / elapsed:>9.0f}")
+
+        # The earliest joiners were served first, in order
+        with database.db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM waitlist WHERE status = 'assigned' ORDER BY id")
+            assigned = [row[0] for row in cursor.fetchall()]
+        if assigned != list(range(1, events + 1)):
+            print(f"✗ Waitlist served out of order ({path})")
+            return 1
+    print("✓ Every freed spot went to the earliest waiting user")
+    return 0
+
+
+def bench_availability(args):
+    """Free-spot and earliest-slot queries against the reservation calendar"""
+    import random
+    from datetime import datetime, timedelta
+
+    from availability import SpotCalendar
+
+    rng = random.Random(23)
+    base = datetime.now().replace(second=0, microsecond=0) + timedelta(days=1)
+    week = 7 * 24 * 60
+    labels = [f'S{i}' for i in range(args.spots)]
+    intervals = []
+    for label in labels:
+        # Non-overlapping bookings of 1-8 hours spread over a week
+        starts = sorted(rng.sample(range(0, week, 30), args.bookings))
+        free_from = 0
+        for start in starts:
+            start = max(start, free_from)
+            end = start + rng.randint(1, 8) * 60
+            intervals.append((len(intervals) + 1, label, base + timedelta(minutes=start),
+                              base + timedelta(minutes=end)))
+            free_from = end
+
+    calendar = SpotCalendar()
+    started = time.perf_counter()
+    calendar.load(intervals, labels)
+    load = time.perf_counter() - started
+    print(f"Loaded {len(intervals)} bookings on {args.spots} spots in {load:.2f} s")
+
+    by_spot = {}
+    for _, label, start, end in intervals:
+        by_spot.setdefault(label, []).append((start, end))
+
+    def scan(start, end):
+        return [label for label in labels
+                if not any(s < end and e > start for s, e in by_spot.get(label, ()))]
+
+    windows = []
+    for _ in range(args.queries):
+        start = base + timedelta(minutes=rng.randrange(0, week, 15))
+        windows.append((start, rng.randint(1, 8)))
+
+    results = {}
+    for name, query in (
+        ('free_spots', lambda start, hours: calendar.free_spots(start, start + timedelta(hours=hours))),
+        ('earliest_slot', lambda start, hours: calendar.earliest_slot(hours, start)),
+        ('full scan', lambda start, hours: scan(start, start + timedelta(hours=hours))),
+    ):
+        timings = []
+        # The scan is the baseline; a sample is enough
+        for start, hours in windows[:50] if name == 'full scan' else windows:
+            began = time.perf_counter()
+            results.setdefault(name, []).append(query(start, hours))
+            timings.append((time.perf_counter() - began) * 1000)
+        print(f"{name:>14}: p50 {np.percentile(timings, 50):8.3f} ms   p99 {np.percentile(timings, 99):8.3f} ms")
+
+    if results['free_spots'][:50] != results['full scan']:
+        print("✗ Calendar and full scan disagree")
+        return 1
+    for (start, hours), (slot, spots) in zip(windows[:50], results['earliest_slot']):
+        # Bookings start and end on whole minutes, so a minute earlier must not fit
+        earlier = slot - timedelta(minutes=1)
+        if slot < start or spots != scan(slot, slot + timedelta(hours=hours)) \
+                or (slot > start and scan(earlier, earlier + timedelta(hours=hours))):
+            print(f"✗ Earliest slot for {hours} h after {start} is wrong: {slot}")
+            return 1
+    calendar.close()
+    print("✓ Calendar matches a full scan")
+    return 0
+
+
+def bench_dashboard(args):
+    """Admin dashboard bookings page on a large lot with a long booking history"""
+    import random
+    from datetime import datetime, timedelta
+
+    import database
+
+    path = use_temporary_database()
+    print(f"Database: {path or 'Postgres (DATABASE_URL)'}")
+    rng = random.Random(24)
+    p = database.PARAM_PLACEHOLDER
+    now = datetime.now()
+    with database.db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM spots')
+        cursor.executemany(
+            f"INSERT INTO spots (spot_label, x, y, width, height, status) VALUES ({p}, 0, 0, 10, 10, {p})",
+            [(f'S{i}', rng.choice(['available', 'occupied', 'occupied', 'reserved'])) for i in range(args.spots)])
+        # Finished bookings spread over the past year, plus one current booking on every fourth spot
+        history = []
+        for i in range(args.history):
+            arrival = now - timedelta(minutes=rng.randrange(60, 365 * 24 * 60))
+            history.append((f'S{rng.randrange(args.spots)}', f'User {i}', f'0300{i:07d}', 'Sedan',
+                            arrival, 2, rng.choice(['completed', 'cancelled', 'expired']), arrival + timedelta(hours=2)))
+        for i in range(0, args.spots, 4):
+            history.append((f'S{i}', f'Current {i}', f'0311{i:07d}', 'SUV', now, 2, 'active', now + timedelta(hours=2)))
+        cursor.executemany(f'''
+            INSERT INTO bookings (spot_label, user_name, user_phone, car_type, arrival_time, duration, status, end_time)
+            VALUES ({p}, {p}, {p}, {p}, {p}, {p}, {p}, {p})
+        ''', history)
+        conn.commit()
+    print(f"{args.spots} spots, {len(history)} bookings")
+
+    for name, kwargs in (('first page', {}), ('reserved only', {'spot_status': 'reserved'}),
+                         ('search by phone', {'search': '0311000'})):
+        timings = []
+        for _ in range(20):
+            started = time.perf_counter()
+            page, _ = database.get_active_bookings(50, **kwargs)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"{name:>16}: {len(page):>3} rows   p50 {np.percentile(timings, 50):7.2f} ms")
+
+    # Walk every page; pages must not overlap or change between runs
+    started = time.perf_counter()
+    seen = []
+    after = None
+    pages = 0
+    while True:
+        page, after = database.get_active_bookings(50, after)
+        seen.extend(row['spot_id'] for row in page)
+        pages += 1
+        if after is None:
+            break
+    elapsed = time.perf_counter() - started
+    print(f"{'all pages':>16}: {len(seen):>3} rows in {pages} pages, {elapsed * 1000 / pages:.2f} ms per page")
+    if len(seen) != len(set(seen)) or database.get_active_bookings(50)[0] != database.get_active_bookings(50)[0]:
+        print("✗ Pages overlap or are not repeatable")
+        return 1
+    print("✓ Pages are disjoint and repeatable")
+    return 0
+
+
+def bench_admin_pages(args):
+    """Keyset pages of feedback and logs vs OFFSET pages, at the start and the end of a large table"""
+    import random
+    from datetime import datetime, timedelta
+
+    import database
+
+    path = use_temporary_database()
+    print(f"Database: {path or 'Postgres (DATABASE_URL)'}")
+    rng = random.Random(25)
+    p = database.PARAM_PLACEHOLDER
+    start = datetime.now() - timedelta(days=365)
+    with database.db_connection() as conn:
+        cursor = conn.cursor()
+        # Several rows per second, so timestamps repeat and the id breaks the ties
+        timestamps = [start + timedelta(seconds=i // 3) for i in range(args.rows)]
+        cursor.executemany(f'INSERT INTO feedback (user_name, rating, comment, timestamp) VALUES ({p}, {p}, {p}, {p})',
+                           [(f'User {i}', rng.randint(1, 5), 'x' * 80, timestamps[i]) for i in range(args.rows)])
+        cursor.executemany(f'INSERT INTO parking_logs (spot_label, action, user_name, timestamp) VALUES ({p}, {p}, {p}, {p})',
+                           [(f'A{i % 69}', 'booked', f'User {i}', timestamps[i]) for i in range(args.rows)])
+        conn.commit()
+    print(f"{args.rows} feedback rows and {args.rows} log rows")
+
+    page_size = 50
+    last_offset = args.rows - page_size
+    for table, fetch in (('feedback', database.get_feedback), ('parking_logs', database.get_parking_logs)):
+        # Walk to the last page by cursor, timing each page
+        timings = []
+        seen = 0
+        before = None
+        while True:
+            started = time.perf_counter()
+            rows, before = fetch(page_size, before)
+            timings.append((time.perf_counter() - started) * 1000)
+            seen += len(rows)
+            if before is None:
+                break
+        if seen != args.rows:
+            print(f"✗ {table}: walked {seen} rows, expected {args.rows}")
+            return 1
+
+        with database.db_connection() as conn:
+            cursor = conn.cursor()
+            offset_timings = []
+            for offset in (0, last_offset):
+                started = time.perf_counter()
+                cursor.execute(f'SELECT * FROM {table} ORDER BY timestamp DESC, id DESC LIMIT {p} OFFSET {p}',
+                               (page_size, offset))
+                cursor.fetchall()
+                offset_timings.append((time.perf_counter() - started) * 1000)
+        print(f"{table:>13}: keyset first {timings[0]:6.2f} ms, last {timings[-1]:6.2f} ms, "
+              f"p99 {np.percentile(timings, 99):6.2f} ms over {len(timings)} pages | "
+              f"OFFSET first {offset_timings[0]:6.2f} ms, last {offset_timings[1]:6.2f} ms")
+    print("✓ Every row was paged exactly once")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PARKEASE benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    pipeline = commands.add_parser('pipeline', help=bench_pipeline.__doc__)
+    pipeline.add_argument('--video', default='carPark.mp4')
+    pipeline.add_argument('--frames', type=int, default=300)
+    pipeline.set_defaults(func=bench_pipeline)
+
+    overlay = commands.add_parser('overlay', help=bench_overlay.__doc__)
+    overlay.add_argument('--video', default='carPark.mp4')
+    overlay.add_argument('--frames', type=int, default=300)
+    overlay.set_defaults(func=bench_overlay)
+
+    db_pool = commands.add_parser('db-pool', help=bench_db_pool.__doc__)
+    db_pool.add_argument('--queries', type=int, default=2000)
+    db_pool.add_argument('--threads', type=int, default=8)
+    db_pool.set_defaults(func=bench_db_pool)
+
+    stress = commands.add_parser('sqlite-stress', help=bench_sqlite_stress.__doc__)
+    stress.add_argument('--writers', type=int, default=2)
+    stress.add_argument('--readers', type=int, default=8)
+    stress.add_argument('--seconds', type=float, default=5.0)
+    stress.set_defaults(func=bench_sqlite_stress)
+
+    booking = commands.add_parser('booking-stress', help=bench_booking_stress.__doc__)
+    booking.add_argument('--threads', type=int, default=16)
+    booking.add_argument('--rounds', type=int, default=5)
+    booking.set_defaults(func=bench_booking_stress)
+
+    mail = commands.add_parser('mail', help=bench_mail.__doc__)
+    mail.add_argument('--messages', type=int, default=50)
+    mail.add_argument('--latency', type=float, default=0.02)
+    mail.add_argument('--fail-every', type=int, default=0)
+    mail.set_defaults(func=bench_mail)
+
+    waitlist = commands.add_parser('waitlist', help=bench_waitlist.__doc__)
+    waitlist.add_argument('--entries', type=int, default=100000)
+    waitlist.add_argument('--events', type=int, default=2000)
+    waitlist.set_defaults(func=bench_waitlist)
+
+    availability = commands.add_parser('availability', help=bench_availability.__doc__)
+    availability.add_argument('--spots', type=int, default=5000)
+    availability.add_argument('--bookings', type=int, default=20)
+    availability.add_argument('--queries', type=int, default=2000)
+    availability.set_defaults(func=bench_availability)
+
+    dashboard = commands.add_parser('dashboard', help=bench_dashboard.__doc__)
+    dashboard.add_argument('--spots', type=int, default=5000)
+    dashboard.add_argument('--history', type=int, default=200000)
+    dashboard.set_defaults(func=bench_dashboard)
+
+    admin_pages = commands.add_parser('admin-pages', help=bench_admin_pages.__doc__)
+    admin_pages.add_argument('--rows', type=int, default=100000)
+    admin_pages.set_defaults(func=bench_admin_pages)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+PARKEASE booking deadlines
+Every booking that holds a spot has two deadlines: the end of its grace
+period (arrival + 10 minutes, released if nobody has parked) and the end of
+its duration. Bookings made for later also have a start, RESERVE_AHEAD
+before arrival, when their spot is reserved. All of them live in a
+min-heap, and one thread sleeps until the earliest is due, then handles
+everything due in a single transaction.
+
+The heap is loaded from the bookings table at startup (and resynced
+periodically for bookings made by other processes) and updated as bookings
+are created or cancelled; cancelled entries are skipped lazily when they
+reach the top. Release is a conditional update, so a booking
+that was cancelled or checked in meanwhile is never released twice.
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta
+
+from database import (
+    GRACE_PERIOD, RESERVE_AHEAD, parse_timestamp, get_booking_deadlines,
+    release_expired_bookings, activate_scheduled_bookings
+)
+
+MAX_SLEEP = 60.0    # re-check the clock at least this often (system clock changes)
+
+
+class BookingScheduler(threading.Thread):
+    """Min-heap of booking deadlines, released as they come due"""
+
+    def __init__(self):
+        super().__init__(daemon=True, name='booking-deadlines')
+        self._heap = []
+        self._live = set()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self.released = 0
+        self.activated = 0
+        self.batches = 0
+        self.max_lateness = 0.0
+        self._rebuilt_at = datetime.now()
+
+    def rebuild(self):
+        """Add every booking still holding a spot in the database that the heap does not know yet"""
+        deadlines = get_booking_deadlines()
+        added = 0
+        with self._cond:
+            for booking_id, start, grace, end in deadlines:
+                if booking_id in self._live:
+                    continue
+                for entry in self._push(booking_id, start, grace, end):
+                    heapq.heappush(self._heap, entry)
+                added += 1
+            self._rebuilt_at = datetime.now()
+            self._cond.notify()
+        return added
+
+    def schedule(self, booking_id, arrival_time, duration):
+        """Add a new booking's start, grace-period and end deadlines"""
+        arrival = parse_timestamp(arrival_time)
+        if arrival is None:
+            return
+        start = arrival - RESERVE_AHEAD
+        if start <= datetime.now():
+            # Booked for now: the spot is already reserved
+            start = None
+        with self._cond:
+            if booking_id in self._live:
+                return
+            for entry in self._push(booking_id, start, arrival + GRACE_PERIOD,
+                                    arrival + timedelta(hours=int(duration))):
+                heapq.heappush(self._heap, entry)
+            self._cond.notify()
+
+    def forget(self, booking_id):
+        """Drop a cancelled booking; its heap entries are skipped when they come up"""
+        with self._cond:
+            self._live.discard(booking_id)
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'bookings': len(self._live),
+                'next_deadline': self._heap[0][0].isoformat(sep=' ') if self._heap else None,
+                'released': self.released,
+                'activated': self.activated,
+                'batches': self.batches,
+                'max_lateness_ms': round(self.max_lateness * 1000, 1),
+            }
+
+    def _push(self, booking_id, start, grace, end):
+        """Mark a booking live and return its heap entries"""
+        entries = [(deadline, booking_id, kind)
+                   for deadline, kind in ((start, 'start'), (grace, 'grace'), (end, 'end'))
+                   if deadline is not None]
+        if entries:
+            self._live.add(booking_id)
+        return entries
+
+    def _take_due(self):
+        """Wait for the earliest deadline, then pop every live entry that is due"""
+        with self._cond:
+            now = datetime.now()
+            while not self._stopping and not (self._heap and self._heap[0][0] <= now):
+                timeout = MAX_SLEEP
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+                self._cond.wait(timeout)
+                now = datetime.now()
+
+            due = []
+            lateness = 0.0
+            while self._heap and self._heap[0][0] <= now:
+                deadline, booking_id, kind = heapq.heappop(self._heap)
+                if booking_id not in self._live:
+                    continue
+                if kind == 'end':
+                    self._live.discard(booking_id)
+                due.append((booking_id, kind))
+                # Deadlines that passed while nothing was running are not scheduler lateness
+                if deadline >= self._rebuilt_at:
+                    lateness = max(lateness, (now - deadline).total_seconds())
+            return due, lateness
+
+    def run(self):
+        while True:
+            due, lateness = self._take_due()
+            if self._stopping:
+                return
+            if not due:
+                continue
+            try:
+                activated = activate_scheduled_bookings([booking_id for booking_id, kind in due if kind == 'start'])
+                released = release_expired_bookings([entry for entry in due if entry[1] != 'start'])
+            except Exception as e:
+                print(f"Booking release error: {e}")
+                # Put them back and retry after a pause instead of dropping them
+                retry_at = datetime.now() + timedelta(seconds=5)
+                with self._cond:
+                    for booking_id, kind in due:
+                        self._live.add(booking_id)
+                        heapq.heappush(self._heap, (retry_at, booking_id, kind))
+                continue
+            with self._cond:
+                self.released += len(released)
+                self.activated += len(activated)
+                self.batches += 1
+                self.max_lateness = max(self.max_lateness, lateness)
+            if activated:
+                print(f"Reserved {len(activated)} spot(s) for scheduled bookings: {', '.join(activated)}")
+            if released:
+                print(f"Released {len(released)} expired booking(s): {', '.join(released)}")
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_booking_scheduler():
+    """Rebuild the deadline heap from the database and start the process-wide scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = BookingScheduler()
+            _scheduler.rebuild()
+            _scheduler.start()
+        return _scheduler
+
+
+def get_booking_scheduler():
+    """The running scheduler, or None before start_booking_scheduler()"""
+    return _scheduler
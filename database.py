@@ -1,7 +1,13 @@
 import sqlite3
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import json
 import os
+import threading
+
+from db_pool import SQLiteConnectionPool, PostgresConnectionPool
+from migrations import run_migrations
+from sqlite_profile import apply_profile, start_checkpoint_scheduler
 
 # Check if running on Render (PostgreSQL) or locally (SQLite)
 DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -19,7 +25,55 @@ else:
     DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parkease.db')
     PARAM_PLACEHOLDER = '?'
 
+class SpotUnavailableError(Exception):
+    """The spot was not available when the booking tried to claim it"""
+
+class SpotBookedAheadError(SpotUnavailableError):
+    """The spot is free now but booked again too soon for the stay asked for"""
+
+# Callbacks run after a spot status change has been committed
+_spot_listeners = []
+
+def add_spot_listener(callback):
+    """Register callback(spot_label, status) to be told about spot status changes"""
+    _spot_listeners.append(callback)
+
+def remove_spot_listener(callback):
+    """Stop notifying a previously registered spot listener"""
+    if callback in _spot_listeners:
+        _spot_listeners.remove(callback)
+
+def _notify_spot_change(spot_label, status):
+    for callback in list(_spot_listeners):
+        try:
+            callback(spot_label, status)
+        except Exception as e:
+            print(f"Spot listener error: {e}")
+
+# Callbacks run after a booking is created or stops holding its spot
+_booking_listeners = []
+
+def add_booking_listener(callback):
+    """Register callback(booking_id, spot_label, start, end, status) for booking changes
+
+    start and end are only given for new bookings; status is the booking's new status.
+    """
+    _booking_listeners.append(callback)
+
+def remove_booking_listener(callback):
+    """Stop notifying a previously registered booking listener"""
+    if callback in _booking_listeners:
+        _booking_listeners.remove(callback)
+
+def _notify_booking_change(booking_id, spot_label, start, end, status):
+    for callback in list(_booking_listeners):
+        try:
+            callback(booking_id, spot_label, start, end, status)
+        except Exception as e:
+            print(f"Booking listener error: {e}")
+
 def get_db():
+    """Open a new unpooled connection; prefer db_connection()"""
     try:
         if USE_POSTGRES:
             conn = psycopg2.connect(DATABASE_URL)
@@ -27,191 +81,275 @@ def get_db():
         else:
             conn = sqlite3.connect(DATABASE)
             conn.row_factory = sqlite3.Row
+            apply_profile(conn)
             return conn
     except Exception as e:
         print(f"Database connection error: {e}")
         raise
 
+# Connection pool, created on first use (sizes only apply to Postgres)
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if USE_POSTGRES:
+                    _pool = PostgresConnectionPool(DATABASE_URL, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT)
+                else:
+                    _pool = SQLiteConnectionPool(DATABASE, on_connect=apply_profile)
+    return _pool
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection; anything left uncommitted is rolled back on return"""
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+def start_storage_maintenance():
+    """Start background WAL checkpointing for the local SQLite database"""
+    if not USE_POSTGRES:
+        return start_checkpoint_scheduler(DATABASE)
+    return None
+
+def pool_stats():
+    """Connection pool counters: connections opened, in use, waits and wait times"""
+    return _get_pool().stats.snapshot()
+
 def init_db():
     """Initialize the database with all required tables"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Adjust SQL syntax based on database type
-    if USE_POSTGRES:
-        id_type = "SERIAL PRIMARY KEY"
-        text_type = "VARCHAR"
-        timestamp_default = "DEFAULT CURRENT_TIMESTAMP"
-    else:
-        id_type = "INTEGER PRIMARY KEY AUTOINCREMENT"
-        text_type = "TEXT"
-        timestamp_default = "DEFAULT CURRENT_TIMESTAMP"
-    
-    # Users table
-    cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS users (
-            id {id_type},
-            email {text_type} UNIQUE NOT NULL,
-            password_hash {text_type} NOT NULL,
-            name {text_type} NOT NULL,
-            phone {text_type} NOT NULL,
-            created_at TIMESTAMP {timestamp_default}
-        )
-    ''')
-    
-    # Parking spots table
-    cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS spots (
-            id {id_type},
-            spot_label {text_type} UNIQUE NOT NULL,
-            x INTEGER NOT NULL,
-            y INTEGER NOT NULL,
-            width INTEGER NOT NULL,
-            height INTEGER NOT NULL,
-            status {text_type} DEFAULT 'available',
-            location {text_type} DEFAULT 'Main Parking',
-            last_updated TIMESTAMP {timestamp_default}
-        )
-    ''')
-    
-    # Bookings table
-    cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS bookings (
-            id {id_type},
-            spot_label {text_type} NOT NULL,
-            user_name {text_type} NOT NULL,
-            user_phone {text_type} NOT NULL,
-            user_email {text_type},
-            car_type {text_type} NOT NULL,
-            arrival_time TIMESTAMP NOT NULL,
-            duration INTEGER NOT NULL,
-            booking_time TIMESTAMP {timestamp_default},
-            status {text_type} DEFAULT 'active',
-            grace_period_end TIMESTAMP
-        )
-    ''')
-    
-    # Parking logs table
-    cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS parking_logs (
-            id {id_type},
-            spot_label {text_type} NOT NULL,
-            action {text_type} NOT NULL,
-            user_name {text_type},
-            timestamp TIMESTAMP {timestamp_default},
-            details {text_type}
-        )
-    ''')
-    
-    # Feedback table
-    cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS feedback (
-            id {id_type},
-            user_name {text_type} NOT NULL,
-            rating INTEGER NOT NULL,
-            comment {text_type},
-            timestamp TIMESTAMP {timestamp_default}
-        )
-    ''')
-    
-    # Wait list table
-    cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS waitlist (
-            id {id_type},
-            user_name {text_type} NOT NULL,
-            user_phone {text_type} NOT NULL,
-            user_email {text_type},
-            car_type {text_type} NOT NULL,
-            requested_time TIMESTAMP {timestamp_default},
-            status {text_type} DEFAULT 'waiting'
-        )
-    ''')
-    
-    # Favorites table
-    cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS favorites (
-            id {id_type},
-            user_phone {text_type} NOT NULL,
-            location {text_type} NOT NULL,
-            timestamp TIMESTAMP {timestamp_default}
-        )
-    ''')
-    
-    # Analytics table for tracking occupancy
-    cursor.execute(f'''
-        CREATE TABLE IF NOT EXISTS occupancy_stats (
-            id {id_type},
-            timestamp TIMESTAMP {timestamp_default},
-            total_spots INTEGER,
-            occupied_spots INTEGER,
-            available_spots INTEGER,
-            reserved_spots INTEGER
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Adjust SQL syntax based on database type
+        if USE_POSTGRES:
+            id_type = "SERIAL PRIMARY KEY"
+            text_type = "VARCHAR"
+            timestamp_default = "DEFAULT CURRENT_TIMESTAMP"
+        else:
+            id_type = "INTEGER PRIMARY KEY AUTOINCREMENT"
+            text_type = "TEXT"
+            timestamp_default = "DEFAULT CURRENT_TIMESTAMP"
+        
+        # Users table
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS users (
+                id {id_type},
+                email {text_type} UNIQUE NOT NULL,
+                password_hash {text_type} NOT NULL,
+                name {text_type} NOT NULL,
+                phone {text_type} NOT NULL,
+                created_at TIMESTAMP {timestamp_default}
+            )
+        ''')
+        
+        # Parking spots table
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS spots (
+                id {id_type},
+                spot_label {text_type} UNIQUE NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                status {text_type} DEFAULT 'available',
+                location {text_type} DEFAULT 'Main Parking',
+                last_updated TIMESTAMP {timestamp_default}
+            )
+        ''')
+        
+        # Bookings table
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS bookings (
+                id {id_type},
+                spot_label {text_type} NOT NULL,
+                user_name {text_type} NOT NULL,
+                user_phone {text_type} NOT NULL,
+                user_email {text_type},
+                car_type {text_type} NOT NULL,
+                arrival_time TIMESTAMP NOT NULL,
+                duration INTEGER NOT NULL,
+                booking_time TIMESTAMP {timestamp_default},
+                status {text_type} DEFAULT 'active',
+                grace_period_end TIMESTAMP
+            )
+        ''')
+        
+        # Parking logs table
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS parking_logs (
+                id {id_type},
+                spot_label {text_type} NOT NULL,
+                action {text_type} NOT NULL,
+                user_name {text_type},
+                timestamp TIMESTAMP {timestamp_default},
+                details {text_type}
+            )
+        ''')
+        
+        # Feedback table
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS feedback (
+                id {id_type},
+                user_name {text_type} NOT NULL,
+                rating INTEGER NOT NULL,
+                comment {text_type},
+                timestamp TIMESTAMP {timestamp_default}
+            )
+        ''')
+        
+        # Wait list table
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS waitlist (
+                id {id_type},
+                user_name {text_type} NOT NULL,
+                user_phone {text_type} NOT NULL,
+                user_email {text_type},
+                car_type {text_type} NOT NULL,
+                requested_time TIMESTAMP {timestamp_default},
+                status {text_type} DEFAULT 'waiting'
+            )
+        ''')
+        
+        # Favorites table
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS favorites (
+                id {id_type},
+                user_phone {text_type} NOT NULL,
+                location {text_type} NOT NULL,
+                timestamp TIMESTAMP {timestamp_default}
+            )
+        ''')
+        
+        # Analytics table for tracking occupancy
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS occupancy_stats (
+                id {id_type},
+                timestamp TIMESTAMP {timestamp_default},
+                total_spots INTEGER,
+                occupied_spots INTEGER,
+                available_spots INTEGER,
+                reserved_spots INTEGER
+            )
+        ''')
+        
+        conn.commit()
+        
+        # Indexes and later schema changes
+        run_migrations(conn, USE_POSTGRES)
     
     db_location = DATABASE_URL if USE_POSTGRES else DATABASE
     print(f"Database initialized successfully at: {db_location}")
 
 def initialize_spots(spot_positions):
     """Initialize all parking spots with labels A1-C23"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Check if spots already exist
-    cursor.execute('SELECT COUNT(*) FROM spots')
-    count = cursor.fetchone()[0]
-    
-    if count == 0:
-        # Sort positions by x coordinate then y to create columns
-        sorted_positions = sorted(spot_positions, key=lambda p: (p[0], p[1]))
-        
-        # Divide into 3 columns (approximately)
-        spots_per_column = len(sorted_positions) // 3
-        
-        labels = []
-        for i, pos in enumerate(sorted_positions):
-            if i < spots_per_column:
-                label = f"A{i+1}"
-            elif i < spots_per_column * 2:
-                label = f"B{i-spots_per_column+1}"
-            else:
-                label = f"C{i-spots_per_column*2+1}"
-            
-            query = f'''
-                INSERT INTO spots (spot_label, x, y, width, height, status)
-                VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, 'available')
-            '''
-            cursor.execute(query, (label, pos[0], pos[1], 103, 43))
-            labels.append(label)
+    with db_connection() as conn:
+        cursor = conn.cursor()
         
-        conn.commit()
-        print(f"Initialized {len(sorted_positions)} parking spots")
-    
-    conn.close()
+        # Check if spots already exist
+        cursor.execute('SELECT COUNT(*) FROM spots')
+        count = cursor.fetchone()[0]
+        
+        if count == 0:
+            # Sort positions by x coordinate then y to create columns
+            sorted_positions = sorted(spot_positions, key=lambda p: (p[0], p[1]))
+            
+            # Divide into 3 columns (approximately)
+            spots_per_column = len(sorted_positions) // 3
+            
+            labels = []
+            for i, pos in enumerate(sorted_positions):
+                if i < spots_per_column:
+                    label = f"A{i+1}"
+                elif i < spots_per_column * 2:
+                    label = f"B{i-spots_per_column+1}"
+                else:
+                    label = f"C{i-spots_per_column*2+1}"
+                
+                query = f'''
+                    INSERT INTO spots (spot_label, x, y, width, height, status)
+                    VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, 'available')
+                '''
+                cursor.execute(query, (label, pos[0], pos[1], 103, 43))
+                labels.append(label)
+            
+            conn.commit()
+            print(f"Initialized {len(sorted_positions)} parking spots")
 
 def update_spot_status(spot_label, status):
     """Update the status of a parking spot"""
-    conn = get_db()
-    cursor = conn.cursor()
-    query = f'''
-        UPDATE spots 
-        SET status = {PARAM_PLACEHOLDER}, last_updated = CURRENT_TIMESTAMP
-        WHERE spot_label = {PARAM_PLACEHOLDER}
-    '''
-    cursor.execute(query, (status, spot_label))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = f'''
+            UPDATE spots 
+            SET status = {PARAM_PLACEHOLDER}, last_updated = CURRENT_TIMESTAMP
+            WHERE spot_label = {PARAM_PLACEHOLDER}
+        '''
+        cursor.execute(query, (status, spot_label))
+        conn.commit()
+    _notify_spot_change(spot_label, status)
+
+def update_spot_statuses(changes):
+    """Update several spots in one transaction from (spot_label, status, seen) triples
+
+    A spot is only written while its status is still seen, the status the
+    caller decided from (None writes unconditionally), so a detector working
+    from a cached status cannot overwrite a reservation made since. A spot
+    becoming available while an active booking holds it (the booking started
+    while another car was still parked there) is reserved instead. Returns
+    the (spot_label, status) pairs that were written.
+    """
+    if not changes:
+        return []
+    
+    written = []
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        # Rolled back when the connection is returned if this raises
+        for spot_label, status, seen in changes:
+            if status == 'available':
+                query = f'''
+                    SELECT 1 FROM bookings WHERE spot_label = {PARAM_PLACEHOLDER} AND status = 'active' LIMIT 1
+                '''
+                cursor.execute(query, (spot_label,))
+                if cursor.fetchone() is not None:
+                    status = 'reserved'
+            if seen is None:
+                cursor.execute(f'''
+                    UPDATE spots 
+                    SET status = {PARAM_PLACEHOLDER}, last_updated = CURRENT_TIMESTAMP
+                    WHERE spot_label = {PARAM_PLACEHOLDER}
+                ''', (status, spot_label))
+            else:
+                cursor.execute(f'''
+                    UPDATE spots 
+                    SET status = {PARAM_PLACEHOLDER}, last_updated = CURRENT_TIMESTAMP
+                    WHERE spot_label = {PARAM_PLACEHOLDER} AND status = {PARAM_PLACEHOLDER}
+                ''', (status, spot_label, seen))
+            if cursor.rowcount == 1:
+                written.append((spot_label, status))
+        conn.commit()
+    
+    for spot_label, status in written:
+        _notify_spot_change(spot_label, status)
+    return written
 
 def get_all_spots():
     """Get all parking spots"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM spots ORDER BY spot_label')
-    spots = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM spots ORDER BY spot_label')
+        spots = cursor.fetchall()
     
     if USE_POSTGRES:
         columns = ['id', 'spot_label', 'x', 'y', 'width', 'height', 'status', 'location', 'last_updated']
@@ -219,23 +357,34 @@ def get_all_spots():
     else:
         return [dict(spot) for spot in spots]
 
+def get_spot_statuses(since=None):
+    """Get (spot_label, status, last_updated) rows, optionally only those changed since a timestamp"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if since is None:
+            cursor.execute('SELECT spot_label, status, last_updated FROM spots')
+        else:
+            # Inclusive so changes made within the same second are not missed
+            query = f'SELECT spot_label, status, last_updated FROM spots WHERE last_updated >= {PARAM_PLACEHOLDER}'
+            cursor.execute(query, (since,))
+        rows = cursor.fetchall()
+    return [tuple(row) for row in rows]
+
 def get_available_spots_count():
     """Get count of available spots"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM spots WHERE status = 'available'")
-    count = cursor.fetchone()[0]
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM spots WHERE status = 'available'")
+        count = cursor.fetchone()[0]
     return count
 
 def get_spot_by_label(spot_label):
     """Get a specific spot by its label"""
-    conn = get_db()
-    cursor = conn.cursor()
-    query = f'SELECT * FROM spots WHERE spot_label = {PARAM_PLACEHOLDER}'
-    cursor.execute(query, (spot_label,))
-    spot = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = f'SELECT * FROM spots WHERE spot_label = {PARAM_PLACEHOLDER}'
+        cursor.execute(query, (spot_label,))
+        spot = cursor.fetchone()
     
     if spot:
         if USE_POSTGRES:
@@ -245,252 +394,729 @@ def get_spot_by_label(spot_label):
             return dict(spot)
     return None
 
+# Bookings are released when nobody has parked this long after the arrival time
+GRACE_PERIOD = timedelta(minutes=10)
+# Bookings starting sooner than this reserve the spot straight away; later ones are scheduled
+RESERVE_AHEAD = timedelta(minutes=15)
+# Booking statuses that hold a spot for their time window
+HOLDING_STATUSES = ('scheduled', 'active', 'parked')
+
+def parse_timestamp(value):
+    """datetime from a stored or submitted timestamp (datetime, ISO string); None if unparseable"""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            # fromisoformat() only accepts a trailing Z from Python 3.11 on
+            parsed = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def _lock_spot(cursor, spot_label):
+    """Serialize bookings of one spot until the transaction ends"""
+    if USE_POSTGRES:
+        cursor.execute('SELECT id FROM spots WHERE spot_label = %s FOR UPDATE', (spot_label,))
+    elif not cursor.connection.in_transaction:
+        # SQLite allows one writer at a time; take the write lock before checking for overlaps
+        cursor.execute('BEGIN IMMEDIATE')
+
+def _find_overlap(cursor, spot_label, start, end):
+    """Id of a booking holding the spot at some point in [start, end), or None"""
+    statuses = ', '.join(f"'{status}'" for status in HOLDING_STATUSES)
+    query = f'''
+        SELECT id FROM bookings
+        WHERE spot_label = {PARAM_PLACEHOLDER} AND status IN ({statuses})
+          AND arrival_time < {PARAM_PLACEHOLDER} AND end_time > {PARAM_PLACEHOLDER}
+        LIMIT 1
+    '''
+    cursor.execute(query, (spot_label, end, start))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
 def create_booking(spot_label, user_name, user_phone, user_email, car_type, arrival_time, duration):
-    """Create a new booking"""
-    conn = get_db()
-    cursor = conn.cursor()
+    """Book a spot for arrival_time + duration hours; raises SpotUnavailableError if it is taken
+
+    A booking starting within RESERVE_AHEAD needs the spot free now and
+    reserves it at once. A later one is 'scheduled' and only has to avoid
+    other bookings' windows; the spot is reserved when its start comes up.
+    """
+    arrival = parse_timestamp(arrival_time)
+    if arrival is None:
+        raise ValueError(f"Invalid arrival time: {arrival_time}")
+    end_time = arrival + timedelta(hours=int(duration))
+    immediate = arrival <= datetime.now() + RESERVE_AHEAD
+    status = 'active' if immediate else 'scheduled'
     
-    try:
-        # Create booking
-        query = f'''
-            INSERT INTO bookings (spot_label, user_name, user_phone, user_email, car_type, arrival_time, duration)
-            VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
-        '''
-        cursor.execute(query, (spot_label, user_name, user_phone, user_email, car_type, arrival_time, duration))
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        _lock_spot(cursor, spot_label)
         
-        # Update spot status to reserved
+        if _find_overlap(cursor, spot_label, arrival, end_time) is not None:
+            conn.rollback()
+            raise SpotUnavailableError(f"Spot {spot_label} is already booked for that time")
+        
+        if immediate:
+            # Claim the spot only if it is still available; of two concurrent
+            # bookings for the same spot, exactly one matches this row
+            query = f'''
+                UPDATE spots SET status = 'reserved', last_updated = CURRENT_TIMESTAMP
+                WHERE spot_label = {PARAM_PLACEHOLDER} AND status = 'available'
+            '''
+            cursor.execute(query, (spot_label,))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                raise SpotUnavailableError(f"Spot {spot_label} is not available")
+        
+        # Create booking; the spot is released if nobody arrives within the grace period
         query = f'''
-            UPDATE spots SET status = 'reserved', last_updated = CURRENT_TIMESTAMP
-            WHERE spot_label = {PARAM_PLACEHOLDER}
+            INSERT INTO bookings (spot_label, user_name, user_phone, user_email, car_type, arrival_time, duration,
+                                  status, grace_period_end, end_time)
+            VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER},
+                    {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
         '''
-        cursor.execute(query, (spot_label,))
+        cursor.execute(query, (spot_label, user_name, user_phone, user_email, car_type, arrival, duration,
+                               status, arrival + GRACE_PERIOD, end_time))
+        
+        # Read the id before the log insert below replaces it
+        if USE_POSTGRES:
+            cursor.execute('SELECT lastval()')
+            booking_id = cursor.fetchone()[0]
+        else:
+            booking_id = cursor.lastrowid
         
         # Log the booking
         query = f'''
             INSERT INTO parking_logs (spot_label, action, user_name, details)
             VALUES ({PARAM_PLACEHOLDER}, 'booked', {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
         '''
-        cursor.execute(query, (spot_label, user_name, f"Reserved for {duration} hours"))
+        cursor.execute(query, (spot_label, user_name, f"Reserved for {duration} hours from {arrival:%Y-%m-%d %H:%M}"))
         
         conn.commit()
-        
-        if USE_POSTGRES:
-            cursor.execute('SELECT lastval()')
-            booking_id = cursor.fetchone()[0]
-        else:
-            booking_id = cursor.lastrowid
-            
-        conn.close()
-        return booking_id
-    except Exception as e:
-        conn.rollback()
-        conn.close()
-        raise e
-
-def get_active_bookings():
-    """Get all active bookings - shows real bookings + occupied spots with random data"""
-    import random
-    from datetime import datetime, timedelta
     
-    conn = get_db()
-    cursor = conn.cursor()
+    if immediate:
+        _notify_spot_change(spot_label, 'reserved')
+    _notify_booking_change(booking_id, spot_label, arrival, end_time, status)
+    return booking_id
+
+def get_active_bookings(limit=50, after=None, spot_status=None, search=None):
+    """One page of taken (occupied or reserved) spots with the booking holding each, in lot order
+
+    Returns (bookings, next_after); pass next_after back as after for the
+    next page, None means this was the last. Spots taken without a booking
+    (walk-ins) have booking_id None. spot_status limits the page to
+    'occupied' or 'reserved' spots; search matches the spot label, user
+    name or phone.
+    """
+    # Not an IN list: walking the spots in id order lets the query stop after one page
+    conditions = ["s.status <> 'available'"]
+    params = []
+    if spot_status in ('occupied', 'reserved'):
+        conditions.append(f's.status = {PARAM_PLACEHOLDER}')
+        params.append(spot_status)
+    if search:
+        conditions.append(f'(s.spot_label = {PARAM_PLACEHOLDER} OR b.user_name LIKE {PARAM_PLACEHOLDER} '
+                          f'OR b.user_phone LIKE {PARAM_PLACEHOLDER})')
+        params.extend([search.upper(), f'%{search}%', f'{search}%'])
+    if after is not None:
+        conditions.append(f's.id > {PARAM_PLACEHOLDER}')
+        params.append(after)
+    
+    # The earliest booking holding the spot is the one whose window is current
+    query = f'''
+        SELECT s.id, s.spot_label, s.status, b.id, b.user_name, b.user_phone, b.car_type,
+               b.arrival_time, b.duration, b.status
+        FROM spots s
+        LEFT JOIN bookings b ON b.id = (
+            SELECT id FROM bookings
+            WHERE spot_label = s.spot_label AND status IN ('active', 'parked')
+            ORDER BY arrival_time LIMIT 1
+        )
+        WHERE {' AND '.join(conditions)}
+        ORDER BY s.id
+        LIMIT {PARAM_PLACEHOLDER}
+    '''
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params + [limit + 1])
+        rows = cursor.fetchall()
     
-    # Get real active bookings
-    cursor.execute('''
-        SELECT * FROM bookings 
-        WHERE status = 'active' 
-        ORDER BY arrival_time DESC
-    ''')
-    real_bookings = cursor.fetchall()
+    bookings = [{
+        'spot_id': row[0],
+        'spot_label': row[1],
+        'spot_status': row[2],
+        'booking_id': row[3],
+        'user_name': row[4],
+        'user_phone': row[5],
+        'car_type': row[6],
+        'arrival_time': parse_timestamp(row[7]) if row[7] else None,
+        'duration': row[8],
+        'status': row[9],
+    } for row in rows[:limit]]
+    next_after = bookings[-1]['spot_id'] if len(rows) > limit else None
+    return bookings, next_after
+
+def get_user_bookings(user_phone):
+    """Every booking made with a phone number, newest first"""
+    query = f'''
+        SELECT id, spot_label, user_name, user_phone, car_type, arrival_time, duration, booking_time, status
+        FROM bookings
+        WHERE user_phone = {PARAM_PLACEHOLDER}
+        ORDER BY booking_time DESC
+    '''
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, (user_phone,))
+        rows = cursor.fetchall()
     
-    if USE_POSTGRES:
-        booking_columns = ['id', 'spot_label', 'user_name', 'user_phone', 'user_email', 'car_type', 'arrival_time', 'duration', 'booking_time', 'status', 'grace_period_end']
-        bookings_dict = {dict(zip(booking_columns, b))['spot_label']: dict(zip(booking_columns, b)) for b in real_bookings}
-    else:
-        bookings_dict = {dict(b)['spot_label']: dict(b) for b in real_bookings}
+    columns = ['id', 'spot_label', 'user_name', 'user_phone', 'car_type', 'arrival_time', 'duration',
+               'booking_time', 'status']
+    bookings = [dict(zip(columns, row)) for row in rows]
+    for booking in bookings:
+        booking['status'] = booking['status'] or 'active'
+    return bookings
+
+def cancel_booking(booking_id):
+    """Cancel an active or scheduled booking; returns False if it was neither"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Only the first of several concurrent cancels matches the booking row. The
+        # status is part of the match so that a booking activated meanwhile is re-read
+        while True:
+            query = f'SELECT spot_label, user_name, status FROM bookings WHERE id = {PARAM_PLACEHOLDER}'
+            cursor.execute(query, (booking_id,))
+            row = cursor.fetchone()
+            if row is None or row[2] not in ('active', 'scheduled'):
+                conn.rollback()
+                return False
+            spot_label, user_name, status = row
+            query = f'''
+                UPDATE bookings SET status = 'cancelled'
+                WHERE id = {PARAM_PLACEHOLDER} AND status = {PARAM_PLACEHOLDER}
+            '''
+            cursor.execute(query, (booking_id, status))
+            if cursor.rowcount == 1:
+                break
+        
+        # A scheduled booking never reserved the spot, and another booking of the
+        # spot may hold the reservation now; free it only if neither is the case
+        released = False
+        if status == 'active':
+            query = f'''
+                UPDATE spots SET status = 'available', last_updated = CURRENT_TIMESTAMP
+                WHERE spot_label = {PARAM_PLACEHOLDER} AND status = 'reserved'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM bookings WHERE spot_label = {PARAM_PLACEHOLDER} AND status = 'active'
+                  )
+            '''
+            cursor.execute(query, (spot_label, spot_label))
+            released = cursor.rowcount == 1
+        
+        # Log the cancellation
+        query = f'''
+            INSERT INTO parking_logs (spot_label, action, user_name, details)
+            VALUES ({PARAM_PLACEHOLDER}, 'cancelled', {PARAM_PLACEHOLDER}, 'Booking cancelled by user')
+        '''
+        cursor.execute(query, (spot_label, user_name))
+        
+        conn.commit()
+    
+    if released:
+        _notify_spot_change(spot_label, 'available')
+    _notify_booking_change(booking_id, spot_label, None, None, 'cancelled')
+    return True
+
+def get_booking_deadlines():
+    """(booking_id, start, grace_period_end, end) for every booking still holding a spot
+
+    start is only set for scheduled bookings (when their spot should be
+    reserved) and grace_period_end is None once the car has parked.
+    """
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, arrival_time, duration, status, grace_period_end FROM bookings
+            WHERE status IN ('scheduled', 'active', 'parked')
+        ''')
+        rows = cursor.fetchall()
     
-    # Get all occupied spots
-    cursor.execute('''
-        SELECT spot_label FROM spots 
-        WHERE status = 'occupied'
-    ''')
-    occupied_spots = cursor.fetchall()
-    conn.close()
+    deadlines = []
+    for booking_id, arrival_time, duration, status, grace_period_end in rows:
+        arrival = parse_timestamp(arrival_time)
+        if arrival is None:
+            continue
+        start = arrival - RESERVE_AHEAD if status == 'scheduled' else None
+        grace = None
+        if status != 'parked':
+            grace = parse_timestamp(grace_period_end) if grace_period_end else None
+            grace = grace or arrival + GRACE_PERIOD
+        deadlines.append((booking_id, start, grace, arrival + timedelta(hours=duration)))
+    return deadlines
+
+def get_booking_intervals():
+    """(booking_id, spot_label, start, end) for every booking holding a spot now or later"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = f'''
+            SELECT id, spot_label, arrival_time, end_time FROM bookings
+            WHERE status IN ('scheduled', 'active', 'parked') AND end_time > {PARAM_PLACEHOLDER}
+        '''
+        cursor.execute(query, (datetime.now(),))
+        rows = cursor.fetchall()
+    return [(booking_id, spot_label, parse_timestamp(start), parse_timestamp(end))
+            for booking_id, spot_label, start, end in rows]
+
+def activate_scheduled_bookings(booking_ids):
+    """Reserve the spots of scheduled bookings whose start has come; returns the spots reserved
+
+    A spot that is still occupied is left alone; the booking is active
+    regardless, so nobody else can book over it, and update_spot_statuses()
+    reserves the spot once the car in it leaves.
+    """
+    if not booking_ids:
+        return []
     
-    # Random data pools for generating fake bookings
-    names = ['Ali Khan', 'Sara Ahmed', 'Hassan Malik', 'Fatima Noor', 'Usman Shah', 
-             'Ayesha Iqbal', 'Bilal Raza', 'Zainab Ali', 'Ahmed Hussain', 'Maryam Siddiq',
-             'Kamran Abbas', 'Hira Farooq', 'Imran Yousaf', 'Nida Rasheed', 'Faisal Tariq']
-    car_types = ['Sedan', 'SUV', 'Hatchback', 'Pickup', 'Coupe']
+    reserved = []
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for booking_id in booking_ids:
+            query = f'''
+                UPDATE bookings SET status = 'active'
+                WHERE id = {PARAM_PLACEHOLDER} AND status = 'scheduled'
+            '''
+            cursor.execute(query, (booking_id,))
+            if cursor.rowcount != 1:
+                continue
+            query = f'SELECT spot_label FROM bookings WHERE id = {PARAM_PLACEHOLDER}'
+            cursor.execute(query, (booking_id,))
+            spot_label = cursor.fetchone()[0]
+            query = f'''
+                UPDATE spots SET status = 'reserved', last_updated = CURRENT_TIMESTAMP
+                WHERE spot_label = {PARAM_PLACEHOLDER} AND status = 'available'
+            '''
+            cursor.execute(query, (spot_label,))
+            if cursor.rowcount == 1:
+                reserved.append(spot_label)
+        conn.commit()
     
-    result_bookings = []
+    for spot_label in reserved:
+        _notify_spot_change(spot_label, 'reserved')
+    return reserved
+
+def release_expired_bookings(expired):
+    """Close due bookings in one transaction from (booking_id, kind) pairs; returns the spots freed
+
+    kind 'grace' expires a booking nobody arrived for; 'end' completes it at
+    the end of its duration. Bookings that were cancelled or checked in
+    meanwhile no longer match and are left alone.
+    """
+    if not expired:
+        return []
     
-    # Add all occupied spots to the bookings list
-    for spot in occupied_spots:
-        spot_label = spot[0]
-        
-        # If spot has real booking, use it
-        if spot_label in bookings_dict:
-            result_bookings.append(bookings_dict[spot_label])
-        else:
-            # Generate random booking data for occupied spots without bookings
-            arrival_time = datetime.now() - timedelta(hours=random.randint(1, 6))
-            result_bookings.append({
-                'id': random.randint(10000, 99999),
-                'spot_label': spot_label,
-                'user_name': random.choice(names),
-                'user_phone': f'03{random.randint(100000000, 999999999)}',
-                'car_type': random.choice(car_types),
-                'arrival_time': arrival_time.strftime('%H:%M'),
-                'duration': random.randint(2, 8),
-                'status': 'active'
-            })
+    released = []
+    closed = []
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for booking_id, kind in expired:
+            if kind == 'grace':
+                query = f'''
+                    UPDATE bookings SET status = 'expired'
+                    WHERE id = {PARAM_PLACEHOLDER} AND status = 'active'
+                '''
+                details = 'No arrival within the grace period'
+            else:
+                query = f'''
+                    UPDATE bookings SET status = 'completed'
+                    WHERE id = {PARAM_PLACEHOLDER} AND status IN ('active', 'parked')
+                '''
+                details = 'Booking time ended'
+            cursor.execute(query, (booking_id,))
+            if cursor.rowcount != 1:
+                continue
+            
+            query = f'SELECT spot_label, user_name FROM bookings WHERE id = {PARAM_PLACEHOLDER}'
+            cursor.execute(query, (booking_id,))
+            spot_label, user_name = cursor.fetchone()
+            
+            # A parked car keeps its spot occupied until the detector sees it leave, and
+            # the next booking of the spot may already hold the reservation
+            query = f'''
+                UPDATE spots SET status = 'available', last_updated = CURRENT_TIMESTAMP
+                WHERE spot_label = {PARAM_PLACEHOLDER} AND status = 'reserved'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM bookings WHERE spot_label = {PARAM_PLACEHOLDER} AND status = 'active'
+                  )
+            '''
+            cursor.execute(query, (spot_label, spot_label))
+            if cursor.rowcount == 1:
+                released.append(spot_label)
+            closed.append((booking_id, spot_label, 'expired' if kind == 'grace' else 'completed'))
+            
+            query = f'''
+                INSERT INTO parking_logs (spot_label, action, user_name, details)
+                VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
+            '''
+            cursor.execute(query, (spot_label, 'expired' if kind == 'grace' else 'completed', user_name, details))
+        conn.commit()
     
-    return result_bookings
+    for spot_label in released:
+        _notify_spot_change(spot_label, 'available')
+    for booking_id, spot_label, status in closed:
+        _notify_booking_change(booking_id, spot_label, None, None, status)
+    return released
 
-def cancel_booking(booking_id):
-    """Cancel a booking"""
-    conn = get_db()
-    cursor = conn.cursor()
+def check_in_spots(spot_labels):
+    """Mark reserved spots the detector sees a car in as occupied, and their bookings as parked"""
+    if not spot_labels:
+        return []
     
-    # Get booking details
-    query = f'SELECT * FROM bookings WHERE id = {PARAM_PLACEHOLDER}'
-    cursor.execute(query, (booking_id,))
-    booking = cursor.fetchone()
+    checked_in = []
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for spot_label in spot_labels:
+            query = f'''
+                UPDATE spots SET status = 'occupied', last_updated = CURRENT_TIMESTAMP
+                WHERE spot_label = {PARAM_PLACEHOLDER} AND status = 'reserved'
+            '''
+            cursor.execute(query, (spot_label,))
+            if cursor.rowcount != 1:
+                continue
+            # The earliest active booking is the one whose window has started
+            query = f'''
+                UPDATE bookings SET status = 'parked'
+                WHERE id = (
+                    SELECT id FROM bookings WHERE spot_label = {PARAM_PLACEHOLDER} AND status = 'active'
+                    ORDER BY arrival_time LIMIT 1
+                )
+            '''
+            cursor.execute(query, (spot_label,))
+            checked_in.append(spot_label)
+        conn.commit()
     
-    if booking:
-        # Update booking status
+    for spot_label in checked_in:
+        _notify_spot_change(spot_label, 'occupied')
+    return checked_in
+
+# Email outbox: messages are queued here and delivered by mailer.py
+def enqueue_email(to_email, subject, body):
+    """Queue an email for the background sender; returns the outbox id"""
+    now = datetime.now()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = f'''
+            INSERT INTO email_outbox (to_email, subject, body, status, next_attempt_at, created_at)
+            VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, 'pending', {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
+        '''
+        cursor.execute(query, (to_email, subject, body, now, now))
+        if USE_POSTGRES:
+            cursor.execute('SELECT lastval()')
+            outbox_id = cursor.fetchone()[0]
+        else:
+            outbox_id = cursor.lastrowid
+        conn.commit()
+    return outbox_id
+
+def claim_emails(claim_id, limit, lease_seconds):
+    """Claim up to limit due emails for one sender; returns (id, to_email, subject, body, attempts) rows
+
+    A claimed email is not due again until its lease runs out, so a sender
+    that dies mid-batch only delays those emails.
+    """
+    now = datetime.now()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = f'''
+            SELECT id FROM email_outbox
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= {PARAM_PLACEHOLDER}
+            ORDER BY next_attempt_at
+            LIMIT {PARAM_PLACEHOLDER}
+        '''
+        cursor.execute(query, (now, limit))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return []
+        
+        # Another sender may claim the same rows; the due check lets only one of them win each row
+        id_list = ', '.join([PARAM_PLACEHOLDER] * len(ids))
+        query = f'''
+            UPDATE email_outbox SET status = 'sending', claimed_by = {PARAM_PLACEHOLDER}, next_attempt_at = {PARAM_PLACEHOLDER}
+            WHERE id IN ({id_list}) AND status IN ('pending', 'sending') AND next_attempt_at <= {PARAM_PLACEHOLDER}
+        '''
+        cursor.execute(query, [claim_id, now + timedelta(seconds=lease_seconds)] + ids + [now])
+        query = f'''
+            SELECT id, to_email, subject, body, attempts FROM email_outbox
+            WHERE claimed_by = {PARAM_PLACEHOLDER} AND status = 'sending'
+            ORDER BY id
+        '''
+        cursor.execute(query, (claim_id,))
+        emails = [tuple(row) for row in cursor.fetchall()]
+        conn.commit()
+    return emails
+
+def mark_emails_sent(outbox_ids):
+    """Record delivered emails"""
+    if not outbox_ids:
+        return
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        id_list = ', '.join([PARAM_PLACEHOLDER] * len(outbox_ids))
         query = f'''
-            UPDATE bookings SET status = 'cancelled'
+            UPDATE email_outbox SET status = 'sent', attempts = attempts + 1, sent_at = {PARAM_PLACEHOLDER},
+                claimed_by = NULL, last_error = NULL
+            WHERE id IN ({id_list})
+        '''
+        cursor.execute(query, [datetime.now()] + list(outbox_ids))
+        conn.commit()
+
+def mark_email_failed(outbox_id, error, retry_at=None):
+    """Record a failed attempt; retried at retry_at, or given up on when retry_at is None"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = f'''
+            UPDATE email_outbox SET status = {PARAM_PLACEHOLDER}, attempts = attempts + 1,
+                next_attempt_at = {PARAM_PLACEHOLDER}, claimed_by = NULL, last_error = {PARAM_PLACEHOLDER}
             WHERE id = {PARAM_PLACEHOLDER}
         '''
-        cursor.execute(query, (booking_id,))
+        status = 'pending' if retry_at is not None else 'failed'
+        cursor.execute(query, (status, retry_at, str(error)[:500], outbox_id))
+        conn.commit()
+
+def get_outbox_stats():
+    """Outbox depth: email counts by status and the age of the oldest unsent email"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) FROM email_outbox GROUP BY status')
+        counts = {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.execute("SELECT MIN(created_at) FROM email_outbox WHERE status IN ('pending', 'sending')")
+        oldest = cursor.fetchone()[0]
+    
+    if isinstance(oldest, str):
+        oldest = datetime.fromisoformat(oldest)
+    stats = {status: counts.get(status, 0) for status in ('pending', 'sending', 'sent', 'failed')}
+    stats['oldest_unsent_seconds'] = round((datetime.now() - oldest).total_seconds(), 1) if oldest else 0.0
+    return stats
+
+def add_to_waitlist(user_name, user_phone, user_email, car_type, requested_time=None):
+    """Add user to waitlist; returns the waitlist id"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = f'''
+            INSERT INTO waitlist (user_name, user_phone, user_email, car_type, requested_time)
+            VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
+        '''
+        cursor.execute(query, (user_name, user_phone, user_email, car_type, requested_time or datetime.now()))
+        if USE_POSTGRES:
+            cursor.execute('SELECT lastval()')
+            waitlist_id = cursor.fetchone()[0]
+        else:
+            waitlist_id = cursor.lastrowid
+        conn.commit()
+    return waitlist_id
+
+def get_waiting_entries():
+    """(waitlist_id, car_type, requested_time) for everyone still waiting"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, car_type, requested_time FROM waitlist WHERE status = 'waiting'")
+        rows = cursor.fetchall()
+    return [(waitlist_id, car_type, parse_timestamp(requested_time) or datetime.min)
+            for waitlist_id, car_type, requested_time in rows]
+
+def assign_waitlist_spot(waitlist_id, spot_label, duration, min_duration=1):
+    """Book a freed spot for a waiting user in one transaction; returns the booking dict
+
+    If the spot is booked again within duration hours, the user gets the
+    whole hours up to that booking instead. Raises SpotBookedAheadError if
+    that leaves less than min_duration hours, SpotUnavailableError if the
+    spot was taken first, and returns None if the user is no longer waiting;
+    nothing is changed in any of these cases.
+    """
+    now = datetime.now()
+    statuses = ', '.join(f"'{status}'" for status in HOLDING_STATUSES)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        _lock_spot(cursor, spot_label)
+        
+        query = f'''
+            UPDATE spots SET status = 'reserved', last_updated = CURRENT_TIMESTAMP
+            WHERE spot_label = {PARAM_PLACEHOLDER} AND status = 'available'
+        '''
+        cursor.execute(query, (spot_label,))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            raise SpotUnavailableError(f"Spot {spot_label} is not available")
         
-        # Update spot status back to available
+        # Start of the next booking still to come on this spot, if any
         query = f'''
-            UPDATE spots SET status = 'available', last_updated = CURRENT_TIMESTAMP
-            WHERE spot_label = {PARAM_PLACEHOLDER}
+            SELECT MIN(arrival_time) FROM bookings
+            WHERE spot_label = {PARAM_PLACEHOLDER} AND status IN ({statuses}) AND end_time > {PARAM_PLACEHOLDER}
         '''
-        cursor.execute(query, (booking_dict['spot_label'],))
+        cursor.execute(query, (spot_label, now))
+        next_start = parse_timestamp(cursor.fetchone()[0])
+        if next_start is not None:
+            if next_start <= now:
+                conn.rollback()
+                raise SpotUnavailableError(f"Spot {spot_label} is not available")
+            duration = min(duration, int((next_start - now) / timedelta(hours=1)))
+            if duration < min_duration:
+                conn.rollback()
+                raise SpotBookedAheadError(f"Spot {spot_label} is booked again at {next_start:%H:%M}")
+        end_time = now + timedelta(hours=duration)
         
-        # Log the cancellation
+        query = f'''
+            UPDATE waitlist SET status = 'assigned'
+            WHERE id = {PARAM_PLACEHOLDER} AND status = 'waiting'
+        '''
+        cursor.execute(query, (waitlist_id,))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return None
+        
+        query = f'SELECT user_name, user_phone, user_email, car_type FROM waitlist WHERE id = {PARAM_PLACEHOLDER}'
+        cursor.execute(query, (waitlist_id,))
+        user_name, user_phone, user_email, car_type = cursor.fetchone()
+        
+        # The user has the usual grace period from now to get to the spot
+        query = f'''
+            INSERT INTO bookings (spot_label, user_name, user_phone, user_email, car_type, arrival_time, duration,
+                                  grace_period_end, end_time)
+            VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER},
+                    {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
+        '''
+        cursor.execute(query, (spot_label, user_name, user_phone, user_email, car_type, now, duration,
+                               now + GRACE_PERIOD, end_time))
         if USE_POSTGRES:
-            booking_columns = ['id', 'spot_label', 'user_name', 'user_phone', 'user_email', 'car_type', 'arrival_time', 'duration', 'booking_time', 'status', 'grace_period_end']
-            booking_dict = dict(zip(booking_columns, booking))
+            cursor.execute('SELECT lastval()')
+            booking_id = cursor.fetchone()[0]
         else:
-            booking_dict = dict(booking)
+            booking_id = cursor.lastrowid
         
         query = f'''
             INSERT INTO parking_logs (spot_label, action, user_name, details)
-            VALUES ({PARAM_PLACEHOLDER}, 'cancelled', {PARAM_PLACEHOLDER}, 'Booking cancelled by user')
+            VALUES ({PARAM_PLACEHOLDER}, 'booked', {PARAM_PLACEHOLDER}, 'Assigned from waitlist')
         '''
-        cursor.execute(query, (booking_dict['spot_label'], booking_dict['user_name']))
+        cursor.execute(query, (spot_label, user_name))
         
         conn.commit()
     
-    conn.close()
-
-def add_to_waitlist(user_name, user_phone, user_email, car_type):
-    """Add user to waitlist"""
-    conn = get_db()
-    cursor = conn.cursor()
-    query = f'''
-        INSERT INTO waitlist (user_name, user_phone, user_email, car_type)
-        VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
-    '''
-    cursor.execute(query, (user_name, user_phone, user_email, car_type))
-    conn.commit()
-    conn.close()
+    _notify_spot_change(spot_label, 'reserved')
+    _notify_booking_change(booking_id, spot_label, now, end_time, 'active')
+    return {
+        'id': booking_id,
+        'spot_label': spot_label,
+        'user_name': user_name,
+        'user_phone': user_phone,
+        'user_email': user_email,
+        'car_type': car_type,
+        'arrival_time': now,
+        'duration': duration,
+    }
 
 def add_feedback(user_name, rating, comment):
     """Add user feedback"""
-    conn = get_db()
-    cursor = conn.cursor()
-    query = f'''
-        INSERT INTO feedback (user_name, rating, comment)
-        VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
-    '''
-    cursor.execute(query, (user_name, rating, comment))
-    conn.commit()
-    conn.close()
-
-def get_all_feedback():
-    """Get all feedback"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM feedback ORDER BY timestamp DESC')
-    feedback = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = f'''
+            INSERT INTO feedback (user_name, rating, comment)
+            VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
+        '''
+        cursor.execute(query, (user_name, rating, comment))
+        conn.commit()
+
+def format_cursor(timestamp, row_id):
+    """Opaque page cursor for a (timestamp, id) position"""
+    return f"{timestamp}|{row_id}"
+
+def parse_cursor(cursor):
+    """(timestamp, id) from format_cursor(); raises ValueError if malformed"""
+    timestamp, _, row_id = cursor.rpartition('|')
+    if not timestamp:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return timestamp, int(row_id)
+
+def _newest_first(table, columns, limit, before=None):
+    """One page of rows newest first, keyset on (timestamp, id); returns (rows, next_before)
+
+    Each page is an index range scan starting at the cursor, so a page
+    deep into a large table costs the same as the first one.
+    """
+    query = f'SELECT {", ".join(columns)} FROM {table}'
+    params = []
+    if before is not None:
+        query += f' WHERE (timestamp, id) < ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})'
+        params.extend(before)
+    query += f' ORDER BY timestamp DESC, id DESC LIMIT {PARAM_PLACEHOLDER}'
+    params.append(limit + 1)
     
-    if USE_POSTGRES:
-        columns = ['id', 'user_name', 'rating', 'comment', 'timestamp']
-        return [dict(zip(columns, f)) for f in feedback]
-    else:
-        return [dict(f) for f in feedback]
-
-def get_parking_logs(limit=100):
-    """Get recent parking logs"""
-    conn = get_db()
-    cursor = conn.cursor()
-    query = f'SELECT * FROM parking_logs ORDER BY timestamp DESC LIMIT {PARAM_PLACEHOLDER}'
-    cursor.execute(query, (limit,))
-    logs = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
     
-    if USE_POSTGRES:
-        columns = ['id', 'spot_label', 'action', 'user_name', 'timestamp', 'details']
-        return [dict(zip(columns, log)) for log in logs]
-    else:
-        return [dict(log) for log in logs]
+    next_before = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_before = (rows[-1]['timestamp'], rows[-1]['id'])
+    return rows, next_before
+
+def get_feedback(limit=50, before=None):
+    """One page of feedback, newest first; returns (feedback, next_before)"""
+    return _newest_first('feedback', ['id', 'user_name', 'rating', 'comment', 'timestamp'], limit, before)
+
+def get_parking_logs(limit=100, before=None):
+    """One page of parking logs, newest first; returns (logs, next_before)"""
+    return _newest_first('parking_logs', ['id', 'spot_label', 'action', 'user_name', 'timestamp', 'details'],
+                         limit, before)
 
 def record_occupancy_stats():
     """Record current occupancy statistics"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM spots")
-    total = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM spots WHERE status = 'occupied'")
-    occupied = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM spots WHERE status = 'available'")
-    available = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM spots WHERE status = 'reserved'")
-    reserved = cursor.fetchone()[0]
-    
-    query = f'''
-        INSERT INTO occupancy_stats (total_spots, occupied_spots, available_spots, reserved_spots)
-        VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
-    '''
-    cursor.execute(query, (total, occupied, available, reserved))
-    
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT COUNT(*) FROM spots")
+        total = cursor.fetchone()[0]
+        
+        cursor.execute("SELECT COUNT(*) FROM spots WHERE status = 'occupied'")
+        occupied = cursor.fetchone()[0]
+        
+        cursor.execute("SELECT COUNT(*) FROM spots WHERE status = 'available'")
+        available = cursor.fetchone()[0]
+        
+        cursor.execute("SELECT COUNT(*) FROM spots WHERE status = 'reserved'")
+        reserved = cursor.fetchone()[0]
+        
+        query = f'''
+            INSERT INTO occupancy_stats (total_spots, occupied_spots, available_spots, reserved_spots)
+            VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
+        '''
+        cursor.execute(query, (total, occupied, available, reserved))
+        
+        conn.commit()
 
 def get_occupancy_trends(hours=24):
     """Get occupancy trends for the last N hours"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    if USE_POSTGRES:
-        query = f'''
-            SELECT * FROM occupancy_stats 
-            WHERE timestamp >= NOW() - INTERVAL '{hours} hours'
-            ORDER BY timestamp ASC
-        '''
-        cursor.execute(query)
-    else:
-        query = f'''
-            SELECT * FROM occupancy_stats 
-            WHERE timestamp >= datetime('now', '-' || {PARAM_PLACEHOLDER} || ' hours')
-            ORDER BY timestamp ASC
-        '''
-        cursor.execute(query, (hours,))
-    
-    stats = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        if USE_POSTGRES:
+            query = f'''
+                SELECT * FROM occupancy_stats 
+                WHERE timestamp >= NOW() - INTERVAL '{hours} hours'
+                ORDER BY timestamp ASC
+            '''
+            cursor.execute(query)
+        else:
+            query = f'''
+                SELECT * FROM occupancy_stats 
+                WHERE timestamp >= datetime('now', '-' || {PARAM_PLACEHOLDER} || ' hours')
+                ORDER BY timestamp ASC
+            '''
+            cursor.execute(query, (hours,))
+        
+        stats = cursor.fetchall()
     
     if USE_POSTGRES:
         columns = ['id', 'timestamp', 'total_spots', 'occupied_spots', 'available_spots', 'reserved_spots']
@@ -501,41 +1127,36 @@ def get_occupancy_trends(hours=24):
 # User Authentication Functions
 def create_user(email, password_hash, name, phone):
     """Create a new user account"""
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        query = f'''
-            INSERT INTO users (email, password_hash, name, phone)
-            VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
-        '''
-        cursor.execute(query, (email, password_hash, name, phone))
-        conn.commit()
-        
-        if USE_POSTGRES:
-            # PostgreSQL doesn't have lastrowid, need to fetch it
-            cursor.execute('SELECT lastval()')
-            user_id = cursor.fetchone()[0]
-        else:
-            user_id = cursor.lastrowid
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            query = f'''
+                INSERT INTO users (email, password_hash, name, phone)
+                VALUES ({PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER}, {PARAM_PLACEHOLDER})
+            '''
+            cursor.execute(query, (email, password_hash, name, phone))
+            conn.commit()
             
-        conn.close()
+            if USE_POSTGRES:
+                # PostgreSQL doesn't have lastrowid, need to fetch it
+                cursor.execute('SELECT lastval()')
+                user_id = cursor.fetchone()[0]
+            else:
+                user_id = cursor.lastrowid
         return user_id
     except (sqlite3.IntegrityError if not USE_POSTGRES else psycopg2.IntegrityError):
-        conn.close()
         return None
     except Exception as e:
         print(f"Error creating user: {e}")
-        conn.close()
         return None
 
 def get_user_by_email(email):
     """Get user by email"""
-    conn = get_db()
-    cursor = conn.cursor()
-    query = f'SELECT * FROM users WHERE email = {PARAM_PLACEHOLDER}'
-    cursor.execute(query, (email,))
-    user = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = f'SELECT * FROM users WHERE email = {PARAM_PLACEHOLDER}'
+        cursor.execute(query, (email,))
+        user = cursor.fetchone()
     
     if user:
         if USE_POSTGRES:
@@ -548,12 +1169,11 @@ def get_user_by_email(email):
 
 def get_user_by_id(user_id):
     """Get user by ID"""
-    conn = get_db()
-    cursor = conn.cursor()
-    query = f'SELECT * FROM users WHERE id = {PARAM_PLACEHOLDER}'
-    cursor.execute(query, (user_id,))
-    user = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        query = f'SELECT * FROM users WHERE id = {PARAM_PLACEHOLDER}'
+        cursor.execute(query, (user_id,))
+        user = cursor.fetchone()
     
     if user:
         if USE_POSTGRES:
@@ -0,0 +1,175 @@
+"""
+Database connection pools
+SQLite keeps one persistent connection per thread. Postgres connections come
+from a bounded psycopg2 ThreadedConnectionPool; when every connection is in
+use, callers wait for one to be returned instead of failing straight away.
+
+Both pools roll back whatever the borrower left uncommitted before the
+connection is used again, and keep counters for pool_stats().
+"""
+import sqlite3
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within the wait timeout"""
+
+
+class PoolStats:
+    """Counters shared by both pool types"""
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.acquired = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.discarded = 0
+
+    def record_acquire(self, waited):
+        with self._lock:
+            self.acquired += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            if waited > 0.001:
+                self.waits += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def record_release(self, discarded=False):
+        with self._lock:
+            self.in_use -= 1
+            if discarded:
+                self.discarded += 1
+
+    def record_open(self):
+        with self._lock:
+            self.opened += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'opened': self.opened,
+                'acquired': self.acquired,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'waits': self.waits,
+                'avg_wait_ms': round(self.wait_time / self.acquired * 1000, 3) if self.acquired else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'timeouts': self.timeouts,
+                'discarded': self.discarded,
+            }
+
+
+class SQLiteConnectionPool:
+    """One persistent SQLite connection per thread
+
+    Borrowing again on the same thread (a helper calling another helper)
+    returns the same connection; it is only reset when the outermost
+    borrower gives it back.
+    """
+
+    def __init__(self, path, on_connect=None):
+        self.path = path
+        self.on_connect = on_connect
+        self.stats = PoolStats(size=None)
+        self._local = threading.local()
+
+    def getconn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            if self.on_connect is not None:
+                self.on_connect(conn)
+            self._local.conn = conn
+            self._local.depth = 0
+            self.stats.record_open()
+        self._local.depth += 1
+        self.stats.record_acquire(0.0)
+        return conn
+
+    def putconn(self, conn, broken=False):
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                broken = True
+            if broken:
+                self._discard(conn)
+        self.stats.record_release(discarded=broken)
+
+    def close(self):
+        """Close this thread's connection (other threads' close when they exit)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._local.conn = None
+        self._local.depth = 0
+
+
+class PostgresConnectionPool:
+    """Bounded pool of Postgres connections shared by every thread"""
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=30.0):
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self.timeout = timeout
+        self.stats = PoolStats(size=maxconn)
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn)
+        # ThreadedConnectionPool raises when exhausted; the semaphore makes callers wait instead
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._known = set()
+
+    def getconn(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            self.stats.record_timeout()
+            raise PoolTimeout(f"No database connection free after {self.timeout}s")
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        if id(conn) not in self._known:
+            self._known.add(id(conn))
+            self.stats.record_open()
+        self.stats.record_acquire(time.perf_counter() - started)
+        return conn
+
+    def putconn(self, conn, broken=False):
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except Exception:
+            broken = True
+        broken = broken or bool(conn.closed)
+        if broken:
+            self._known.discard(id(conn))
+        try:
+            self._pool.putconn(conn, close=broken)
+        finally:
+            self._slots.release()
+            self.stats.record_release(discarded=broken)
+
+    def close(self):
+        """Close every pooled connection"""
+        self._pool.closeall()
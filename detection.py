@@ -0,0 +1,367 @@
+"""
+Shared parking detection helpers
+Used by both the Flask video stream (app.py) and the OpenCV detector (main_detection.py)
+"""
+import time
+
+import cv2
+import numpy as np
+
+# Size of a parking spot rectangle in the video frame
+SPOT_WIDTH, SPOT_HEIGHT = 103, 43
+
+# A spot with this many (or more) white pixels after thresholding is occupied
+OCCUPIED_THRESHOLD = 900
+
+# An occupied spot must drop below this count before it is considered free again
+VACANT_THRESHOLD = 850
+
+# Number of consecutive frames a new state must hold before it is confirmed
+MIN_STABLE_FRAMES = 5
+
+DILATE_KERNEL = np.ones((3, 3), np.uint8)
+
+
+def threshold_frame(img, block_size=25, c=16, median_ksize=5):
+    """Run the grayscale/blur/threshold/dilate chain on a BGR frame
+
+    Allocates new arrays on every call; per-frame loops should use a
+    DetectionPipeline instead.
+    """
+    imgGray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    imgBlur = cv2.GaussianBlur(imgGray, (3, 3), 1)
+    imgThres = cv2.adaptiveThreshold(imgBlur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                     cv2.THRESH_BINARY_INV, block_size, c)
+    imgThres = cv2.medianBlur(imgThres, median_ksize)
+    return cv2.dilate(imgThres, DILATE_KERNEL, iterations=1)
+
+
+class DetectionPipeline:
+    """The threshold chain with preallocated buffers reused for every frame
+
+    Buffers are sized on the first frame (and again only if the frame size
+    changes), and every OpenCV call writes into them through dst=. The array
+    returned by threshold() is overwritten by the next call.
+    """
+
+    def __init__(self, block_size=25, c=16, median_ksize=5):
+        self.block_size = block_size
+        self.c = c
+        self.median_ksize = median_ksize
+        self._shape = None
+
+    def _allocate(self, shape):
+        rows, cols = shape[:2]
+        self.gray = np.empty((rows, cols), np.uint8)
+        self.blur = np.empty((rows, cols), np.uint8)
+        self.thres = np.empty((rows, cols), np.uint8)
+        self.median = np.empty((rows, cols), np.uint8)
+        self.dilated = np.empty((rows, cols), np.uint8)
+        self._shape = shape[:2]
+
+    def threshold(self, img):
+        """Run the chain on a BGR frame and return the (reused) binary image"""
+        if self._shape != img.shape[:2]:
+            self._allocate(img.shape)
+        cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        cv2.GaussianBlur(self.gray, (3, 3), 1, dst=self.blur)
+        cv2.adaptiveThreshold(self.blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                              cv2.THRESH_BINARY_INV, self.block_size, self.c, dst=self.thres)
+        cv2.medianBlur(self.thres, self.median_ksize, dst=self.median)
+        cv2.dilate(self.median, DILATE_KERNEL, dst=self.dilated, iterations=1)
+        return self.dilated
+
+
+def filter_margin(block_size=25, median_ksize=5):
+    """Pixels of context the filter chain needs around a region for exact results"""
+    # Gaussian 3x3 + adaptive block + median + 3x3 dilate, each reaching half its size
+    return 1 + block_size // 2 + median_ksize // 2 + 1
+
+
+class SpotScorer:
+    """Count the non-zero pixels of every spot at once using a summed-area table"""
+
+    def __init__(self, positions, width=SPOT_WIDTH, height=SPOT_HEIGHT):
+        corners = np.array(positions, dtype=np.int64).reshape(-1, 2)
+        self.x1 = corners[:, 0]
+        self.y1 = corners[:, 1]
+        self.x2 = self.x1 + width
+        self.y2 = self.y1 + height
+        self._shape = None
+        self._integral = None
+
+    def _clip_to(self, shape):
+        """Clip spot corners to the frame so they behave like numpy slicing"""
+        rows, cols = shape[:2]
+        self._x1 = np.clip(self.x1, 0, cols)
+        self._x2 = np.clip(self.x2, 0, cols)
+        self._y1 = np.clip(self.y1, 0, rows)
+        self._y2 = np.clip(self.y2, 0, rows)
+        self._shape = shape[:2]
+
+        # Binary images are 0/255, so sums can overflow int32 on large frames
+        dtype = np.int32 if rows * cols * 255 < 2 ** 31 else np.float64
+        self._integral = np.empty((rows + 1, cols + 1), dtype)
+
+    def score(self, imgThres):
+        """Return a vector with the non-zero pixel count of every spot"""
+        if self._shape != imgThres.shape[:2]:
+            self._clip_to(imgThres.shape)
+
+        integral = self._integral
+        sdepth = cv2.CV_32S if integral.dtype == np.int32 else cv2.CV_64F
+        cv2.integral(imgThres, sum=integral, sdepth=sdepth)
+
+        sums = (integral[self._y2, self._x2] - integral[self._y1, self._x2]
+                - integral[self._y2, self._x1] + integral[self._y1, self._x1])
+        return (sums // 255).astype(np.int64)
+
+
+def _odd_at_least_3(value):
+    value = max(3, int(round(value)))
+    return value if value % 2 else value + 1
+
+
+class RegionScorer:
+    """Threshold only the part of the frame the spots cover, optionally downscaled
+
+    With roi=True the filter chain runs on the bounding box of all spot
+    rectangles (plus the filter margin) instead of the whole frame. With
+    scale < 1 that region is shrunk first and the spot geometry and kernel
+    sizes are scaled to match. Counts are returned in full-resolution units
+    (divided by scale squared), which is the same as scaling the occupancy
+    threshold, so the usual thresholds keep working.
+    """
+
+    def __init__(self, positions, width=SPOT_WIDTH, height=SPOT_HEIGHT, roi=True, scale=1.0,
+                 block_size=25, c=16, median_ksize=5):
+        if not 0 < scale <= 1:
+            raise ValueError("scale must be in (0, 1]")
+        corners = np.array(positions, dtype=np.int64).reshape(-1, 2)
+        self.roi = roi
+        self.scale = scale
+        self.c = c
+        self.block_size = _odd_at_least_3(block_size * scale) if scale != 1 else block_size
+        self.median_ksize = _odd_at_least_3(median_ksize * scale) if scale != 1 else median_ksize
+        self.pipeline = DetectionPipeline(self.block_size, c, self.median_ksize)
+        self._resized = None
+
+        if roi and len(corners):
+            margin = filter_margin(block_size, median_ksize)
+            self.x0 = max(int(corners[:, 0].min()) - margin, 0)
+            self.y0 = max(int(corners[:, 1].min()) - margin, 0)
+            self.x_end = int(corners[:, 0].max()) + width + margin
+            self.y_end = int(corners[:, 1].max()) + height + margin
+        else:
+            self.x0 = self.y0 = 0
+            self.x_end = self.y_end = None
+
+        # Spot geometry relative to the processed region, in processed pixels
+        offset = corners - np.array([self.x0, self.y0])
+        self.scorer = SpotScorer(np.round(offset * scale).astype(np.int64),
+                                 max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        # INTER_AREA is only fast for whole-number shrink factors
+        self._interpolation = cv2.INTER_AREA if (1 / scale).is_integer() else cv2.INTER_LINEAR
+        self._area_ratio = (width * height) / (max(1, int(round(width * scale))) * max(1, int(round(height * scale))))
+
+    def score(self, img):
+        """Return the non-zero pixel count of every spot, in full-resolution units"""
+        region = img[self.y0:self.y_end, self.x0:self.x_end]
+        if self.scale != 1:
+            rows, cols = region.shape[:2]
+            size = (max(1, int(round(cols * self.scale))), max(1, int(round(rows * self.scale))))
+            if self._resized is None or self._resized.shape[1::-1] != size:
+                self._resized = np.empty((size[1], size[0]) + region.shape[2:], region.dtype)
+            region = cv2.resize(region, size, dst=self._resized, interpolation=self._interpolation)
+        imgThres = self.pipeline.threshold(region)
+        counts = self.scorer.score(imgThres)
+        if self.scale != 1:
+            counts = np.round(counts * self._area_ratio).astype(np.int64)
+        return counts
+
+
+class IncrementalScorer:
+    """Rescore only the spots that changed since the previous frame
+
+    A cheap difference of downscaled grayscale frames finds the spots with
+    motion; only those spots (plus a margin for the filter kernels) go through
+    the threshold chain. Every full_refresh_interval frames, or when most of the
+    lot changed, the whole frame is rescored to catch slow drift.
+    """
+
+    def __init__(self, positions, width=SPOT_WIDTH, height=SPOT_HEIGHT,
+                 block_size=25, c=16, median_ksize=5, motion_threshold=20,
+                 motion_scale=4, full_refresh_interval=150, max_changed_fraction=0.5):
+        self.block_size = block_size
+        self.c = c
+        self.median_ksize = median_ksize
+        self.motion_threshold = motion_threshold
+        self.motion_scale = motion_scale
+        self.full_refresh_interval = full_refresh_interval
+        self.max_changed_fraction = max_changed_fraction
+
+        corners = np.array(positions, dtype=np.int64).reshape(-1, 2)
+        self.width, self.height = width, height
+        self.positions = corners
+        self.margin = filter_margin(block_size, median_ksize)
+        self.scorer = SpotScorer(corners, width, height)
+        self.pipeline = DetectionPipeline(block_size, c, median_ksize)
+        # Spot ROIs share a few sizes (edge spots are clipped), one pipeline per size
+        self._roi_pipelines = {}
+
+        # Spot rectangles on the downscaled motion image, grown by the filter margin
+        # (a change moves thresholded pixels up to that far away) plus one pixel
+        s = motion_scale
+        grow = -(-self.margin // s) + 1
+        self.motion_scorer = SpotScorer(corners // s - grow, -(-width // s) + 2 * grow, -(-height // s) + 2 * grow)
+
+        self.counts = None
+        self._small = None
+        self._gray = [None, None]
+        self._has_prev = False
+        self._frames_since_refresh = 0
+
+        # Totals for reporting how much work was skipped
+        self.frames = 0
+        self.spots_rescored = 0
+        self.full_refreshes = 0
+
+    def _motion_image(self, img):
+        """Downscaled gray frame; alternates between two buffers so the previous one survives"""
+        rows, cols = img.shape[:2]
+        size = (max(1, cols // self.motion_scale), max(1, rows // self.motion_scale))
+        if self._small is None or self._small.shape[1::-1] != size:
+            self._small = np.empty((size[1], size[0], 3), np.uint8)
+            self._gray = [np.empty((size[1], size[0]), np.uint8) for _ in range(2)]
+            self._diff = np.empty((size[1], size[0]), np.uint8)
+            self._motion = np.empty((size[1], size[0]), np.uint8)
+            self._has_prev = False
+        cv2.resize(img, size, dst=self._small, interpolation=cv2.INTER_AREA)
+        self._gray.reverse()
+        return cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray[0])
+
+    def _score_full(self, img):
+        imgThres = self.pipeline.threshold(img)
+        self.counts = self.scorer.score(imgThres)
+        self._frames_since_refresh = 0
+        self.full_refreshes += 1
+        self.spots_rescored += len(self.counts)
+
+    def _score_spot(self, img, i):
+        rows, cols = img.shape[:2]
+        x, y = self.positions[i]
+        m = self.margin
+        rx1, ry1 = max(x - m, 0), max(y - m, 0)
+        rx2, ry2 = min(x + self.width + m, cols), min(y + self.height + m, rows)
+        if rx1 >= rx2 or ry1 >= ry2:
+            return 0
+        pipeline = self._roi_pipelines.get((ry2 - ry1, rx2 - rx1))
+        if pipeline is None:
+            pipeline = DetectionPipeline(self.block_size, self.c, self.median_ksize)
+            self._roi_pipelines[(ry2 - ry1, rx2 - rx1)] = pipeline
+        imgThres = pipeline.threshold(img[ry1:ry2, rx1:rx2])
+        crop = imgThres[max(y, 0) - ry1:min(y + self.height, rows) - ry1,
+                        max(x, 0) - rx1:min(x + self.width, cols) - rx1]
+        return cv2.countNonZero(crop) if crop.size else 0
+
+    def score(self, img):
+        """Return the non-zero pixel count of every spot for this frame"""
+        small = self._motion_image(img)
+        prev = self._gray[1]
+        has_prev, self._has_prev = self._has_prev, True
+        self.frames += 1
+        self._frames_since_refresh += 1
+
+        if (self.counts is None or not has_prev
+                or self._frames_since_refresh >= self.full_refresh_interval):
+            self._score_full(img)
+            return self.counts
+
+        cv2.absdiff(small, prev, dst=self._diff)
+        cv2.threshold(self._diff, self.motion_threshold, 255, cv2.THRESH_BINARY, dst=self._motion)
+        changed = np.flatnonzero(self.motion_scorer.score(self._motion))
+
+        if len(changed) > self.max_changed_fraction * len(self.counts):
+            self._score_full(img)
+            return self.counts
+
+        counts = self.counts.copy()
+        for i in changed:
+            counts[i] = self._score_spot(img, i)
+        self.counts = counts
+        self.spots_rescored += len(changed)
+        return counts
+
+
+class OccupancyTracker:
+    """Debounced occupancy state for every spot with separate enter/exit thresholds"""
+
+    def __init__(self, n_spots, occupied_threshold=OCCUPIED_THRESHOLD,
+                 vacant_threshold=VACANT_THRESHOLD, min_frames=MIN_STABLE_FRAMES):
+        if vacant_threshold > occupied_threshold:
+            raise ValueError("vacant_threshold must not be above occupied_threshold")
+        self.occupied_threshold = occupied_threshold
+        self.vacant_threshold = vacant_threshold
+        self.min_frames = min_frames
+        self.occupied = None
+        self._pending = np.zeros(n_spots, dtype=np.int32)
+
+    def update(self, counts):
+        """Feed one frame of spot counts and return the indices of confirmed changes"""
+        counts = np.asarray(counts)
+        if self.occupied is None:
+            # First frame: take the raw reading as the starting state
+            self.occupied = counts >= self.occupied_threshold
+            return np.empty(0, dtype=np.int64)
+
+        # A spot wants to flip when its count is past the threshold for the other state
+        flipping = np.where(self.occupied,
+                            counts < self.vacant_threshold,
+                            counts >= self.occupied_threshold)
+        self._pending = np.where(flipping, self._pending + 1, 0)
+
+        confirmed = self._pending >= self.min_frames
+        self.occupied[confirmed] = ~self.occupied[confirmed]
+        self._pending[confirmed] = 0
+        return np.flatnonzero(confirmed)
+
+
+def create_scorer(positions, width=SPOT_WIDTH, height=SPOT_HEIGHT, incremental=False,
+                  roi=False, scale=1.0, block_size=25, c=16, median_ksize=5):
+    """Build a scorer whose score(img) takes a BGR frame and returns per-spot counts"""
+    if incremental:
+        return IncrementalScorer(positions, width, height, block_size, c, median_ksize)
+    return RegionScorer(positions, width, height, roi=roi, scale=scale,
+                        block_size=block_size, c=c, median_ksize=median_ksize)
+
+
+def compare_modes(frames, positions, width=SPOT_WIDTH, height=SPOT_HEIGHT,
+                  scales=(1.0, 0.75, 0.5), threshold=OCCUPIED_THRESHOLD):
+    """Compare ROI/downscaled modes against full-resolution results on a list of frames
+
+    Returns one dict per mode with milliseconds per frame, speedup over the
+    full-frame pipeline, agreement of the occupied/free decision and the mean
+    absolute count error.
+    """
+    modes = [('full frame', dict(roi=False, scale=1.0))]
+    modes += [(f'roi x{scale:g}', dict(roi=True, scale=scale)) for scale in scales]
+
+    results = []
+    baseline = None
+    baseline_ms = None
+    for name, options in modes:
+        scorer = create_scorer(positions, width, height, **options)
+        started = time.perf_counter()
+        counts = np.array([scorer.score(img) for img in frames])
+        ms = (time.perf_counter() - started) * 1000 / max(len(frames), 1)
+
+        if baseline is None:
+            baseline, baseline_ms = counts, ms
+        results.append({
+            'mode': name,
+            'ms_per_frame': ms,
+            'speedup': baseline_ms / ms if ms else float('inf'),
+            'agreement': float(np.mean((counts >= threshold) == (baseline >= threshold))),
+            'mean_abs_error': float(np.mean(np.abs(counts - baseline))),
+        })
+    return results
@@ -0,0 +1,298 @@
+"""
+Shared background detection engine
+One engine per camera decodes, detects and annotates each frame once.
+Viewers subscribe to a stream tier; each tier is encoded at most once per
+frame and handed to every subscriber through a small queue that drops stale
+frames, so a slow viewer never holds up the engine or other viewers.
+"""
+import pickle
+import threading
+import time
+from collections import deque, namedtuple
+
+import cv2
+
+from database import get_all_spots
+from detection import SPOT_WIDTH, SPOT_HEIGHT, OccupancyTracker, create_scorer
+from frame_source import open_source
+from overlay import SpotOverlay
+from spot_cache import SpotStatusTable
+
+# JPEG quality (0-100), resolution scale and frame rate of each stream variant
+StreamTier = namedtuple('StreamTier', 'quality scale fps')
+
+STREAM_TIERS = {
+    'high': StreamTier(85, 1.0, 30),
+    'medium': StreamTier(70, 0.75, 15),
+    'low': StreamTier(50, 0.5, 5),
+}
+DEFAULT_TIER = 'high'
+
+# JPEG quality of still snapshots, and pixels kept around a spot's box in crops
+SNAPSHOT_QUALITY = 85
+CROP_PADDING = 4
+
+
+class FrameSubscription:
+    """One viewer's bounded queue of encoded frames for a stream tier
+
+    When the viewer falls behind, the oldest queued frame is discarded so the
+    next frame it reads is always the newest one instead of a growing backlog.
+    """
+
+    def __init__(self, engine, tier=DEFAULT_TIER, max_queue=1):
+        self.engine = engine
+        self.tier = tier
+        self.dropped = 0
+        self.closed = False
+        self._frames = deque(maxlen=max(1, max_queue))
+        self._cond = threading.Condition()
+
+    def _push(self, frame):
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append(frame)
+            self._cond.notify()
+
+    def get(self, timeout=5.0):
+        """Return the next encoded frame, or None on timeout or once closed"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frames or self.closed, timeout)
+            if self._frames:
+                return self._frames.popleft()
+            return None
+
+    def close(self):
+        """Stop receiving frames"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self.engine.unsubscribe(self)
+
+
+class DetectionEngine(threading.Thread):
+    """Background producer for one camera's annotated MJPEG frames"""
+
+    def __init__(self, source, positions_file='CarParkPos', fps=30, idle_timeout=60, **scorer_options):
+        super().__init__(daemon=True, name=f"detection-engine:{source}")
+        self.source = source
+        self.positions_file = positions_file
+        self.fps = fps
+        self.frame_interval = 1.0 / fps
+        self.idle_timeout = idle_timeout
+        # incremental / roi / scale, see detection.create_scorer
+        self.scorer_options = scorer_options
+
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._image = None
+        self._subscribers = []
+        self._resized = {}
+        # Distinguishes this engine's frame numbers from a restarted engine's
+        self.token = f"{int(time.time() * 1000):x}"
+        # Spot label -> (x, y, w, h), filled in when the engine starts
+        self.spot_regions = {}
+        self._snapshots = {}
+        self._snapshot_lock = threading.Lock()
+        self._running = True
+        self._last_read = time.monotonic()
+
+    @property
+    def running(self):
+        return self._running and self.is_alive()
+
+    def subscribe(self, tier=DEFAULT_TIER, max_queue=1):
+        """Start receiving encoded frames of a stream tier"""
+        if tier not in STREAM_TIERS:
+            raise ValueError(f"Unknown stream tier: {tier}")
+        subscription = FrameSubscription(self, tier, max_queue)
+        with self._cond:
+            self._last_read = time.monotonic()
+            if self._running:
+                self._subscribers.append(subscription)
+            else:
+                subscription.closed = True
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._cond:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+                self._last_read = time.monotonic()
+
+    def snapshot(self, label=None, timeout=5.0):
+        """Return (seq, jpeg_bytes) of the latest annotated frame, or of one spot's region
+
+        Each frame/spot pair is encoded at most once however many clients ask
+        for it. The JPEG is None if no frame is ready yet or the label is unknown.
+        """
+        with self._cond:
+            self._last_read = time.monotonic()
+            self._cond.wait_for(lambda: self._image is not None or not self._running, timeout)
+            seq, img = self._seq, self._image
+        if img is None:
+            return seq, None
+
+        with self._snapshot_lock:
+            cached = self._snapshots.get(label)
+            if cached is not None and cached[0] == seq:
+                return cached
+
+            if label is not None:
+                region = self.spot_regions.get(label)
+                if region is None:
+                    return seq, None
+                x, y, w, h = region
+                img = img[max(y - CROP_PADDING, 0):y + h + CROP_PADDING,
+                          max(x - CROP_PADDING, 0):x + w + CROP_PADDING]
+
+            ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, SNAPSHOT_QUALITY])
+            if not ret:
+                return seq, None
+            cached = self._snapshots[label] = (seq, buffer.tobytes())
+            return cached
+
+    def stop(self):
+        """Ask the engine to stop and end every subscriber's stream"""
+        with self._cond:
+            self._running = False
+            subscribers = list(self._subscribers)
+            self._cond.notify_all()
+        for subscription in subscribers:
+            subscription.close()
+
+    def _encode(self, name, tier, img):
+        if tier.scale != 1.0:
+            size = (round(img.shape[1] * tier.scale), round(img.shape[0] * tier.scale))
+            buffer = self._resized.get(name)
+            if buffer is None or buffer.shape[1::-1] != size:
+                buffer = None
+            img = self._resized[name] = cv2.resize(img, size, dst=buffer, interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, tier.quality])
+        return buffer.tobytes() if ret else None
+
+    def _publish(self, img):
+        with self._cond:
+            self._seq += 1
+            seq = self._seq
+            self._image = img
+            self._cond.notify_all()
+            by_tier = {}
+            for subscription in self._subscribers:
+                by_tier.setdefault(subscription.tier, []).append(subscription)
+
+        # Encode each watched tier once and share the bytes between its viewers
+        for name, subscribers in by_tier.items():
+            tier = STREAM_TIERS[name]
+            if seq % max(1, round(self.fps / tier.fps)):
+                continue
+            frame = self._encode(name, tier, img)
+            if frame is None:
+                continue
+            for subscription in subscribers:
+                subscription._push(frame)
+
+    def _idle(self):
+        with self._cond:
+            if self._subscribers:
+                self._last_read = time.monotonic()
+                return False
+            return time.monotonic() - self._last_read > self.idle_timeout
+
+    def run(self):
+        source = None
+        statuses = None
+        try:
+            # Decode ahead on a background thread; loop the recorded video
+            source = open_source(self.source, loop=True)
+            width, height = SPOT_WIDTH, SPOT_HEIGHT
+
+            # Load parking positions
+            with open(self.positions_file, 'rb') as f:
+                posList = pickle.load(f)
+
+            # Create spot mapping
+            spots = get_all_spots()
+            spots.sort(key=lambda s: s['spot_label'])
+            spot_mapping = {}
+            for i, spot in enumerate(spots):
+                if i < len(posList):
+                    spot_mapping[i] = spot['spot_label']
+            self.spot_regions = {spot_mapping.get(i, f"SPOT{i}"): (x, y, width, height)
+                                 for i, (x, y) in enumerate(posList)}
+
+            scorer = create_scorer(posList, width, height, **self.scorer_options)
+            statuses = SpotStatusTable()
+            tracker = OccupancyTracker(len(posList))
+            overlay = SpotOverlay(posList, [spot_mapping.get(i, f"SPOT{i}") for i in range(len(posList))],
+                                  width, height)
+
+            while self._running and not self._idle():
+                started = time.monotonic()
+
+                success, img = source.read()
+                if not success:
+                    print(f"Video source ended: {self.source}")
+                    break
+
+                # Process frame
+                counts = scorer.score(img)
+
+                # Check spaces and draw rectangles
+                statuses.refresh()
+                tracker.update(counts)
+                states = []
+                spaces = 0
+                for i in range(len(posList)):
+                    spot_label = spot_mapping.get(i, f"SPOT{i}")
+                    status = statuses.get(spot_label)
+
+                    if not status:
+                        states.append(None)
+                    elif status == 'reserved':
+                        states.append('reserved')
+                    elif not tracker.occupied[i]:
+                        states.append('available')
+                        spaces += 1
+                    else:
+                        states.append('occupied')
+
+                # Only spots whose state changed are redrawn on the overlay
+                overlay.render(img, states, spaces)
+
+                # Encode once per watched tier for every viewer
+                self._publish(img)
+
+                # Pace the producer to the target frame rate
+                elapsed = time.monotonic() - started
+                if elapsed < self.frame_interval:
+                    time.sleep(self.frame_interval - elapsed)
+
+        except Exception as e:
+            print(f"Error in detection engine: {e}")
+        finally:
+            if source is not None:
+                source.close()
+            if statuses is not None:
+                statuses.close()
+            self.stop()
+
+
+# One engine per video source, shared by every stream client
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(source='carPark.mp4', **scorer_options):
+    """Return the running engine for a source, starting one if needed
+
+    scorer_options (incremental, roi, scale) only apply when a new engine starts
+    """
+    with _engines_lock:
+        engine = _engines.get(source)
+        if engine is None or not engine.running:
+            engine = DetectionEngine(source, **scorer_options)
+            engine.start()
+            _engines[source] = engine
+        return engine
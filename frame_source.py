@@ -0,0 +1,245 @@
+"""
+Threaded frame sources
+Frames are decoded on a background thread into a bounded prefetch queue so
+decoding overlaps with thresholding instead of adding to per-frame latency.
+
+    source = open_source('carPark.mp4', loop=True)
+    success, img = source.read()
+
+Queue policies:
+    'block'       - the decoder waits for the consumer (files, no frames lost)
+    'drop_oldest' - the oldest queued frame is discarded (live streams, low latency)
+"""
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# Marks the end of a source in the prefetch queue
+_END = object()
+
+
+class FrameSource:
+    """Base class: subclasses implement _open(), _read() and _release()"""
+
+    def __init__(self, prefetch=8, policy='block', loop=False):
+        if policy not in ('block', 'drop_oldest'):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.prefetch = prefetch
+        self.policy = policy
+        self.loop = loop
+        self.fps = 0.0
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=max(1, prefetch))
+        self._stop = threading.Event()
+        self._thread = None
+        self._finished = False
+        self.opened = False
+
+    # Subclass hooks; _open() runs in start(), the others on the decode thread
+    def _open(self):
+        """Open the source; return False if it cannot be read"""
+        raise NotImplementedError
+
+    def _read(self):
+        """Return (success, frame) like cv2.VideoCapture.read()"""
+        raise NotImplementedError
+
+    def _rewind(self):
+        """Go back to the first frame; return False if the source cannot loop"""
+        return False
+
+    def _release(self):
+        pass
+
+    def start(self):
+        """Open the source and start the decode thread (read() does this on first use)"""
+        if self._thread is None and not self._finished:
+            self.opened = self._open()
+            if not self.opened:
+                print(f"Could not open frame source: {self}")
+                self._release()
+                self._finished = True
+                return self
+            self._thread = threading.Thread(target=self._decode_loop, daemon=True,
+                                            name=f"frame-source:{self}")
+            self._thread.start()
+        return self
+
+    def read(self, timeout=None):
+        """Return the next (success, frame); success is False at the end of the source"""
+        self.start()
+        if self._finished:
+            return False, None
+        try:
+            item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return False, None
+        if item is _END:
+            self._finished = True
+            return False, None
+        return True, item
+
+    def __iter__(self):
+        while True:
+            success, frame = self.read()
+            if not success:
+                return
+            yield frame
+
+    def close(self):
+        """Stop decoding and release the underlying source"""
+        self._stop.set()
+        # Unblock a decoder waiting on a full queue
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _put(self, item):
+        if self.policy == 'drop_oldest':
+            while not self._stop.is_set():
+                try:
+                    self._queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+            return
+
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _decode_loop(self):
+        try:
+            while not self._stop.is_set():
+                success, frame = self._read()
+                if not success:
+                    if self.loop and self._rewind():
+                        continue
+                    break
+                self._put(frame)
+        except Exception as e:
+            print(f"Frame source error ({self}): {e}")
+        finally:
+            self._release()
+            # Always deliver the end marker, even under the drop_oldest policy
+            self._put(_END)
+
+
+class VideoFileSource(FrameSource):
+    """Frames from a local video file, optionally looping at the end"""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._cap = None
+
+    def __str__(self):
+        return self.path
+
+    def _open(self):
+        self._cap = cv2.VideoCapture(self.path)
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 0.0
+        return self._cap.isOpened()
+
+    def _read(self):
+        return self._cap.read()
+
+    def _rewind(self):
+        return self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _release(self):
+        if self._cap is not None:
+            self._cap.release()
+
+
+class StreamSource(VideoFileSource):
+    """Frames from a network stream (RTSP/HTTP), reconnecting when it drops"""
+
+    def __init__(self, url, reconnect_delay=2.0, max_reconnects=5, **kwargs):
+        kwargs.setdefault('policy', 'drop_oldest')
+        kwargs.setdefault('prefetch', 2)
+        super().__init__(url, **kwargs)
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnects = max_reconnects
+        self._reconnects = 0
+
+    def _read(self):
+        success, frame = self._cap.read()
+        while not success and self._reconnects < self.max_reconnects and not self._stop.is_set():
+            self._reconnects += 1
+            print(f"Stream {self.path} dropped, reconnecting ({self._reconnects}/{self.max_reconnects})")
+            self._cap.release()
+            time.sleep(self.reconnect_delay)
+            if self._open():
+                success, frame = self._cap.read()
+        if success:
+            self._reconnects = 0
+        return success, frame
+
+    def _rewind(self):
+        return False
+
+
+class ImageDirectorySource(FrameSource):
+    """Frames from the image files in a directory, in file name order"""
+
+    def __init__(self, directory, fps=30.0, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.fps = fps
+        self._files = []
+        self._index = 0
+
+    def __str__(self):
+        return self.directory
+
+    def _open(self):
+        self._files = [os.path.join(self.directory, name)
+                       for name in sorted(os.listdir(self.directory))
+                       if name.lower().endswith(IMAGE_EXTENSIONS)]
+        self._index = 0
+        return bool(self._files)
+
+    def _read(self):
+        while self._index < len(self._files):
+            img = cv2.imread(self._files[self._index])
+            self._index += 1
+            if img is not None:
+                return True, img
+        return False, None
+
+    def _rewind(self):
+        self._index = 0
+        return bool(self._files)
+
+
+def open_source(spec, **kwargs):
+    """Pick a frame source for a video file, image directory or stream URL"""
+    if '://' in spec:
+        return StreamSource(spec, **kwargs)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, **kwargs)
+    return VideoFileSource(spec, **kwargs)
@@ -0,0 +1,227 @@
+"""
+PARKEASE email outbox sender
+send_email() only queues the message in the email_outbox table and returns.
+A background thread delivers queued messages over one SMTP session that is
+kept open between batches, retries failures with exponential backoff, and
+gives up after MAIL_MAX_ATTEMPTS.
+
+Configuration (environment):
+    EMAIL_HOST, EMAIL_PORT              SMTP server (default smtp.gmail.com:587)
+    EMAIL_USER, EMAIL_PASSWORD          login; skipped when EMAIL_PASSWORD is empty
+    EMAIL_STARTTLS                      1 (default) to upgrade the connection with STARTTLS
+    MAIL_BATCH_SIZE                     messages claimed per batch (default 20)
+    MAIL_MAX_ATTEMPTS                   attempts before a message is marked failed (default 6)
+"""
+import os
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from database import (
+    enqueue_email, claim_emails, mark_emails_sent, mark_email_failed, get_outbox_stats
+)
+
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+EMAIL_USER = os.environ.get('EMAIL_USER', 'your_email@gmail.com')
+EMAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD', '')
+EMAIL_STARTTLS = os.environ.get('EMAIL_STARTTLS', '1') == '1'
+
+MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 20))
+MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 6))
+MAIL_POLL_INTERVAL = 5.0        # seconds between outbox checks when nobody wakes the sender
+MAIL_BACKOFF_BASE = 30.0        # seconds before the first retry, doubled on every attempt
+MAIL_BACKOFF_MAX = 3600.0
+MAIL_LEASE = 300                # seconds a claimed message stays with one sender
+MAIL_IDLE_DISCONNECT = 60.0     # close the SMTP session after this long without mail
+
+
+def build_message(sender, to_email, subject, body):
+    """HTML email as sent by PARKEASE"""
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'html'))
+    return msg.as_string()
+
+
+def is_rejection(error):
+    """True when the server rejected the message itself, so retrying cannot help"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)) and error.smtp_code >= 500
+
+
+def retry_delay(attempts):
+    """Backoff before the next try after attempts failed attempts"""
+    return min(MAIL_BACKOFF_BASE * 2 ** (attempts - 1), MAIL_BACKOFF_MAX)
+
+
+class OutboxSender(threading.Thread):
+    """Delivers queued emails in batches over a persistent SMTP session"""
+
+    def __init__(self, host=None, port=None, user=None, password=None, starttls=None,
+                 batch_size=None, poll_interval=MAIL_POLL_INTERVAL):
+        super().__init__(daemon=True, name='mail-outbox')
+        self.host = host or EMAIL_HOST
+        self.port = port or EMAIL_PORT
+        self.user = user or EMAIL_USER
+        self.password = EMAIL_PASSWORD if password is None else password
+        self.starttls = EMAIL_STARTTLS if starttls is None else starttls
+        self.batch_size = batch_size or MAIL_BATCH_SIZE
+        self.poll_interval = poll_interval
+        self._server = None
+        self._last_used = 0.0
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self.connections = 0
+        self.send_time = 0.0
+        self.last_error = None
+
+    def notify(self):
+        """Wake the sender now instead of at the next poll"""
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sent': self.sent,
+                'retried': self.retried,
+                'failed': self.failed,
+                'batches': self.batches,
+                'smtp_connections': self.connections,
+                'avg_send_ms': round(self.send_time / self.sent * 1000, 1) if self.sent else 0.0,
+                'last_error': self.last_error,
+            }
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            server.starttls()
+        if self.password:
+            server.login(self.user, self.password)
+        with self._lock:
+            self.connections += 1
+        return server
+
+    def _disconnect(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+    def _send(self, to_email, subject, body):
+        message = build_message(self.user, to_email, subject, body)
+        if self._server is None:
+            self._server = self._connect()
+        try:
+            self._server.sendmail(self.user, to_email, message)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed an idle session; reconnect once and resend
+            self._server = self._connect()
+            self._server.sendmail(self.user, to_email, message)
+
+    def _record_failure(self, outbox_id, to_email, attempts, error):
+        attempts += 1
+        if is_rejection(error) or attempts >= MAIL_MAX_ATTEMPTS:
+            mark_email_failed(outbox_id, error)
+            outcome = 'failed'
+        else:
+            mark_email_failed(outbox_id, error, datetime.now() + timedelta(seconds=retry_delay(attempts)))
+            outcome = 'retried'
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.last_error = f"{type(error).__name__}: {error}"
+        print(f"Email error ({to_email}): {error}")
+
+    def send_batch(self):
+        """Deliver one batch of due emails; returns how many were claimed"""
+        emails = claim_emails(uuid.uuid4().hex, self.batch_size, MAIL_LEASE)
+        delivered = []
+        try:
+            for position, (outbox_id, to_email, subject, body, attempts) in enumerate(emails):
+                started = time.perf_counter()
+                try:
+                    self._send(to_email, subject, body)
+                except Exception as e:
+                    self._record_failure(outbox_id, to_email, attempts, e)
+                    if is_rejection(e) or isinstance(e, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+                        continue
+                    # The server is unreachable or refused the login: back off the rest of the batch too
+                    self._disconnect()
+                    for outbox_id, to_email, _, _, attempts in emails[position + 1:]:
+                        self._record_failure(outbox_id, to_email, attempts, e)
+                    break
+                delivered.append(outbox_id)
+                with self._lock:
+                    self.sent += 1
+                    self.send_time += time.perf_counter() - started
+        finally:
+            # Emails already handed to the server must not be re-sent when their lease runs out
+            mark_emails_sent(delivered)
+        if emails:
+            self._last_used = time.monotonic()
+            with self._lock:
+                self.batches += 1
+        return len(emails)
+
+    def run(self):
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                # A full batch means more may be waiting; otherwise sleep until woken
+                if self.send_batch() >= self.batch_size:
+                    continue
+            except Exception as e:
+                print(f"Mail outbox error: {e}")
+                self._disconnect()
+            if self._server is not None and time.monotonic() - self._last_used > MAIL_IDLE_DISCONNECT:
+                self._disconnect()
+            self._wake.wait(self.poll_interval)
+        self._disconnect()
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def start_mailer(**kwargs):
+    """Start the process-wide outbox sender"""
+    global _sender
+    with _sender_lock:
+        if _sender is None or not _sender.is_alive():
+            _sender = OutboxSender(**kwargs)
+            _sender.start()
+        return _sender
+
+
+def send_email(to_email, subject, body):
+    """Queue an email notification; returns the outbox id"""
+    outbox_id = enqueue_email(to_email, subject, body)
+    if _sender is not None:
+        _sender.notify()
+    return outbox_id
+
+
+def mailer_stats():
+    """Outbox depth plus this process's sender counters"""
+    stats = {'outbox': get_outbox_stats()}
+    if _sender is not None:
+        stats['sender'] = _sender.stats()
+    return stats
@@ -2,8 +2,10 @@ import cv2
 import pickle
 import cvzone
 import numpy as np
+from frame_source import open_source
 
-cap = cv2.VideoCapture('carPark.mp4')
+# Decoded ahead on a background thread, looping at the end of the video
+cap = open_source('carPark.mp4', loop=True)
 width, height = 103, 43
 with open('CarParkPos', 'rb') as f:
     posList = pickle.load(f)
@@ -50,8 +52,8 @@ def checkSpaces():
 while True:
     # Get image frame
     success, img = cap.read()
-    if cap.get(cv2.CAP_PROP_POS_FRAMES) == cap.get(cv2.CAP_PROP_FRAME_COUNT):
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    if not success:
+        break
     # img = cv2.imread('img.png')
     imgGray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     imgBlur = cv2.GaussianBlur(imgGray, (3, 3), 1)
@@ -78,5 +80,5 @@ while True:
     if key == ord('q') or key == 27:  # 'q' or ESC to quit
         break
 
-cap.release()
+cap.close()
 cv2.destroyAllWindows()
\ No newline at end of file
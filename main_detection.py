@@ -1,132 +1,402 @@
+"""
+PARKEASE parking detection
+Default mode shows the admin detection window and keeps the database in sync.
+Headless mode (--headless) runs the same pipeline as fast as possible over
+video files and writes an occupancy timeline instead.
+
+Usage:
+    python main_detection.py
+    python main_detection.py --headless footage/ --output timeline.csv
+    python main_detection.py --headless day1.mp4 --output day1.npz --timeline frames
+"""
+import argparse
+import csv
+import json
+import os
 import cv2
 import pickle
-import cvzone
 import numpy as np
 from datetime import datetime
 import time
 
 # Import database functions
-from database import get_db, update_spot_status, get_spot_by_label, get_all_spots
+from database import get_db, update_spot_statuses, get_all_spots, check_in_spots
+from detection import (
+    SPOT_WIDTH, SPOT_HEIGHT, OCCUPIED_THRESHOLD, VACANT_THRESHOLD, MIN_STABLE_FRAMES,
+    SpotScorer, OccupancyTracker, DetectionPipeline, create_scorer, compare_modes
+)
+from frame_source import open_source
+from overlay import SpotOverlay
+from spot_cache import SpotStatusTable
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v')
 
-cap = cv2.VideoCapture('carPark.mp4')
-width, height = 103, 43
+width, height = SPOT_WIDTH, SPOT_HEIGHT
 
 # Load parking positions
 with open('CarParkPos', 'rb') as f:
     posList = pickle.load(f)
 
+scorer = SpotScorer(posList, width, height)
+
+# Debounced occupancy; tune the enter/exit thresholds and stable frame count here
+tracker = OccupancyTracker(len(posList), occupied_threshold=OCCUPIED_THRESHOLD,
+                           vacant_threshold=VACANT_THRESHOLD, min_frames=MIN_STABLE_FRAMES)
+
 # Create mapping between position index and spot label
 spot_mapping = {}
 
+# In-memory spot statuses, refreshed without a query per spot per frame
+spot_statuses = None
+
+# Cached spot outlines and labels, built once the spot labels are known
+overlay = None
+
 def initialize_spot_mapping():
     """Create mapping between array position and spot labels"""
-    global spot_mapping
+    global spot_mapping, spot_statuses, overlay
     spots = get_all_spots()
-    
+    spot_statuses = SpotStatusTable()
+
     # Sort spots by label
     spots.sort(key=lambda s: s['spot_label'])
-    
+
     # Create mapping
     for i, spot in enumerate(spots):
         if i < len(posList):
             spot_mapping[i] = spot['spot_label']
 
+    overlay = SpotOverlay(posList, [spot_mapping.get(i, f"SPOT{i}") for i in range(len(posList))],
+                          width, height)
+
 def empty(a):
     pass
 
-cv2.namedWindow("Vals")
-cv2.resizeWindow("Vals", 640, 240)
-cv2.createTrackbar("Val1", "Vals", 25, 50, empty)
-cv2.createTrackbar("Val2", "Vals", 16, 50, empty)
-cv2.createTrackbar("Val3", "Vals", 5, 50, empty)
-
-def checkSpaces():
+def checkSpaces(img, imgThres):
     """Check parking spaces and update database"""
     spaces = 0
-    
-    for i, pos in enumerate(posList):
-        x, y = pos
-        w, h = width, height
+    counts = scorer.score(imgThres)
+    tracker.update(counts)
+    if spot_statuses is not None:
+        spot_statuses.refresh()
+
+    # Confirmed status changes are committed together at the end of the frame
+    changes = []
+    # Reserved spots a car has parked in
+    arrivals = []
 
-        imgCrop = imgThres[y:y + h, x:x + w]
-        count = cv2.countNonZero(imgCrop)
+    states = []
+
+    for i in range(len(posList)):
+        occupied = tracker.occupied[i]
 
         # Get spot label from mapping
         spot_label = spot_mapping.get(i, f"SPOT{i}")
-        
-        # Get current spot status from database
-        spot = get_spot_by_label(spot_label)
-        
-        if spot:
-            # Don't override reserved spots
-            if spot['status'] == 'reserved':
-                color = (0, 165, 255)  # Orange for reserved
-                thic = 5
-            elif count < 900:
-                color = (0, 200, 0)  # Green for available
-                thic = 5
-                spaces += 1
-                # Update database only if status changed
-                if spot['status'] != 'available':
-                    update_spot_status(spot_label, 'available')
+
+        # Get current spot status from the in-memory table
+        status = spot_statuses.get(spot_label) if spot_statuses is not None else None
+
+        if not status:
+            states.append(None)
+        # Don't override reserved spots
+        elif status == 'reserved':
+            states.append('reserved')
+            if occupied:
+                arrivals.append(spot_label)
+        elif not occupied:
+            states.append('available')
+            spaces += 1
+            # Update database only if status changed
+            if status != 'available':
+                changes.append((spot_label, 'available', status))
+        else:
+            states.append('occupied')
+            # Update database only if status changed
+            if status != 'occupied':
+                changes.append((spot_label, 'occupied', status))
+
+    # Outlines and labels are only redrawn for spots whose state changed
+    if overlay is not None:
+        overlay.render(img, states, spaces)
+
+    if changes:
+        try:
+            # Spots changed by the web process since the last refresh are left alone
+            update_spot_statuses(changes)
+        except Exception as e:
+            print(f"Error saving spot statuses: {e}")
+
+    if arrivals:
+        try:
+            # The booking is checked in, so its grace period no longer applies
+            check_in_spots(arrivals)
+        except Exception as e:
+            print(f"Error checking in reserved spots: {e}")
+
+def run_gui(source='carPark.mp4'):
+    """Show the admin detection window and keep the database in sync"""
+    # Frames are decoded ahead on a background thread; the video loops forever
+    frames = open_source(source, loop=True)
+    pipeline = DetectionPipeline()
+
+    cv2.namedWindow("Vals")
+    cv2.resizeWindow("Vals", 640, 240)
+    cv2.createTrackbar("Val1", "Vals", 25, 50, empty)
+    cv2.createTrackbar("Val2", "Vals", 16, 50, empty)
+    cv2.createTrackbar("Val3", "Vals", 5, 50, empty)
+
+    # Initialize spot mapping
+    try:
+        initialize_spot_mapping()
+        print(f"Initialized {len(spot_mapping)} parking spots")
+    except Exception as e:
+        print(f"Error initializing spot mapping: {e}")
+        print("Make sure to run app.py first to initialize the database!")
+
+    print("Starting parking detection...")
+    print("Press 'q' or ESC to quit")
+
+    while True:
+        # Get image frame
+        success, img = frames.read()
+        if not success:
+            break
+
+        val1 = cv2.getTrackbarPos("Val1", "Vals")
+        val2 = cv2.getTrackbarPos("Val2", "Vals")
+        val3 = cv2.getTrackbarPos("Val3", "Vals")
+        if val1 % 2 == 0: val1 += 1
+        if val3 % 2 == 0: val3 += 1
+        pipeline.block_size, pipeline.c, pipeline.median_ksize = val1, val2, val3
+        imgThres = pipeline.threshold(img)
+
+        checkSpaces(img, imgThres)
+
+        # Display Output
+        cv2.imshow("PARKEASE - Admin View", img)
+
+        key = cv2.waitKey(10)
+        if key == ord('q') or key == 27:  # 'q' or ESC to quit
+            break
+
+    frames.close()
+    cv2.destroyAllWindows()
+
+
+class TimelineWriter:
+    """Write an occupancy timeline as CSV, NDJSON or a NumPy archive (.npz)
+
+    'transitions' mode records the starting state of every spot and then one
+    row per confirmed change; 'frames' mode records every frame.
+    """
+
+    def __init__(self, path, labels, mode='transitions'):
+        self.path = path
+        self.labels = labels
+        self.mode = mode
+        self.format = os.path.splitext(path)[1].lower().lstrip('.')
+        if self.format == 'jsonl':
+            self.format = 'ndjson'
+        if self.format not in ('csv', 'ndjson', 'npz'):
+            raise ValueError(f"Unsupported timeline format: {path} (use .csv, .ndjson or .npz)")
+
+        self._sources = []
+        self._rows = []
+        self._file = None
+        self._csv = None
+        if self.format != 'npz':
+            self._file = open(path, 'w', newline='')
+            if self.format == 'csv':
+                self._csv = csv.writer(self._file)
+                if mode == 'transitions':
+                    self._csv.writerow(['source', 'frame', 'time_s', 'spot_label', 'state'])
+                else:
+                    self._csv.writerow(['source', 'frame', 'time_s', 'free', 'occupied'])
+
+    def start_source(self, source):
+        """Begin a new input file; returns its index in the timeline"""
+        self._sources.append(source)
+        return len(self._sources) - 1
+
+    def write(self, frame, time_s, occupied, changed):
+        """Record one processed frame"""
+        source_index = len(self._sources) - 1
+        source = self._sources[source_index]
+
+        if self.mode == 'frames':
+            if self.format == 'npz':
+                self._rows.append((source_index, frame, time_s, np.packbits(occupied)))
+                return
+            bits = ''.join('1' if o else '0' for o in occupied)
+            free = int(len(occupied) - np.count_nonzero(occupied))
+            if self.format == 'csv':
+                self._csv.writerow([source, frame, f"{time_s:.3f}", free, bits])
             else:
-                color = (0, 0, 200)  # Red for occupied
-                thic = 2
-                # Update database only if status changed
-                if spot['status'] != 'occupied':
-                    update_spot_status(spot_label, 'occupied')
-
-            cv2.rectangle(img, (x, y), (x + w, y + h), color, thic)
-            
-            # Show spot label instead of count
-            cv2.putText(img, spot_label, (x + 5, y + 25), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-                        (255, 255, 255), 2)
-
-    cvzone.putTextRect(img, f'Free: {spaces}/{len(posList)}', (50, 60), thickness=3, offset=20,
-                       colorR=(0, 200, 0))
-
-# Initialize spot mapping
-try:
-    initialize_spot_mapping()
-    print(f"Initialized {len(spot_mapping)} parking spots")
-except Exception as e:
-    print(f"Error initializing spot mapping: {e}")
-    print("Make sure to run app.py first to initialize the database!")
-
-print("Starting parking detection...")
-print("Press 'q' or ESC to quit")
-
-while True:
-    # Get image frame
-    success, img = cap.read()
-    if not success:
-        break
-        
-    if cap.get(cv2.CAP_PROP_POS_FRAMES) == cap.get(cv2.CAP_PROP_FRAME_COUNT):
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-    
-    imgGray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    imgBlur = cv2.GaussianBlur(imgGray, (3, 3), 1)
-
-    val1 = cv2.getTrackbarPos("Val1", "Vals")
-    val2 = cv2.getTrackbarPos("Val2", "Vals")
-    val3 = cv2.getTrackbarPos("Val3", "Vals")
-    if val1 % 2 == 0: val1 += 1
-    if val3 % 2 == 0: val3 += 1
-    imgThres = cv2.adaptiveThreshold(imgBlur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                     cv2.THRESH_BINARY_INV, val1, val2)
-    imgThres = cv2.medianBlur(imgThres, val3)
-    kernel = np.ones((3, 3), np.uint8)
-    imgThres = cv2.dilate(imgThres, kernel, iterations=1)
-
-    checkSpaces()
-    
-    # Display Output
-    cv2.imshow("PARKEASE - Admin View", img)
-    
-    key = cv2.waitKey(10)
-    if key == ord('q') or key == 27:  # 'q' or ESC to quit
-        break
-
-cap.release()
-cv2.destroyAllWindows()
+                self._file.write(json.dumps({'source': source, 'frame': frame, 't': round(time_s, 3),
+                                             'free': free, 'occupied': bits}) + '\n')
+            return
+
+        for i in changed:
+            state = 'occupied' if occupied[i] else 'available'
+            if self.format == 'npz':
+                self._rows.append((source_index, frame, time_s, int(i), bool(occupied[i])))
+            elif self.format == 'csv':
+                self._csv.writerow([source, frame, f"{time_s:.3f}", self.labels[i], state])
+            else:
+                self._file.write(json.dumps({'source': source, 'frame': frame, 't': round(time_s, 3),
+                                             'spot': self.labels[i], 'state': state}) + '\n')
+
+    def close(self):
+        if self.format != 'npz':
+            self._file.close()
+            return
+
+        arrays = {'labels': np.array(self.labels), 'sources': np.array(self._sources)}
+        if self.mode == 'frames':
+            arrays['source'] = np.array([r[0] for r in self._rows], dtype=np.int32)
+            arrays['frame'] = np.array([r[1] for r in self._rows], dtype=np.int64)
+            arrays['time_s'] = np.array([r[2] for r in self._rows], dtype=np.float64)
+            # Occupancy bits packed 8 spots per byte; use np.unpackbits(..., axis=1)[:, :len(labels)]
+            arrays['occupied'] = np.array([r[3] for r in self._rows], dtype=np.uint8).reshape(len(self._rows), -1)
+        else:
+            arrays['source'] = np.array([r[0] for r in self._rows], dtype=np.int32)
+            arrays['frame'] = np.array([r[1] for r in self._rows], dtype=np.int64)
+            arrays['time_s'] = np.array([r[2] for r in self._rows], dtype=np.float64)
+            arrays['spot'] = np.array([r[3] for r in self._rows], dtype=np.int32)
+            arrays['occupied'] = np.array([r[4] for r in self._rows], dtype=bool)
+        np.savez_compressed(self.path, **arrays)
+
+
+def expand_inputs(inputs):
+    """Turn a list of videos, image directories and folders of videos into frame source specs"""
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            videos = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                      if name.lower().endswith(VIDEO_EXTENSIONS)]
+            # A directory without videos is treated as an image sequence
+            files.extend(videos or [path])
+        else:
+            files.append(path)
+    return files
+
+def spot_labels():
+    """Spot labels in position order, falling back to SPOT<i> without a database"""
+    try:
+        initialize_spot_mapping()
+    except Exception as e:
+        print(f"Database unavailable ({e}), using position-based spot labels")
+    return [spot_mapping.get(i, f"SPOT{i}") for i in range(len(posList))]
+
+def run_headless(inputs, output=None, timeline='transitions', block_size=25, c=16, median_ksize=5,
+                 incremental=False, roi=False, scale=1.0):
+    """Process video files as fast as possible and optionally write a timeline
+
+    incremental=True rescores only spots with motion (plus a periodic full
+    refresh); roi=True thresholds only the region the spots cover, shrunk by
+    scale when it is below 1.
+    """
+    files = expand_inputs(inputs)
+    if not files:
+        print("No video files to process")
+        return 1
+
+    labels = spot_labels()
+    writer = TimelineWriter(output, labels, timeline) if output else None
+    all_spots = np.arange(len(posList))
+
+    total_frames = 0
+    total_started = time.perf_counter()
+    try:
+        for path in files:
+            source = open_source(path).start()
+            if not source.opened:
+                print(f"✗ Could not open {path}")
+                continue
+
+            fps = source.fps or 30.0
+            file_tracker = OccupancyTracker(len(posList), occupied_threshold=tracker.occupied_threshold,
+                                            vacant_threshold=tracker.vacant_threshold,
+                                            min_frames=tracker.min_frames)
+            if writer:
+                writer.start_source(os.path.basename(path))
+            file_scorer = create_scorer(posList, width, height, incremental=incremental, roi=roi, scale=scale,
+                                        block_size=block_size, c=c, median_ksize=median_ksize)
+
+            frames = 0
+            started = time.perf_counter()
+            for img in source:
+                changed = file_tracker.update(file_scorer.score(img))
+                if writer:
+                    # The first frame records every spot's starting state
+                    writer.write(frames, frames / fps, file_tracker.occupied,
+                                 all_spots if frames == 0 else changed)
+                frames += 1
+
+            source.close()
+            elapsed = time.perf_counter() - started
+            total_frames += frames
+            print(f"✓ {path}: {frames} frames in {elapsed:.1f}s ({frames / max(elapsed, 1e-9):.1f} FPS)")
+            if incremental and file_scorer.frames:
+                print(f"  rescored {file_scorer.spots_rescored / file_scorer.frames:.1f} of {len(posList)} "
+                      f"spots per frame, {file_scorer.full_refreshes} full refreshes")
+    finally:
+        if writer:
+            writer.close()
+
+    elapsed = time.perf_counter() - total_started
+    print(f"Processed {total_frames} frames from {len(files)} file(s) in {elapsed:.1f}s "
+          f"({total_frames / max(elapsed, 1e-9):.1f} FPS)")
+    if output:
+        print(f"Occupancy timeline written to {output}")
+    return 0
+
+def run_comparison(path, max_frames=300, scales=(1.0, 0.75, 0.5)):
+    """Report speed and accuracy of ROI/downscaled modes against full resolution"""
+    frames = []
+    with open_source(path) as source:
+        for img in source:
+            frames.append(img)
+            if len(frames) >= max_frames:
+                break
+    if not frames:
+        print(f"✗ No frames read from {path}")
+        return 1
+
+    print(f"Comparing detection modes on {len(frames)} frames of {path}")
+    print(f"{'mode':<12} {'ms/frame':>9} {'speedup':>8} {'agreement':>10} {'mean |err|':>11}")
+    for row in compare_modes(frames, posList, width, height, scales):
+        print(f"{row['mode']:<12} {row['ms_per_frame']:>9.2f} {row['speedup']:>7.2f}x "
+              f"{row['agreement'] * 100:>9.2f}% {row['mean_abs_error']:>11.1f}")
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='PARKEASE parking detection')
+    parser.add_argument('--headless', nargs='+', metavar='VIDEO',
+                        help='process video files, video folders or image directories without a window, as fast as possible')
+    parser.add_argument('--output', help='occupancy timeline file (.csv, .ndjson or .npz)')
+    parser.add_argument('--timeline', choices=['transitions', 'frames'], default='transitions',
+                        help='record only state changes (default) or every frame')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only rescore spots with motion since the previous frame')
+    parser.add_argument('--roi', action='store_true',
+                        help='threshold only the bounding box of the parking spots')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='downscale factor for the ROI (e.g. 0.5); counts are rescaled to match')
+    parser.add_argument('--compare-modes', metavar='VIDEO',
+                        help='report speedup and accuracy of ROI/downscaled modes against full resolution')
+    parser.add_argument('--source', default='carPark.mp4', help='video file, image directory or stream URL shown in the detection window')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare_modes:
+        return run_comparison(args.compare_modes)
+    if args.headless:
+        return run_headless(args.headless, args.output, args.timeline, incremental=args.incremental,
+                            roi=args.roi or args.scale != 1.0, scale=args.scale)
+    run_gui(args.source)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,248 @@
+"""
+PARKEASE schema migrations
+init_db() creates the base tables; everything added after that lives here as
+numbered migrations. Each runs once per database and is recorded in the
+schema_migrations table, so existing deployments pick up new indexes and
+columns on their next start.
+
+    python migrations.py           # apply pending migrations
+    python migrations.py --check   # show whether the hot queries use an index
+"""
+import argparse
+import sys
+from datetime import timedelta
+
+
+def _backfill_booking_end_times(cursor, use_postgres):
+    """Normalise arrival_time and fill in end_time for existing bookings
+
+    A booking whose arrival_time does not parse is taken to start when it was
+    made; one where neither parses is cancelled, so that no holding booking
+    is left without the end_time the overlap checks rely on.
+    """
+    from database import parse_timestamp
+
+    placeholder = '%s' if use_postgres else '?'
+    cursor.execute('SELECT id, arrival_time, booking_time, duration FROM bookings WHERE end_time IS NULL')
+    updates = []
+    cancelled = []
+    for booking_id, arrival_time, booking_time, duration in cursor.fetchall():
+        arrival = parse_timestamp(arrival_time) or parse_timestamp(booking_time)
+        if arrival is None:
+            print(f"Cancelling booking {booking_id}: unreadable arrival time {arrival_time!r}")
+            cancelled.append((booking_id,))
+            continue
+        updates.append((arrival, arrival + timedelta(hours=duration), booking_id))
+    cursor.executemany(
+        f'UPDATE bookings SET arrival_time = {placeholder}, end_time = {placeholder} WHERE id = {placeholder}',
+        updates)
+    # end_time is filled in so the next backfill skips them
+    cursor.executemany(
+        f"UPDATE bookings SET status = 'cancelled', end_time = arrival_time WHERE id = {placeholder}",
+        cancelled)
+
+
+# (version, description, statements); a statement may be a dict keyed by dialect,
+# or a function(cursor, use_postgres) for data changes
+MIGRATIONS = [
+    (1, 'Indexes for the hot queries', [
+        'CREATE INDEX IF NOT EXISTS idx_bookings_phone_time ON bookings (user_phone, booking_time)',
+        'CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings (status)',
+        'CREATE INDEX IF NOT EXISTS idx_parking_logs_timestamp ON parking_logs (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_occupancy_stats_timestamp ON occupancy_stats (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_spots_status ON spots (status)',
+    ]),
+    (2, 'Email outbox', [
+        {
+            'sqlite': '''
+                CREATE TABLE IF NOT EXISTS email_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    to_email TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    status TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at TIMESTAMP,
+                    claimed_by TEXT,
+                    last_error TEXT,
+                    created_at TIMESTAMP,
+                    sent_at TIMESTAMP
+                )
+            ''',
+            'postgres': '''
+                CREATE TABLE IF NOT EXISTS email_outbox (
+                    id SERIAL PRIMARY KEY,
+                    to_email VARCHAR NOT NULL,
+                    subject VARCHAR NOT NULL,
+                    body TEXT NOT NULL,
+                    status VARCHAR DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at TIMESTAMP,
+                    claimed_by VARCHAR,
+                    last_error TEXT,
+                    created_at TIMESTAMP,
+                    sent_at TIMESTAMP
+                )
+            ''',
+        },
+        'CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at)',
+    ]),
+    (3, 'Waitlist queue index', [
+        'CREATE INDEX IF NOT EXISTS idx_waitlist_status_time ON waitlist (status, requested_time)',
+    ]),
+    (4, 'Booking end times for the reservation calendar', [
+        {
+            'sqlite': 'ALTER TABLE bookings ADD COLUMN end_time TIMESTAMP',
+            'postgres': 'ALTER TABLE bookings ADD COLUMN IF NOT EXISTS end_time TIMESTAMP',
+        },
+        _backfill_booking_end_times,
+        'CREATE INDEX IF NOT EXISTS idx_bookings_spot_window ON bookings (spot_label, arrival_time, end_time)',
+    ]),
+    (5, 'Keyset pagination of logs and feedback', [
+        # SQLite indexes end in the rowid already, so (timestamp) covers (timestamp, id) there
+        'CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback (timestamp, id)',
+        {'postgres': 'CREATE INDEX IF NOT EXISTS idx_parking_logs_timestamp_id ON parking_logs (timestamp, id)'},
+    ]),
+    # Migration 4 skipped bookings with an unreadable arrival_time, leaving them without an end_time
+    (6, 'Booking end times for bookings with unreadable arrival times', [
+        _backfill_booking_end_times,
+    ]),
+]
+
+
+# Queries behind the busiest pages and the index each one should use
+HOT_QUERIES = {
+    'my_bookings': (
+        'SELECT * FROM bookings WHERE user_phone = {p} ORDER BY booking_time DESC',
+        ('03001234567',), 'idx_bookings_phone_time'),
+    'active_bookings': (
+        "SELECT s.id, b.id FROM spots s LEFT JOIN bookings b ON b.id = ("
+        "SELECT id FROM bookings WHERE spot_label = s.spot_label AND status IN ('active', 'parked') "
+        "ORDER BY arrival_time LIMIT 1) "
+        "WHERE s.status <> 'available' AND s.id > {p} ORDER BY s.id LIMIT {p}",
+        (0, 51), 'idx_bookings_spot_window'),
+    'parking_logs': (
+        'SELECT * FROM parking_logs WHERE (timestamp, id) < ({p}, {p}) ORDER BY timestamp DESC, id DESC LIMIT {p}',
+        ('2026-01-01 00:00:00', 1000, 51), 'idx_parking_logs_timestamp'),
+    'feedback': (
+        'SELECT * FROM feedback WHERE (timestamp, id) < ({p}, {p}) ORDER BY timestamp DESC, id DESC LIMIT {p}',
+        ('2026-01-01 00:00:00', 1000, 51), 'idx_feedback_timestamp'),
+    'occupancy_trends': (
+        'SELECT * FROM occupancy_stats WHERE timestamp >= {p} ORDER BY timestamp ASC',
+        ('2026-01-01 00:00:00',), 'idx_occupancy_stats_timestamp'),
+    'booking_overlap': (
+        "SELECT id FROM bookings WHERE spot_label = {p} AND status IN ('scheduled', 'active', 'parked') "
+        "AND arrival_time < {p} AND end_time > {p} LIMIT 1",
+        ('A1', '2026-01-01 12:00:00', '2026-01-01 10:00:00'), 'idx_bookings_spot_window'),
+    'spots_by_status': (
+        "SELECT COUNT(*) FROM spots WHERE status = 'available'",
+        (), 'idx_spots_status'),
+}
+
+
+def _dialect(use_postgres):
+    return 'postgres' if use_postgres else 'sqlite'
+
+
+def applied_versions(conn):
+    """Versions already recorded in schema_migrations"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT version FROM schema_migrations')
+    return {row[0] for row in cursor.fetchall()}
+
+
+def run_migrations(conn, use_postgres=False):
+    """Apply every pending migration in order, one transaction each; returns the versions applied"""
+    dialect = _dialect(use_postgres)
+    placeholder = '%s' if use_postgres else '?'
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if use_postgres:
+            # Serialize concurrent starts (web app and detector) on the same database
+            cursor.execute('SELECT pg_advisory_xact_lock(4711)')
+        else:
+            cursor.execute('BEGIN IMMEDIATE')
+        if version in applied_versions(conn):
+            conn.rollback()
+            continue
+        try:
+            for statement in statements:
+                if isinstance(statement, dict):
+                    statement = statement.get(dialect)
+                    if statement is None:
+                        continue
+                if callable(statement):
+                    statement(cursor, use_postgres)
+                else:
+                    cursor.execute(statement)
+            cursor.execute(
+                f'INSERT INTO schema_migrations (version, description) VALUES ({placeholder}, {placeholder})',
+                (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        print(f"Applied migration {version}: {description}")
+    return applied
+
+
+def query_plan(conn, sql, params, use_postgres=False):
+    """EXPLAIN a query and return the plan as one line per step"""
+    cursor = conn.cursor()
+    if use_postgres:
+        # Small tables are cheaper to scan; ask whether an index is usable at all
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'EXPLAIN {sql}', params)
+        plan = [row[0] for row in cursor.fetchall()]
+        conn.rollback()
+    else:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        plan = [row[-1] for row in cursor.fetchall()]
+    return plan
+
+
+def check_query_plans(conn, use_postgres=False):
+    """Return {name: (uses_expected_index, plan)} for every hot query"""
+    placeholder = '%s' if use_postgres else '?'
+    results = {}
+    for name, (sql, params, index) in HOT_QUERIES.items():
+        plan = query_plan(conn, sql.format(p=placeholder), params, use_postgres)
+        results[name] = (any(index in step for step in plan), plan)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PARKEASE schema migrations')
+    parser.add_argument('--check', action='store_true',
+                        help='verify that the hot queries use their indexes')
+    args = parser.parse_args(argv)
+
+    from database import USE_POSTGRES, db_connection, init_db
+
+    # init_db() creates any missing tables and applies pending migrations
+    init_db()
+    if not args.check:
+        return 0
+
+    with db_connection() as conn:
+        results = check_query_plans(conn, USE_POSTGRES)
+    failed = 0
+    for name, (uses_index, plan) in results.items():
+        print(f"{'✓' if uses_index else '✗'} {name}: {' / '.join(plan)}")
+        failed += not uses_index
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
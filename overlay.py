@@ -0,0 +1,171 @@
+"""
+Cached annotation overlay for detection frames
+Spot outlines and labels are rendered once per state, kept on an overlay
+layer that only changes when a spot changes state, and composited onto each
+frame with a single masked copy (plus a blend of anti-aliased text edges).
+"""
+import cv2
+import cvzone
+import numpy as np
+
+from detection import SPOT_WIDTH, SPOT_HEIGHT
+
+# Outline color (BGR) and thickness for each spot state
+STATE_STYLES = {
+    'available': ((0, 200, 0), 5),   # Green
+    'occupied': ((0, 0, 200), 2),    # Red
+    'reserved': ((0, 165, 255), 5),  # Orange
+}
+
+LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+LABEL_SCALE = 0.5
+LABEL_THICKNESS = 2
+
+
+class SpotOverlay:
+    """Annotated-frame renderer that redraws only spots whose state changed"""
+
+    def __init__(self, positions, labels, width=SPOT_WIDTH, height=SPOT_HEIGHT):
+        self.positions = [tuple(int(v) for v in pos) for pos in positions]
+        self.labels = list(labels)
+        self.width = width
+        self.height = height
+        self.states = [None] * len(self.positions)
+
+        self._shape = None
+        self._sprites = {}
+        self._counters = {}
+
+        # Region each spot can touch: the outline (widened by the thickest line) and its label
+        pad = max(thic for _, thic in STATE_STYLES.values()) // 2 + 1
+        self._boxes = []
+        for (x, y), label in zip(self.positions, self.labels):
+            (text_w, text_h), baseline = cv2.getTextSize(label, LABEL_FONT, LABEL_SCALE, LABEL_THICKNESS)
+            x1 = min(x - pad, x + 5 - LABEL_THICKNESS)
+            y1 = min(y - pad, y + 25 - text_h - LABEL_THICKNESS)
+            x2 = max(x + width + pad, x + 5 + text_w + LABEL_THICKNESS) + 1
+            y2 = max(y + height + pad, y + 25 + baseline + LABEL_THICKNESS) + 1
+            self._boxes.append((x1, y1, x2, y2))
+
+        # Spots whose regions overlap have to be redrawn together, in list order
+        self._neighbors = []
+        for i, (ax1, ay1, ax2, ay2) in enumerate(self._boxes):
+            self._neighbors.append([j for j, (bx1, by1, bx2, by2) in enumerate(self._boxes)
+                                    if ax1 < bx2 and bx1 < ax2 and ay1 < by2 and by1 < ay2])
+
+    def _resize(self, shape):
+        rows, cols = shape[:2]
+        self._shape = shape[:2]
+        # Premultiplied color and coverage of everything drawn so far
+        self.layer = np.zeros((rows, cols, 3), np.uint8)
+        self.alpha = np.zeros((rows, cols), np.uint8)
+        # Fully covered pixels are copied; anti-aliased edges are blended
+        self.mask = np.zeros((rows, cols), np.uint8)
+        self._partial = None
+        self._antialiased = False
+        self._clipped = [(max(x1, 0), max(y1, 0), min(x2, cols), min(y2, rows))
+                         for x1, y1, x2, y2 in self._boxes]
+        self._sprites = {}
+        self._counters = {}
+        self.states = [None] * len(self.positions)
+
+    def _draw(self, img, i, state, offset):
+        x, y = self.positions[i]
+        ox, oy = offset
+        color, thic = STATE_STYLES[state]
+        cv2.rectangle(img, (x - ox, y - oy), (x - ox + self.width, y - oy + self.height), color, thic)
+        cv2.putText(img, self.labels[i], (x - ox + 5, y - oy + 25), LABEL_FONT, LABEL_SCALE,
+                    (255, 255, 255), LABEL_THICKNESS)
+
+    def _sprite(self, i, state):
+        """Premultiplied pixels and coverage of spot i in a state, rendered once and cached"""
+        key = (i, state)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            x1, y1, x2, y2 = self._clipped[i]
+            # Drawing over black and over white recovers coverage for anti-aliased edges too
+            black = np.zeros((y2 - y1, x2 - x1, 3), np.uint8)
+            white = np.full_like(black, 255)
+            self._draw(black, i, state, (x1, y1))
+            self._draw(white, i, state, (x1, y1))
+            alpha = (255 - (white.astype(np.int16) - black).max(axis=2)).clip(0, 255).astype(np.uint8)
+            self._antialiased |= bool(np.any((alpha > 0) & (alpha < 255)))
+            sprite = self._sprites[key] = (black, alpha)
+        return sprite
+
+    def _redraw_region(self, i):
+        """Rebuild the layer inside spot i's region from every spot that overlaps it"""
+        rx1, ry1, rx2, ry2 = self._clipped[i]
+        if rx1 >= rx2 or ry1 >= ry2:
+            return
+        layer = self.layer[ry1:ry2, rx1:rx2]
+        alpha = self.alpha[ry1:ry2, rx1:rx2]
+        layer[:] = 0
+        alpha[:] = 0
+        for j in self._neighbors[i]:
+            state = self.states[j]
+            if state is None:
+                continue
+            patch, coverage = self._sprite(j, state)
+            x1, y1, x2, y2 = self._clipped[j]
+            # Intersection of spot j's sprite with the region being rebuilt
+            ix1, iy1, ix2, iy2 = max(x1, rx1), max(y1, ry1), min(x2, rx2), min(y2, ry2)
+            if ix1 >= ix2 or iy1 >= iy2:
+                continue
+            src = (slice(iy1 - y1, iy2 - y1), slice(ix1 - x1, ix2 - x1))
+            dst = (slice(iy1 - ry1, iy2 - ry1), slice(ix1 - rx1, ix2 - rx1))
+            # Later spots are drawn over earlier ones, as in the original drawing order
+            a = coverage[src].astype(np.uint16)
+            keep = 255 - a
+            layer[dst] = patch[src] + (layer[dst] * keep[..., None] + 127) // 255
+            alpha[dst] = a + (alpha[dst] * keep + 127) // 255
+        self.mask[ry1:ry2, rx1:rx2] = (alpha == 255) * np.uint8(255)
+        self._partial = None
+
+    def update(self, states):
+        """Set the state of every spot ('available', 'occupied', 'reserved' or None)"""
+        changed = [i for i, state in enumerate(states) if state != self.states[i]]
+        for i in changed:
+            self.states[i] = states[i]
+        for i in changed:
+            self._redraw_region(i)
+        return changed
+
+    def _counter(self, spaces, total):
+        key = (spaces, total)
+        counter = self._counters.get(key)
+        if counter is None:
+            canvas = np.zeros(self._shape + (3,), np.uint8)
+            _, (x1, y1, x2, y2) = cvzone.putTextRect(canvas, f'Free: {spaces}/{total}', (50, 60),
+                                                    thickness=3, offset=20, colorR=(0, 200, 0))
+            rows, cols = self._shape
+            x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2 + 1, cols), min(y2 + 1, rows)
+            counter = self._counters[key] = (y1, y2, x1, x2, canvas[y1:y2, x1:x2].copy())
+        return counter
+
+    def render(self, img, states, spaces=None):
+        """Draw every spot and the free-space counter onto img in place"""
+        if self._shape != img.shape[:2]:
+            self._resize(img.shape)
+        self.update(states)
+
+        cv2.copyTo(self.layer, self.mask, img)
+        if self._partial is None:
+            if self._antialiased:
+                edges = np.flatnonzero((self.alpha > 0) & (self.alpha < 255))
+            else:
+                edges = np.empty(0, np.intp)
+            # Byte offsets of every channel of every edge pixel
+            channels = (edges[:, None] * 3 + np.arange(3)).ravel()
+            self._partial = (channels, self.layer.reshape(-1)[channels].astype(np.uint16),
+                             np.repeat(255 - self.alpha.reshape(-1)[edges].astype(np.uint16), 3))
+        channels, colors, keep = self._partial
+        if len(channels):
+            flat = img.reshape(-1)
+            flat[channels] = colors + (flat[channels] * keep + 127) // 255
+
+        if spaces is None:
+            spaces = sum(1 for state in states if state == 'available')
+        y1, y2, x1, x2, patch = self._counter(spaces, len(self.positions))
+        img[y1:y2, x1:x2] = patch
+        return img
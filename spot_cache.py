@@ -0,0 +1,310 @@
+"""
+In-memory spot status tables
+Loads every spot once, then stays fresh from change notifications in this
+process and a cheap changed-since query for writes made by other processes.
+
+SpotStatusTable serves the detection loops; SpotView keeps whole spot rows
+for the web API and pushes each change to subscribed clients.
+"""
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+
+from database import add_spot_listener, remove_spot_listener, get_all_spots, get_spot_statuses
+
+# Spot fields that only change when the lot is re-mapped (see parkingSpacePicker.py)
+LAYOUT_FIELDS = ('id', 'spot_label', 'x', 'y', 'width', 'height', 'location')
+
+# 2-bit codes of the packed status array; anything else is 3
+STATUS_CODES = {'available': 0, 'occupied': 1, 'reserved': 2}
+
+
+def pack_statuses(statuses):
+    """Pack statuses into 2 bits each, four per byte, lowest bits first, as base64"""
+    packed = bytearray((len(statuses) + 3) // 4)
+    for i, status in enumerate(statuses):
+        packed[i // 4] |= STATUS_CODES.get(status, 3) << (2 * (i % 4))
+    return base64.b64encode(bytes(packed)).decode('ascii')
+
+
+class SpotStatusTable:
+    """Spot label -> status map that needs no database round-trip per frame"""
+
+    def __init__(self, refresh_interval=1.0, full_reload_interval=60.0):
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+
+        self._lock = threading.Lock()
+        self._status = {}
+        self._last_updated = None
+        self._checked_at = 0.0
+        self._reloaded_at = 0.0
+
+        add_spot_listener(self._on_change)
+        self.reload()
+
+    def reload(self):
+        """Load the status of every spot from the database"""
+        rows = get_spot_statuses()
+        now = time.monotonic()
+        with self._lock:
+            self._status = {label: status for label, status, _ in rows}
+            self._last_updated = max((updated for _, _, updated in rows if updated is not None), default=None)
+            self._checked_at = self._reloaded_at = now
+
+    def refresh(self):
+        """Pick up changes made by other processes, at most once per refresh_interval"""
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_interval:
+            return
+
+        try:
+            if self._last_updated is None or now - self._reloaded_at >= self.full_reload_interval:
+                self.reload()
+                return
+
+            rows = get_spot_statuses(since=self._last_updated)
+            with self._lock:
+                for label, status, updated in rows:
+                    self._set(label, status)
+                    if updated is not None and updated > self._last_updated:
+                        self._last_updated = updated
+                self._checked_at = now
+        except Exception as e:
+            # Keep serving the last known statuses until the database is back
+            print(f"Spot status refresh error: {e}")
+            self._checked_at = now
+
+    def get(self, spot_label, default=None):
+        """Return the cached status of a spot"""
+        return self._status.get(spot_label, default)
+
+    def close(self):
+        """Stop listening for spot changes"""
+        remove_spot_listener(self._on_change)
+
+    def _set(self, spot_label, status):
+        """Store one spot's status; called with the lock held"""
+        self._status[spot_label] = status
+
+    def _on_change(self, spot_label, status):
+        with self._lock:
+            self._set(spot_label, status)
+
+
+class SpotSubscription:
+    """One client's queue of spot changes
+
+    If the client falls more than max_queue changes behind, the queue is
+    dropped and the client is told to fetch a fresh snapshot instead.
+    """
+
+    def __init__(self, view, max_queue=256):
+        self.view = view
+        self.max_queue = max_queue
+        self.closed = False
+        self._changes = deque()
+        self._resync = False
+        self._cond = threading.Condition()
+
+    def _push(self, change):
+        with self._cond:
+            if len(self._changes) >= self.max_queue:
+                self._changes.clear()
+                self._resync = True
+            elif not self._resync:
+                self._changes.append(change)
+            self._cond.notify()
+
+    def get(self, timeout=15.0):
+        """Return the pending changes ([] on timeout), or None if a new snapshot is needed"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._changes or self._resync or self.closed, timeout)
+            if self._resync:
+                self._resync = False
+                return None
+            changes = list(self._changes)
+            self._changes.clear()
+            return changes
+
+    def close(self):
+        """Stop receiving changes"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self.view.unsubscribe(self)
+
+
+class SpotView(SpotStatusTable):
+    """Every spot row kept in memory for the web API, pushing changes to subscribers
+
+    Writes made in this process arrive as notifications. One background
+    thread per process picks up the detector's writes from its own process.
+    Every change bumps a version number, so clients can ask for just the
+    spots that changed since the version they last saw.
+    """
+
+    def __init__(self, refresh_interval=1.0, full_reload_interval=60.0):
+        self._spots = {}
+        self._subscribers = []
+        self.version = 0
+        # Distinguishes this view's version numbers from another process's
+        self.token = f"{int(time.time() * 1000):x}"
+        self._versions = {}
+        self._counts = {}
+        self._cached = None
+        self._cached_status = None
+        self._layout = None
+        super().__init__(refresh_interval, full_reload_interval)
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True, name='spot-view')
+        self._thread.start()
+
+    def reload(self):
+        """Load every spot row from the database"""
+        spots = get_all_spots()
+        now = time.monotonic()
+        with self._lock:
+            previous = self._spots
+            self._spots = {spot['spot_label']: spot for spot in spots}
+            self._status = {label: spot['status'] for label, spot in self._spots.items()}
+            self._last_updated = max((spot['last_updated'] for spot in spots if spot['last_updated'] is not None),
+                                     default=None)
+            self._checked_at = self._reloaded_at = now
+
+            layout = [{field: spot.get(field) for field in LAYOUT_FIELDS} for spot in self._spots.values()]
+            digest = hashlib.sha1(json.dumps(layout, default=str).encode()).hexdigest()[:12]
+            if self._layout is None or self._layout['layout_version'] != digest:
+                if self._layout is not None:
+                    # Re-mapped lot: every row counts as changed for delta clients
+                    self.version += 1
+                    self._versions = dict.fromkeys(self._spots, self.version)
+                self._layout = {'layout_version': digest, 'spots': layout}
+
+            self._counts = {}
+            for label, spot in self._spots.items():
+                self._counts[spot['status']] = self._counts.get(spot['status'], 0) + 1
+                old = previous.get(label)
+                if old is None or old['status'] != spot['status']:
+                    self.version += 1
+                    self._versions[label] = self.version
+                    if old is not None:
+                        self._publish({'spot_label': label, 'status': spot['status'], 'version': self.version})
+
+    def snapshot(self, since=None):
+        """Return {'version', 'cursor', 'spots', 'stats'} with spot rows in label order
+
+        cursor is '<token>-<version>'. Given one as since, only the spots
+        changed after that version are listed and 'since' is echoed back. A
+        cursor this view never handed out (e.g. from before a restart, whose
+        version numbers started over) gets the full list instead.
+        """
+        with self._lock:
+            version = self._since_version(since)
+            if version is not None:
+                return {
+                    'version': self.version,
+                    'cursor': f"{self.token}-{self.version}",
+                    'since': since,
+                    'spots': [dict(spot) for label, spot in self._spots.items() if self._versions[label] > version],
+                    'stats': self._stats(),
+                }
+
+            # The full list only changes with the version, so it is built once per version
+            if self._cached is None or self._cached['version'] != self.version:
+                self._cached = {
+                    'version': self.version,
+                    'cursor': f"{self.token}-{self.version}",
+                    'spots': [dict(spot) for spot in self._spots.values()],
+                    'stats': self._stats(),
+                }
+            return self._cached
+
+    def _since_version(self, since):
+        """Version of a delta cursor handed out by this view, or None; called with the lock held"""
+        if not since:
+            return None
+        token, _, version = since.rpartition('-')
+        if token != self.token or not version.isdigit() or int(version) > self.version:
+            return None
+        return int(version)
+
+    def layout(self):
+        """Return {'layout_version', 'spots'} with the geometry of every spot in label order"""
+        with self._lock:
+            return self._layout
+
+    def status(self):
+        """Return every spot's status packed in label order (see pack_statuses), with stats"""
+        with self._lock:
+            if self._cached_status is None or self._cached_status['version'] != self.version:
+                self._cached_status = {
+                    'version': self.version,
+                    'layout_version': self._layout['layout_version'],
+                    'states': pack_statuses([spot['status'] for spot in self._spots.values()]),
+                    'stats': self._stats(),
+                }
+            return self._cached_status
+
+    def subscribe(self, max_queue=256):
+        """Start receiving spot changes; take the snapshot after subscribing so none are missed"""
+        subscription = SpotSubscription(self, max_queue)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def close(self):
+        """Stop the refresher thread and listening for spot changes"""
+        super().close()
+        self._stop.set()
+
+    def _set(self, spot_label, status):
+        spot = self._spots.get(spot_label)
+        if spot is None or spot['status'] == status:
+            return
+        self._counts[spot['status']] -= 1
+        self._counts[status] = self._counts.get(status, 0) + 1
+        spot['status'] = status
+        self._status[spot_label] = status
+        self.version += 1
+        self._versions[spot_label] = self.version
+        self._publish({'spot_label': spot_label, 'status': status, 'version': self.version})
+
+    def _stats(self):
+        return {
+            'total': len(self._spots),
+            'available': self._counts.get('available', 0),
+            'occupied': self._counts.get('occupied', 0),
+            'reserved': self._counts.get('reserved', 0),
+        }
+
+    def _publish(self, change):
+        # Called with the lock held so every subscriber sees changes in the same order
+        for subscription in self._subscribers:
+            subscription._push(change)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
+
+
+_view = None
+_view_lock = threading.Lock()
+
+
+def get_spot_view():
+    """Return the process-wide SpotView, loading it on first use"""
+    global _view
+    with _view_lock:
+        if _view is None:
+            _view = SpotView()
+        return _view
@@ -0,0 +1,100 @@
+"""
+SQLite storage profile
+Connection settings that let the detector write while the web app reads:
+WAL journaling (readers no longer wait for writers), a busy timeout instead
+of immediate "database is locked" errors, synchronous=NORMAL (safe in WAL
+mode), and a larger page cache plus memory-mapped reads.
+
+A background scheduler checkpoints the WAL so it does not keep growing
+while readers are always connected.
+
+SQLITE_PROFILE=rollback restores SQLite's own defaults for comparison.
+"""
+import os
+import sqlite3
+import threading
+
+PROFILES = {
+    # SQLite defaults: rollback journal, full fsync on every commit
+    'rollback': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+    },
+    'wal': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,               # ms to wait for a lock before failing
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,               # KiB (16 MB)
+        'mmap_size': 256 * 1024 * 1024,     # bytes
+        'temp_store': 'MEMORY',
+    },
+}
+
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'wal')
+
+
+def apply_profile(conn, profile=None):
+    """Apply a profile's PRAGMAs to a new connection"""
+    for pragma, value in PROFILES[profile or SQLITE_PROFILE].items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
+
+
+class CheckpointScheduler(threading.Thread):
+    """Checkpoints the WAL every interval seconds, truncating it once it grows too large"""
+
+    def __init__(self, path, interval=30.0, truncate_bytes=64 * 1024 * 1024):
+        super().__init__(daemon=True, name='sqlite-checkpoint')
+        self.path = path
+        self.interval = interval
+        self.truncate_bytes = truncate_bytes
+        self.checkpoints = 0
+        self.truncations = 0
+        self.last_result = None
+        self._stopping = threading.Event()
+
+    def checkpoint(self, conn):
+        """Run one checkpoint; returns (busy, wal_pages, checkpointed_pages)"""
+        wal_path = self.path + '-wal'
+        wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        # PASSIVE never blocks the detector or readers; TRUNCATE also shrinks the file
+        mode = 'TRUNCATE' if wal_size > self.truncate_bytes else 'PASSIVE'
+        self.last_result = conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+        self.checkpoints += 1
+        if mode == 'TRUNCATE':
+            self.truncations += 1
+        return self.last_result
+
+    def run(self):
+        conn = None
+        try:
+            conn = sqlite3.connect(self.path)
+            apply_profile(conn, 'wal')
+            while not self._stopping.wait(self.interval):
+                try:
+                    self.checkpoint(conn)
+                except sqlite3.Error as e:
+                    print(f"WAL checkpoint error: {e}")
+        except Exception as e:
+            print(f"Checkpoint scheduler error: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def stop(self):
+        self._stopping.set()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_checkpoint_scheduler(path, **kwargs):
+    """Start the process-wide checkpoint scheduler for a WAL database (no-op otherwise)"""
+    global _scheduler
+    if PROFILES[SQLITE_PROFILE].get('journal_mode') != 'WAL':
+        return None
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = CheckpointScheduler(path, **kwargs)
+            _scheduler.start()
+        return _scheduler
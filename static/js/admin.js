@@ -6,13 +6,197 @@ document.addEventListener('DOMContentLoaded', function() {
     initCharts();
     loadAnalyticsData();
     
-    // Auto-refresh every 10 seconds
-    setInterval(() => {
-        loadAnalyticsData();
-        updateStats();
-    }, 10000);
+    // Auto-refresh charts every 10 seconds
+    setInterval(loadAnalyticsData, 10000);
+    
+    // Live spot counts over Server-Sent Events, polling every 10 seconds if unavailable
+    watchSpots(data => updateStats(data.stats), 10000);
+    
+    initPagedLists();
 });
 
+let bookingsList;
+
+// Bookings, logs and feedback are loaded a page at a time as their panels are scrolled
+function initPagedLists() {
+    bookingsList = pagedList({
+        url: '/admin/api/bookings',
+        key: 'bookings',
+        cursor: data => data.next_after,
+        cursorParam: 'after',
+        container: document.getElementById('bookings-body'),
+        sentinel: document.getElementById('bookings-more'),
+        render: renderBookingRow,
+        empty: '<tr><td colspan="6" class="text-center text-muted">No active bookings</td></tr>'
+    });
+    
+    pagedList({
+        url: '/admin/api/logs',
+        key: 'logs',
+        cursor: data => data.next_cursor,
+        cursorParam: 'cursor',
+        container: document.getElementById('logs-body'),
+        sentinel: document.getElementById('logs-more'),
+        render: renderLogRow,
+        empty: '<tr><td colspan="4" class="text-center text-muted">No logs available</td></tr>'
+    });
+    
+    pagedList({
+        url: '/admin/api/feedback',
+        key: 'feedback',
+        cursor: data => data.next_cursor,
+        cursorParam: 'cursor',
+        container: document.getElementById('feedback-list'),
+        sentinel: document.getElementById('feedback-more'),
+        render: renderFeedback,
+        empty: '<div class="col-12 text-center text-muted">No feedback received yet</div>'
+    });
+    
+    // Filtering starts the bookings list over from the first page
+    const filter = document.getElementById('bookings-filter');
+    let typing;
+    filter.addEventListener('submit', e => {
+        e.preventDefault();
+        bookingsList.reset(new URLSearchParams(new FormData(filter)));
+    });
+    filter.elements.status.addEventListener('change', () => filter.requestSubmit());
+    filter.elements.q.addEventListener('input', () => {
+        clearTimeout(typing);
+        typing = setTimeout(() => filter.requestSubmit(), 300);
+    });
+}
+
+// A list that fetches its next page whenever its sentinel scrolls into view
+function pagedList(options) {
+    let cursor = null;
+    let params = new URLSearchParams();
+    let loading = false;
+    let done = false;
+    let generation = 0;
+    
+    function loadMore() {
+        if (loading || done) {
+            return;
+        }
+        loading = true;
+        const current = generation;
+        const query = new URLSearchParams(params);
+        query.set('limit', ADMIN_PAGE_SIZE);
+        if (cursor !== null) {
+            query.set(options.cursorParam, cursor);
+        }
+        options.sentinel.textContent = 'Loading...';
+        
+        fetch(`${options.url}?${query}`)
+            .then(response => response.json())
+            .then(data => {
+                if (current !== generation) {
+                    return;
+                }
+                if (!data.success) {
+                    throw new Error(data.message || data.error);
+                }
+                const rows = data[options.key];
+                if (cursor === null && rows.length === 0) {
+                    options.container.innerHTML = options.empty;
+                } else {
+                    options.container.insertAdjacentHTML('beforeend', rows.map(options.render).join(''));
+                }
+                cursor = options.cursor(data);
+                done = cursor === null || cursor === undefined;
+                options.sentinel.textContent = done ? '' : 'Scroll for more';
+            })
+            .catch(error => {
+                console.error(`Error loading ${options.key}:`, error);
+                options.sentinel.textContent = 'Could not load more';
+                done = true;
+            })
+            .finally(() => {
+                if (current === generation) {
+                    loading = false;
+                    // A short first page may leave the sentinel visible; keep filling
+                    if (!done && isVisible(options.sentinel)) {
+                        loadMore();
+                    }
+                }
+            });
+    }
+    
+    function reset(newParams) {
+        generation++;
+        params = newParams || new URLSearchParams();
+        cursor = null;
+        loading = false;
+        done = false;
+        options.container.innerHTML = '';
+        loadMore();
+    }
+    
+    new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMore();
+        }
+    }, { root: options.sentinel.parentElement }).observe(options.sentinel);
+    
+    return { reset: reset, loadMore: loadMore };
+}
+
+function isVisible(element) {
+    const rect = element.getBoundingClientRect();
+    const rootRect = element.parentElement.getBoundingClientRect();
+    return rect.top < rootRect.bottom && rect.bottom > rootRect.top;
+}
+
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value === null || value === undefined ? '' : String(value);
+    return div.innerHTML;
+}
+
+function renderBookingRow(booking) {
+    const badge = booking.spot_status === 'reserved' ? 'warning' : 'primary';
+    const spot = `<td><span class="badge bg-${badge}">${escapeHtml(booking.spot_label)}</span></td>`;
+    if (booking.booking_id === null) {
+        return `<tr>${spot}<td colspan="5" class="text-muted">Walk-in, no booking</td></tr>`;
+    }
+    return `
+        <tr>
+            ${spot}
+            <td>${escapeHtml(booking.user_name)}</td>
+            <td>${escapeHtml(booking.user_phone)}</td>
+            <td>${escapeHtml(booking.car_type)}</td>
+            <td>${escapeHtml((booking.arrival_time || '').slice(11))}</td>
+            <td>${escapeHtml(booking.duration)}h</td>
+        </tr>`;
+}
+
+function renderLogRow(log) {
+    const badge = log.action === 'booked' ? 'success' : log.action === 'cancelled' ? 'danger' : 'info';
+    return `
+        <tr>
+            <td class="small">${escapeHtml(log.timestamp)}</td>
+            <td><span class="badge bg-secondary">${escapeHtml(log.spot_label)}</span></td>
+            <td><span class="badge bg-${badge}">${escapeHtml(log.action)}</span></td>
+            <td>${escapeHtml(log.user_name || 'System')}</td>
+        </tr>`;
+}
+
+function renderFeedback(fb) {
+    const stars = '<i class="fas fa-star text-warning"></i>'.repeat(fb.rating) +
+                  '<i class="far fa-star text-warning"></i>'.repeat(Math.max(0, 5 - fb.rating));
+    return `
+        <div class="col-md-6 mb-3">
+            <div class="feedback-item p-3 border rounded">
+                <div class="d-flex justify-content-between">
+                    <strong>${escapeHtml(fb.user_name)}</strong>
+                    <div class="star-display">${stars}</div>
+                </div>
+                <p class="text-muted small mb-2">${escapeHtml(fb.timestamp)}</p>
+                <p class="mb-0">${escapeHtml(fb.comment || 'No comment provided')}</p>
+            </div>
+        </div>`;
+}
+
 // Initialize charts
 function initCharts() {
     // Occupancy Trends Chart
@@ -132,26 +316,17 @@ function updateOccupancyChart(trends) {
 }
 
 // Update stats in real-time
-function updateStats() {
-    fetch('/api/spots')
-        .then(response => response.json())
-        .then(data => {
-            document.getElementById('admin-available').textContent = data.stats.available;
-            document.getElementById('admin-occupied').textContent = data.stats.occupied;
-            document.getElementById('admin-reserved').textContent = data.stats.reserved;
-        })
-        .catch(error => {
-            console.error('Error updating stats:', error);
-        });
+function updateStats(stats) {
+    document.getElementById('admin-available').textContent = stats.available;
+    document.getElementById('admin-occupied').textContent = stats.occupied;
+    document.getElementById('admin-reserved').textContent = stats.reserved;
 }
 
-// Export data functions (optional)
+// Export data as CSV; the server streams it a page at a time
 function exportBookingsCSV() {
-    // Placeholder for CSV export functionality
-    alert('Export functionality coming soon!');
+    window.location = '/admin/export/bookings.csv';
 }
 
 function exportLogsCSV() {
-    // Placeholder for CSV export functionality
-    alert('Export functionality coming soon!');
+    window.location = '/admin/export/logs.csv';
 }
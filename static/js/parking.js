@@ -5,6 +5,10 @@ let currentRating = 0;
 let allSpots = [];
 let currentFilter = 'all';
 let searchTerm = '';
+let plannedWindow = null;       // {start, hours} chosen on the page, null for "now"
+let windowFree = null;          // spot labels free for the whole planned window
+let windowFetchedAt = 0;
+let spotWatch = null;            // live spot state from watchSpots()
 let isFirstVisit = !localStorage.getItem('parkease_visited');
 
 // Initialize modals on page load
@@ -16,16 +20,22 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize star rating
     initStarRating();
     
-    // Load parking spots
-    loadParkingSpots();
-    
-    // Auto-refresh every 3 seconds
-    setInterval(loadParkingSpots, 3000);
+    // Live updates over Server-Sent Events, polling every 3 seconds if unavailable
+    spotWatch = watchSpots(data => {
+        allSpots = data.spots;
+        updateStats(data.stats);
+        renderParkingDiagram(filterSpotsList(allSpots));
+        // Spots taken right now also change what is free for a window starting soon
+        if (plannedWindow && Date.now() - windowFetchedAt > 5000) {
+            loadWindowAvailability();
+        }
+    }, 3000);
     
     // Set minimum arrival time to now
     const now = new Date();
     now.setMinutes(now.getMinutes() - now.getTimezoneOffset());
     document.getElementById('arrival_time').min = now.toISOString().slice(0, 16);
+    document.getElementById('windowStart').min = now.toISOString().slice(0, 16);
     
     // Show tutorial for first-time visitors
     if (isFirstVisit) {
@@ -33,9 +43,8 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
-// Load and display parking spots
-function loadParkingSpots() {
-    // Animate refresh button
+// Refresh button: redraw from the live spot state, polling now if the stream is down
+function refreshParkingSpots() {
     const refreshBtn = document.getElementById('refresh-btn');
     if (refreshBtn) {
         const icon = refreshBtn.querySelector('i');
@@ -45,16 +54,7 @@ function loadParkingSpots() {
         }, 1000);
     }
     
-    fetch('/api/spots')
-        .then(response => response.json())
-        .then(data => {
-            allSpots = data.spots;
-            updateStats(data.stats);
-            renderParkingDiagram(filterSpotsList(data.spots));
-        })
-        .catch(error => {
-            console.error('Error loading spots:', error);
-        });
+    spotWatch.refresh();
 }
 
 // Add spin animation for refresh button
@@ -67,13 +67,95 @@ spinStyle.textContent = `
 `;
 document.head.appendChild(spinStyle);
 
+// datetime-local inputs have no time zone: send the server UTC, show the browser's local time
+function toServerTime(localValue) {
+    return new Date(localValue).toISOString();
+}
+
+function toLocalInput(date) {
+    const local = new Date(date);
+    local.setMinutes(local.getMinutes() - local.getTimezoneOffset());
+    return local.toISOString().slice(0, 16);
+}
+
+// Status shown for a spot: live, or free/reserved for the planned window
+function spotStatus(spot) {
+    if (!plannedWindow || !windowFree) {
+        return spot.status;
+    }
+    return windowFree.has(spot.spot_label) ? 'available' : 'reserved';
+}
+
+// Show which spots are free for the window picked on the page
+function setPlannedWindow() {
+    const start = document.getElementById('windowStart').value;
+    const hours = parseInt(document.getElementById('windowHours').value) || 1;
+    if (!start) {
+        clearPlannedWindow();
+        return;
+    }
+    plannedWindow = { start: start, hours: hours };
+    loadWindowAvailability();
+}
+
+function clearPlannedWindow() {
+    plannedWindow = null;
+    windowFree = null;
+    document.getElementById('windowStart').value = '';
+    document.getElementById('window-summary').textContent = '';
+    renderParkingDiagram(filterSpotsList(allSpots));
+}
+
+function loadWindowAvailability() {
+    const requested = plannedWindow;
+    windowFetchedAt = Date.now();
+    fetch(`/api/availability?start=${encodeURIComponent(toServerTime(requested.start))}&hours=${requested.hours}`)
+        .then(response => response.json())
+        .then(data => {
+            if (plannedWindow !== requested) {
+                return;
+            }
+            if (!data.available) {
+                showNotification('Error', data.message, 'danger');
+                return;
+            }
+            windowFree = new Set(data.available);
+            document.getElementById('window-summary').textContent =
+                `${data.count} free ${toLocalInput(data.start).replace('T', ' ')} – ${toLocalInput(data.end).slice(11)}`;
+            renderParkingDiagram(filterSpotsList(allSpots));
+        })
+        .catch(error => {
+            console.error('Error loading availability:', error);
+        });
+}
+
+// Jump the planned window to the earliest time any spot is free for that long
+function findEarliestSlot() {
+    const hours = parseInt(document.getElementById('windowHours').value) || 1;
+    const start = document.getElementById('windowStart').value;
+    const query = start ? `&start=${encodeURIComponent(toServerTime(start))}` : '';
+    fetch(`/api/availability/earliest?hours=${hours}${query}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.available) {
+                showNotification('No Slots', data.message, 'info');
+                return;
+            }
+            document.getElementById('windowStart').value = toLocalInput(data.start);
+            setPlannedWindow();
+        })
+        .catch(error => {
+            console.error('Error finding a slot:', error);
+        });
+}
+
 // Filter spots based on search and filter
 function filterSpotsList(spots) {
     let filtered = spots;
     
     // Apply status filter
     if (currentFilter !== 'all') {
-        filtered = filtered.filter(spot => spot.status === currentFilter);
+        filtered = filtered.filter(spot => spotStatus(spot) === currentFilter);
     }
     
     // Apply search term
@@ -227,8 +309,9 @@ function renderParkingDiagram(spots) {
         columnDiv.className = 'parking-column';
         
         columns[col].forEach(spot => {
+            const status = spotStatus(spot);
             const spotDiv = document.createElement('div');
-            spotDiv.className = `parking-spot ${spot.status}`;
+            spotDiv.className = `parking-spot ${status}`;
             spotDiv.style.position = 'relative';
             spotDiv.style.animationDelay = `${delayIndex * 0.03}s`;
             delayIndex++;
@@ -236,8 +319,9 @@ function renderParkingDiagram(spots) {
             // Add tooltip
             const tooltip = document.createElement('div');
             tooltip.className = 'spot-tooltip';
-            const statusEmoji = spot.status === 'available' ? '✅' : spot.status === 'reserved' ? '🔒' : '🚗';
-            tooltip.innerHTML = `${statusEmoji} Spot ${spot.spot_label}<br><small>${spot.status.toUpperCase()}</small>`;
+            const statusEmoji = status === 'available' ? '✅' : status === 'reserved' ? '🔒' : '🚗';
+            const statusText = plannedWindow && status === 'reserved' ? 'BOOKED FOR THIS TIME' : status.toUpperCase();
+            tooltip.innerHTML = `${statusEmoji} Spot ${spot.spot_label}<br><small>${statusText}</small>`;
             spotDiv.appendChild(tooltip);
             
             // Add favorite icon
@@ -259,9 +343,9 @@ function renderParkingDiagram(spots) {
             spotDiv.appendChild(labelSpan);
             
             spotDiv.dataset.spot = spot.spot_label;
-            spotDiv.dataset.status = spot.status;
+            spotDiv.dataset.status = status;
             
-            if (spot.status === 'available') {
+            if (status === 'available') {
                 spotDiv.onclick = (e) => {
                     createRipple(e, spotDiv);
                     setTimeout(() => openBookingModal(spot.spot_label), 300);
@@ -300,10 +384,15 @@ function openBookingModal(spotLabel) {
     document.getElementById('selected-spot').textContent = spotLabel;
     document.getElementById('bookingForm').reset();
     
-    // Set default arrival time to current time
-    const now = new Date();
-    now.setMinutes(now.getMinutes() - now.getTimezoneOffset());
-    document.getElementById('arrival_time').value = now.toISOString().slice(0, 16);
+    // Default to the planned window, otherwise arriving now
+    if (plannedWindow) {
+        document.getElementById('arrival_time').value = plannedWindow.start;
+        document.getElementById('duration').value = plannedWindow.hours;
+    } else {
+        const now = new Date();
+        now.setMinutes(now.getMinutes() - now.getTimezoneOffset());
+        document.getElementById('arrival_time').value = now.toISOString().slice(0, 16);
+    }
     
     bookingModal.show();
 }
@@ -323,7 +412,7 @@ function confirmBooking() {
         user_phone: document.getElementById('user_phone').value,
         user_email: document.getElementById('user_email').value,
         car_type: document.getElementById('car_type').value,
-        arrival_time: document.getElementById('arrival_time').value,
+        arrival_time: toServerTime(document.getElementById('arrival_time').value),
         duration: document.getElementById('duration').value
     };
     
@@ -340,7 +429,11 @@ function confirmBooking() {
             bookingModal.hide();
             celebrateBooking();
             showNotification('🎉 Success!', 'Your parking spot has been reserved!', 'success');
-            loadParkingSpots();
+            // The stream brings the reservation; without it, poll for it now
+            spotWatch.refresh();
+            if (plannedWindow) {
+                loadWindowAvailability();
+            }
         } else {
             showNotification('Error', data.message, 'danger');
         }
@@ -384,7 +477,7 @@ function joinWaitlist() {
     .then(data => {
         if (data.success) {
             waitlistModal.hide();
-            showNotification('Added to Waitlist', "We'll notify you when a spot becomes available!", 'info');
+            showNotification('Added to Waitlist', "The next free spot will be reserved for you - we'll email you the details!", 'info');
         } else {
             showNotification('Error', data.message, 'danger');
         }
@@ -0,0 +1,141 @@
+// Live spot status over Server-Sent Events, falling back to polling /api/spots/status
+
+// Status codes of /api/spots/status, two bits per spot
+const SPOT_STATUS_NAMES = ['available', 'occupied', 'reserved', 'unknown'];
+
+// How long to poll before reopening a stream the server turned away
+const STREAM_RETRY_DELAY = 30000;
+
+// Calls onUpdate({spots, stats, changes}) with the full spot list after the
+// first snapshot and after every batch of changes (changes is null for a
+// full snapshot). Polls every pollInterval ms while the stream is unavailable.
+// Returns {refresh()}, which re-polls now unless the stream is live (then the
+// current state is already the newest and is just published again).
+function watchSpots(onUpdate, pollInterval) {
+    let spots = [];
+    let version = null;
+    let pollTimer = null;
+    let streaming = false;
+
+    function publish(changes) {
+        const stats = { total: spots.length, available: 0, occupied: 0, reserved: 0 };
+        spots.forEach(spot => {
+            if (spot.status in stats) {
+                stats[spot.status]++;
+            }
+        });
+        onUpdate({ spots: spots, stats: stats, changes: changes });
+    }
+
+    // Apply changed spots in place and return the changes
+    function applyChanges(changes) {
+        changes.forEach(change => {
+            const spot = spots.find(s => s.spot_label === change.spot_label);
+            if (spot) {
+                spot.status = change.status;
+            }
+        });
+        return changes;
+    }
+
+    // Polling uses the compact status endpoint; geometry comes from the cacheable layout
+    let layout = null;
+
+    function unpackStatuses(states, count) {
+        const bytes = atob(states);
+        const statuses = [];
+        for (let i = 0; i < count; i++) {
+            const code = (bytes.charCodeAt(i >> 2) >> ((i & 3) * 2)) & 3;
+            statuses.push(SPOT_STATUS_NAMES[code]);
+        }
+        return statuses;
+    }
+
+    function loadLayout(layoutVersion) {
+        return fetch(`/api/spots/layout?v=${layoutVersion}`)
+            .then(response => response.json())
+            .then(data => {
+                layout = data;
+            });
+    }
+
+    function poll() {
+        fetch('/api/spots/status')
+            .then(response => response.json())
+            .then(data => {
+                const ready = layout && layout.layout_version === data.layout_version
+                    ? Promise.resolve()
+                    : loadLayout(data.layout_version);
+                return ready.then(() => {
+                    // A snapshot from the stream may have arrived meanwhile and is newer
+                    if (streaming || (data.version === version && spots.length)) {
+                        return;
+                    }
+                    version = data.version;
+                    const statuses = unpackStatuses(data.states, layout.spots.length);
+                    spots = layout.spots.map((spot, i) => Object.assign({}, spot, { status: statuses[i] }));
+                    publish(null);
+                });
+            })
+            .catch(error => {
+                console.error('Error loading spots:', error);
+            });
+    }
+
+    function startPolling() {
+        if (!pollTimer) {
+            poll();
+            pollTimer = setInterval(poll, pollInterval);
+        }
+    }
+
+    function stopPolling() {
+        clearInterval(pollTimer);
+        pollTimer = null;
+    }
+
+    function refresh() {
+        if (streaming) {
+            publish(null);
+        } else {
+            poll();
+        }
+    }
+
+    if (!window.EventSource) {
+        startPolling();
+        return { refresh: refresh };
+    }
+
+    function connect() {
+        const source = new EventSource('/api/spots/stream');
+
+        source.addEventListener('snapshot', event => {
+            streaming = true;
+            stopPolling();
+            const data = JSON.parse(event.data);
+            version = data.version;
+            spots = data.spots;
+            publish(null);
+        });
+
+        source.addEventListener('spots', event => {
+            const changes = JSON.parse(event.data);
+            version = changes[changes.length - 1].version;
+            publish(applyChanges(changes));
+        });
+
+        // The browser keeps reconnecting on its own; poll until a new snapshot arrives.
+        // It gives up when the server is full (503), so try the stream again later.
+        source.onerror = () => {
+            streaming = false;
+            startPolling();
+            if (source.readyState === EventSource.CLOSED) {
+                setTimeout(connect, STREAM_RETRY_DELAY);
+            }
+        };
+    }
+
+    connect();
+    return { refresh: refresh };
+}
@@ -0,0 +1,216 @@
+"""
+PARKEASE waitlist matching
+Everyone waiting sits in one in-memory priority queue, ordered by when they
+joined (spots have no car type, so any spot suits anyone). Whenever a spot
+becomes available (a cancellation, an expired booking, or the detector seeing
+a car leave) the head of the queue is booked into it in one transaction, for
+as long as the spot is free up to its next booking.
+
+The queues are rebuilt from the waitlist table at startup. Spot changes
+arrive through the process-wide SpotView, so changes written by the
+detector process are matched too.
+"""
+import heapq
+import threading
+import time
+
+from database import (
+    SpotUnavailableError, SpotBookedAheadError, get_waiting_entries, assign_waitlist_spot
+)
+from spot_cache import get_spot_view
+
+WAITLIST_BOOKING_HOURS = 2      # duration of a booking made from the waitlist
+
+
+class WaitlistQueue:
+    """Waiting users in one heap keyed by (requested_time, waitlist_id)
+
+    Removing an entry only forgets its id; stale heap entries are dropped
+    when they reach the top.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._car_types = {}
+
+    def __len__(self):
+        return len(self._car_types)
+
+    def push(self, waitlist_id, car_type, requested_time):
+        if waitlist_id in self._car_types:
+            return
+        self._car_types[waitlist_id] = car_type
+        heapq.heappush(self._heap, (requested_time, waitlist_id))
+
+    def load(self, entries):
+        """Replace the contents with (waitlist_id, car_type, requested_time) entries"""
+        self._car_types = {}
+        self._heap = []
+        for waitlist_id, car_type, requested_time in entries:
+            self._car_types[waitlist_id] = car_type
+            self._heap.append((requested_time, waitlist_id))
+        heapq.heapify(self._heap)
+
+    def remove(self, waitlist_id):
+        self._car_types.pop(waitlist_id, None)
+
+    def peek(self):
+        """Earliest waiting entry as (requested_time, waitlist_id, car_type), or None"""
+        heap = self._heap
+        while heap and heap[0][1] not in self._car_types:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return heap[0] + (self._car_types[heap[0][1]],)
+
+    def sizes(self):
+        """Waiting entries per car type"""
+        sizes = {}
+        for car_type in self._car_types.values():
+            sizes[car_type] = sizes.get(car_type, 0) + 1
+        return sizes
+
+
+class WaitlistMatcher(threading.Thread):
+    """Books spots for waiting users as soon as they become available
+
+    on_assigned(booking) runs after each successful assignment, e.g. to
+    schedule the booking's deadlines and email the user.
+    """
+
+    def __init__(self, on_assigned=None, view=None):
+        super().__init__(daemon=True, name='waitlist-matcher')
+        self.on_assigned = on_assigned
+        self.view = view
+        self.queue = WaitlistQueue()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.assigned = 0
+        self.events = 0
+        self.errors = 0
+        self.booked_ahead = 0
+        self.match_time = 0.0
+
+    def rebuild(self):
+        """Load everyone still waiting from the database"""
+        entries = get_waiting_entries()
+        with self._lock:
+            self.queue.load(entries)
+        return len(entries)
+
+    def add(self, waitlist_id, car_type, requested_time):
+        """Queue someone who just joined the waitlist"""
+        with self._lock:
+            self.queue.push(waitlist_id, car_type, requested_time)
+
+    def match(self, spot_label):
+        """Book an available spot for the earliest waiting user; returns the booking or None"""
+        started = time.perf_counter()
+        booking = None
+        while True:
+            with self._lock:
+                head = self.queue.peek()
+            if head is None:
+                break
+            _, waitlist_id, _ = head
+            try:
+                booking = assign_waitlist_spot(waitlist_id, spot_label, WAITLIST_BOOKING_HOURS)
+            except SpotBookedAheadError:
+                # Free now, but not for long enough before its next booking; the
+                # same holds for everyone waiting, so keep the queue for another spot
+                with self._lock:
+                    self.booked_ahead += 1
+                break
+            except SpotUnavailableError:
+                # Someone else got the spot first; the user keeps their place
+                break
+            with self._lock:
+                self.queue.remove(waitlist_id)
+            if booking is not None:
+                break
+            # No longer waiting (assigned elsewhere or removed): try the next user
+        with self._lock:
+            self.events += 1
+            self.match_time += time.perf_counter() - started
+            if booking is not None:
+                self.assigned += 1
+        if booking is not None and self.on_assigned is not None:
+            try:
+                self.on_assigned(booking)
+            except Exception as e:
+                print(f"Waitlist assignment callback error: {e}")
+        return booking
+
+    def match_available(self):
+        """Offer every currently available spot to the queue"""
+        for spot in self.view.snapshot()['spots']:
+            if spot['status'] != 'available':
+                continue
+            with self._lock:
+                if not len(self.queue):
+                    return
+            self.match(spot['spot_label'])
+
+    def stop(self):
+        self._stopping.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'waiting': len(self.queue),
+                'by_car_type': self.queue.sizes(),
+                'assigned': self.assigned,
+                'events': self.events,
+                'errors': self.errors,
+                'booked_ahead': self.booked_ahead,
+                'avg_match_ms': round(self.match_time / self.events * 1000, 3) if self.events else 0.0,
+            }
+
+    def run(self):
+        subscription = self.view.subscribe()
+        # Spots that were already free when the process started
+        rescan = True
+        try:
+            while not self._stopping.is_set():
+                try:
+                    if rescan:
+                        rescan = False
+                        self.match_available()
+                    changes = subscription.get(timeout=15.0)
+                    if changes is None:
+                        # Fell behind the change stream; look at every spot instead
+                        rescan = True
+                        continue
+                    for change in changes:
+                        if change['status'] == 'available':
+                            self.match(change['spot_label'])
+                except Exception as e:
+                    # e.g. the database was locked or the pool timed out: keep running and
+                    # offer every free spot again, so the spots of this batch are not lost
+                    print(f"Waitlist matcher error: {e}")
+                    with self._lock:
+                        self.errors += 1
+                    rescan = True
+                    self._stopping.wait(1.0)
+        finally:
+            subscription.close()
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def start_waitlist_matcher(on_assigned=None):
+    """Rebuild the queues from the database and start the process-wide matcher"""
+    global _matcher
+    with _matcher_lock:
+        if _matcher is None or not _matcher.is_alive():
+            _matcher = WaitlistMatcher(on_assigned, view=get_spot_view())
+            _matcher.rebuild()
+            _matcher.start()
+        return _matcher
+
+
+def get_waitlist_matcher():
+    """The running matcher, or None before start_waitlist_matcher()"""
+    return _matcher